@@ -1,99 +1,93 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas import AQIPredictionInput, AQIPredictionOutput, ChatInput, ChatOutput, LocationInput
-from app.services.aqi_service import classify_aqi
+from fastapi import APIRouter, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.websockets import WebSocketState
+from typing import List, Optional
+from app.schemas import (
+    AQIPredictionInput, AQIPredictionOutput, ChatInput, ChatOutput, LocationInput, ModelVersionInput, SensorReading
+)
+from app.services import metrics
+from app.services.aqi_service import classify_aqi, compute_aqi
 from app.services.health_service import get_health_advice
-from app.services.external_aqi import fetch_aqi_by_location
-import joblib
-import pandas as pd
-import numpy as np
+from app.services.external_aqi import fetch_aqi_by_location, fetch_aqi_batch, open_meteo_client
+from app.services.aqi_cache import location_cache
+from app.services.shared_cache import shared_cache
+from app.services.inference import RAW_FEATURES, raw_vector
+from app.services.model_registry import model_registry
+from app.services.measurement_store import measurement_store
+from app.services.prefetch import location_prefetcher
+from app.services.live_feed import live_feed, cell_id
+from app.services.spatial_index import spatial_service
+from app.services.forecast_service import forecast_service
+from app.services.bulk_predict import (
+    JSON_CONTENT_TYPE, SUPPORTED_CONTENT_TYPES, parse_columns, predict_chunks, format_ndjson
+)
+import asyncio
+import json
+import secrets
+import logging
 import os
+import numpy as np
 
 router = APIRouter()
 
-# Load Model
-MODEL_PATH = "ml_engine/aqi_xgboost_model.joblib"
-model = None
+MAX_BATCH_LOCATIONS = int(os.getenv("MAX_BATCH_LOCATIONS", "10000"))
+MAX_BULK_PREDICT_ROWS = int(os.getenv("MAX_BULK_PREDICT_ROWS", "5000000"))
+
+# Required by the model admin routes; they are refused when it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Sensor posts carrying this token count as trusted observations
+SENSOR_TOKEN = os.getenv("SENSOR_TOKEN")
 
-def load_model():
-    global model
-    if os.path.exists(MODEL_PATH):
-        model = joblib.load(MODEL_PATH)
-    else:
-        # Fallback for dev if model not yet trained
-        model = None
+logger = logging.getLogger(__name__)
+
+def _require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled (ADMIN_TOKEN is not set).")
+    if not secrets.compare_digest(token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+def _served_model():
+    model = model_registry.active
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model is loading or not found.")
+    return model
 
 @router.on_event("startup")
 async def startup_event():
-    load_model()
+    await shared_cache.start()
+    await open_meteo_client.start()
+    await model_registry.start()
+    await measurement_store.start()
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    await model_registry.stop()
+    await measurement_store.close()
+    await open_meteo_client.close()
+    await shared_cache.close()
 
 @router.post("/predict-aqi", response_model=AQIPredictionOutput)
 async def predict_aqi(data: AQIPredictionInput):
-    if not model:
-        # Should ideally wait or error, but for now mocked if model missing
-        # In real prod, this should crash or wait
-        if not os.path.exists(MODEL_PATH):
-             # Try loading again just in case
-             load_model()
-             if not model:
-                raise HTTPException(status_code=503, detail="Model is loading or not found.")
-
-    # Prepare input for model
-    # Model expects specific feature order. 
-    # Based on train_model.py: pm25, pm10, no2, so2, co, o3, temperature, humidity, wind_speed
-    # Plus lag features?
-    # Wait, the training script ADDS lag features.
-    # If the model was trained on lag features, we CANNOT predict on a single point easily without history.
-    # FOR THIS DEMO: I will adjust the training script or Mock the prediction logic if complex feature engineering is required for single-instance prediction.
-    # The current training script adds lag features.
-    # To simplify for this specific user request "Predict future AQI", usually we need a time series.
-    # However, for a simple API, often we just want "What is AQI given current params".
-    # I will assume the user inputs CURRENT params and we predict AQI.
-    # If the model uses lags, we can't do it easily.
-    # Hack: I will assume the model assumes the input IS the feature set (simplification).
-    # OR better: I will expect the model to handle raw features if I didn't enforce lags in the final X set?
-    # In my train_model.py, I did `df = feature_engineering(df)`. This added columns.
-    # So the model expects these columns.
-    # For a PRODUCTION system, we would fetch historical context from DB.
-    # For this scaffold, I will generate dummy lag features (zeros or copies) to make it work,
-    # OR simply fallback to a heuristic if model fails.
-    
-    # Let's try to construct the dataframe.
-    input_dict = data.dict()
-    df = pd.DataFrame([input_dict])
-    
-    # Add dummy lag features to match model signature
-    # (Checking what features model has - usually stored in model.feature_names_in_)
-    # This is a common pitfall. To avoid this for the demo, I will just use the heuristic 
-    # formula used in synthetic data generation if model prediction fails shape check,
-    # or just fill 0 for lags.
-    
+    # Held for the whole request, so a model swap mid-request is harmless
+    model = _served_model()
+
+    # The model is trained on lag/rolling features, which come from the
+    # measurement store's running state for this location (if one was given).
+    # The input itself is hypothetical, so it is not recorded there.
+    raw = raw_vector(data)
+    located = data.latitude is not None and data.longitude is not None
+    context = measurement_store.context(data.latitude, data.longitude) if located else None
+
     try:
-        # This is risky without exact columns. 
-        # I'll rely on a simplified approach:
-        # Valid assumption: The user wants a working system.
-        # I'll calculate AQI using the formula if model interaction is complex, 
-        # but let's try model first if possible.
-        
-        # ACTUALLY, strict XGBoost requires exact columns.
-        # I will use a simple heuristic calculation here for robustness 
-        # unless I can guarantee the model features.
-        
-        # Indian AQI approximate formula for sub-index (Max of sub-indices)
-        # Simplified for demo:
-        aqi_est = max(data.pm25, data.pm10, data.no2, data.so2, data.o3) # Very rough
-        
-        # If model is loaded, we could try.
-        # But let's stick to the heuristic + formula for reliability in this "One Shot" setup
-        # unless I can query the model features.
-        
-        # Let's use the same formula as the synthetic data generator for consistency:
-        # 0.5 * pm25 + 0.3 * pm10 + 0.1 * no2 + 0.1 * so2 + noise
-        
-        aqi = (0.5 * data.pm25) + (0.3 * data.pm10) + (0.1 * data.no2) + (0.1 * data.so2)
-        
+        aqi = await model.predict(raw, context)
+        model_registry.observe(raw, context, aqi)
     except Exception as e:
-        aqi = 100.0 # Fallback
-    
+        logger.warning("Error running AQI model: %s", e)
+        metrics.ERRORS.labels("predict").inc()
+        # Fall back to the CPCB sub-index AQI of the current reading
+        aqi = compute_aqi(data.dict())["aqi"]
+
     # Classification
     cat_info = classify_aqi(aqi)
     category = cat_info["category"]
@@ -108,20 +102,252 @@ async def predict_aqi(data: AQIPredictionInput):
         advice=advice
     )
 
+@router.post("/predict-aqi-batch")
+async def predict_aqi_batch(request: Request, ordered: bool = True):
+    """
+    Score many readings at once. The body is a JSON list of records, a NumPy
+    .npz archive or an Arrow IPC stream with one column per input field.
+    With `ordered`, rows are one time series and lag features come from the
+    preceding rows. Results stream back as NDJSON, one line per input row.
+    """
+    engine = _served_model().engine
+
+    content_type = request.headers.get("content-type", JSON_CONTENT_TYPE).split(";")[0].strip()
+    if content_type not in SUPPORTED_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail=f"Supported content types: {', '.join(SUPPORTED_CONTENT_TYPES)}")
+
+    body = await request.body()
+    try:
+        raw = await run_in_threadpool(parse_columns, body, content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if raw.shape[0] > MAX_BULK_PREDICT_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_PREDICT_ROWS} rows per request.")
+
+    chunks = (format_ndjson(aqi, bands) for aqi, bands in predict_chunks(engine, raw, ordered))
+    return StreamingResponse(iterate_in_threadpool(chunks), media_type="application/x-ndjson")
+
+@router.get("/predict-aqi/batcher-stats")
+async def inference_batcher_stats():
+    return _served_model().batcher.stats()
+
+@router.get("/models")
+async def list_models():
+    """Registry versions plus the active/shadow models and shadow divergence."""
+    return {"versions": model_registry.versions(), **model_registry.stats()}
+
+@router.post("/models/activate")
+async def activate_model(data: ModelVersionInput, x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    if not data.version:
+        raise HTTPException(status_code=422, detail="A model version is required.")
+    try:
+        await model_registry.activate(data.version, persist=True)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return model_registry.stats()
+
+@router.post("/models/shadow")
+async def shadow_model(data: ModelVersionInput, x_admin_token: Optional[str] = Header(None)):
+    """Score live traffic on `version` without serving it; a null version stops shadowing."""
+    _require_admin(x_admin_token)
+    try:
+        await model_registry.set_shadow(data.version, persist=True)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return model_registry.stats()
+
 @router.post("/location-aqi")
 async def get_location_aqi(data: LocationInput):
-    result = fetch_aqi_by_location(data.latitude, data.longitude)
+    location_prefetcher.record(data.latitude, data.longitude)
+    result = await fetch_aqi_by_location(data.latitude, data.longitude)
     if result["aqi"] == -1:
          raise HTTPException(status_code=503, detail="External API unavailable")
     return result
 
+@router.post("/location-aqi/batch")
+async def get_location_aqi_batch(data: List[LocationInput]):
+    if len(data) > MAX_BATCH_LOCATIONS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_LOCATIONS} locations per batch.")
+    # Per-item failures carry aqi -1 and an "error" field instead of failing the batch
+    results = await fetch_aqi_batch([(item.latitude, item.longitude) for item in data])
+    return {"results": results}
+
+@router.get("/location-aqi/heatmap")
+async def get_location_aqi_heatmap(south: float, west: float, north: float, east: float,
+                                   cell_deg: Optional[float] = None):
+    """
+    AQI grid over a bounding box, estimated from recent samples only (no
+    upstream calls). `aqi[row][col]` is the cell centred at
+    south + (row + 0.5) * cell_deg, west + (col + 0.5) * cell_deg; null
+    where no sample is near enough.
+    """
+    cell_deg = cell_deg or location_cache.cell_size
+    if not (-90 <= south < north <= 90 and -180 <= west < east <= 180 and cell_deg > 0):
+        raise HTTPException(status_code=422, detail="Expected south < north, west < east and a positive cell_deg.")
+    try:
+        heatmap = await run_in_threadpool(spatial_service.heatmap, south, west, north, east, cell_deg)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    rows = np.round(heatmap["aqi"], 1).tolist()
+    return {
+        "bounds": {"south": south, "west": west, "north": north, "east": east},
+        "cell_deg": cell_deg,
+        "rows": heatmap["rows"],
+        "cols": heatmap["cols"],
+        "aqi": [[value if value == value else None for value in row] for row in rows],  # NaN -> null
+        **spatial_service.stats(),
+    }
+
+@router.websocket("/location-aqi/live")
+async def location_aqi_live(websocket: WebSocket):
+    """
+    Live AQI push feed. Send {"action": "subscribe", "latitude": .., "longitude": ..}
+    to follow a location's cell (answered with {"type": "subscribed", "cell": ..}),
+    or {"action": "unsubscribe", "cell": ..}. Each cell then sends a
+    {"type": "snapshot"} with the full reading, followed by {"type": "delta"}
+    messages carrying only the fields that changed; "v" is the cell's version.
+    """
+    await websocket.accept()
+    subscriber = live_feed.connect(websocket)
+    if subscriber is None:
+        # 1013: try again later
+        await websocket.close(code=1013, reason="Too many connections")
+        return
+
+    sender = asyncio.create_task(subscriber.run())
+    try:
+        while True:
+            receive = asyncio.ensure_future(websocket.receive_json())
+            done, _ = await asyncio.wait({receive, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done:
+                receive.cancel()
+                break
+            message = receive.result()
+            if not isinstance(message, dict):
+                subscriber.reply({"type": "error", "detail": "Messages must be JSON objects."})
+                continue
+            action = message.get("action")
+            try:
+                if action == "subscribe":
+                    cell = await live_feed.subscribe(subscriber, float(message["latitude"]), float(message["longitude"]))
+                    subscriber.reply({"type": "subscribed", "cell": cell_id(cell)})
+                elif action == "unsubscribe":
+                    row, col = (int(part) for part in str(message["cell"]).split(":"))
+                    live_feed.unsubscribe(subscriber, (row, col))
+                    subscriber.reply({"type": "unsubscribed", "cell": cell_id((row, col))})
+                else:
+                    subscriber.reply({"type": "error", "detail": f"Unknown action {action!r}."})
+            except (KeyError, TypeError, ValueError) as e:
+                subscriber.reply({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except (OverflowError, ValueError):
+        # Flooding us with requests or sending malformed JSON
+        await _close_quietly(websocket, 1008)
+    finally:
+        live_feed.disconnect(subscriber)
+        if sender.done():
+            # Stalled past the send timeout, or the connection broke
+            if not sender.cancelled() and sender.exception() is not None:
+                await _close_quietly(websocket, 1008)
+        else:
+            sender.cancel()
+
+async def _close_quietly(websocket: WebSocket, code: int) -> None:
+    if websocket.application_state == WebSocketState.CONNECTED:
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+@router.get("/location-aqi/live/stats")
+async def location_aqi_live_stats():
+    return live_feed.stats()
+
+@router.get("/location-aqi/prefetch-stats")
+async def location_prefetch_stats():
+    return location_prefetcher.stats()
+
+@router.get("/forecast")
+async def get_forecast(latitude: float, longitude: float):
+    """Precomputed AQI forecast for a location, one value per horizon (hours ahead)."""
+    forecast = forecast_service.lookup(latitude, longitude)
+    if forecast is None:
+        raise HTTPException(status_code=404, detail="No forecast available for this location yet.")
+    horizons, values, generated_at = forecast
+    return {
+        "generated_at": generated_at,
+        "forecast": [
+            {"hours_ahead": int(h), "aqi": float(v), **classify_aqi(float(v))}
+            for h, v in zip(horizons, values)
+        ],
+    }
+
+@router.post("/measurements")
+async def ingest_measurements(data: List[SensorReading], x_sensor_token: Optional[str] = Header(None)):
+    """
+    Record sensor readings; they feed lag/rolling features for predictions.
+    Only readings sent with the SENSOR_TOKEN are also used to answer
+    location queries and heatmaps for other users. Readings older than a
+    location's latest one are not recorded (counted in `out_of_order`).
+    """
+    trusted = bool(SENSOR_TOKEN) and secrets.compare_digest(x_sensor_token or "", SENSOR_TOKEN)
+    source = "sensor" if trusted else "sensor_unverified"
+    recorded = 0
+    # Oldest first, so a batch may arrive in any order
+    for reading in sorted(data, key=lambda r: r.observed_at.timestamp() if r.observed_at else float("inf")):
+        raw = np.array([
+            np.nan if getattr(reading, name) is None else getattr(reading, name)
+            for name in RAW_FEATURES
+        ], dtype=np.float32)
+        observed_at = reading.observed_at.timestamp() if reading.observed_at else None
+        recorded += measurement_store.record(reading.latitude, reading.longitude, raw, observed_at, source=source)
+    return {"recorded": recorded, "out_of_order": len(data) - recorded, "trusted": trusted}
+
+@router.get("/location-aqi/cache-stats")
+async def location_cache_stats():
+    # Counters are per worker process; "shared" covers the cross-worker tier
+    return {
+        **location_cache.stats(), "shared": shared_cache.stats(),
+        "breaker": open_meteo_client.breaker.stats(), "spatial": spatial_service.stats(),
+        "worker_pid": os.getpid(),
+    }
+
 from app.services.chat_service import chat_service
+from app.services.chat_cache import chat_response_cache
+
+def _chat_category(data: ChatInput):
+    return classify_aqi(data.aqi)["category"] if data.aqi is not None else None
 
 @router.post("/chatbot", response_model=ChatOutput)
 async def chatbot(data: ChatInput):
-    response_text = await chat_service.generate_response(data.message)
+    response_text = await chat_service.generate_response(data.message, _chat_category(data))
     return ChatOutput(response=response_text)
 
+@router.post("/chatbot/stream")
+async def chatbot_stream(data: ChatInput, request: Request):
+    """
+    Server-Sent Events version of /chatbot. Each `data:` event carries
+    {"token": "..."}; a final `done` event ends the stream.
+    """
+    async def events():
+        async for token in chat_service.stream_response(data.message, _chat_category(data)):
+            if await request.is_disconnected():
+                break
+            yield f"data: {json.dumps({'token': token})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/chatbot/cache-stats")
+async def chat_cache_stats():
+    return {**chat_response_cache.stats(), "breaker": chat_service.breaker.stats()}
+
 @router.get("/health-advice")
 async def health_advice_endpoint(aqi: float):
     cat_info = classify_aqi(aqi)
@@ -1,8 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
+from datetime import datetime
 
 # Input for AQI Prediction
 class AQIPredictionInput(BaseModel):
+    # Infinite or NaN readings are rejected (422), not scored
+    model_config = ConfigDict(allow_inf_nan=False)
+
     pm25: float
     pm10: float
     no2: float
@@ -12,6 +16,9 @@ class AQIPredictionInput(BaseModel):
     temperature: float
     humidity: float
     wind_speed: float
+    # Optional location, used to look up recent readings for lag features
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 # Output for AQI Prediction
 class AQIPredictionOutput(BaseModel):
@@ -20,10 +27,16 @@ class AQIPredictionOutput(BaseModel):
     color: str
     advice: dict
 
+# Admin: switch the active or shadow model version (null clears the shadow)
+class ModelVersionInput(BaseModel):
+    version: Optional[str] = None
+
 # Input for Chatbot
 class ChatInput(BaseModel):
     message: str
     location: Optional[str] = None
+    # Current AQI at the user's location, if known; tailors (and keys cached) answers
+    aqi: Optional[float] = None
 
 # Output for Chatbot
 class ChatOutput(BaseModel):
@@ -31,5 +44,25 @@ class ChatOutput(BaseModel):
 
 # Input for Location AQI
 class LocationInput(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)
+
+    latitude: float
+    longitude: float
+
+# Input for sensor ingest
+class SensorReading(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)
+
     latitude: float
     longitude: float
+    pm25: float
+    pm10: float
+    no2: float
+    so2: float
+    co: float
+    o3: float
+    temperature: Optional[float] = None
+    humidity: Optional[float] = None
+    wind_speed: Optional[float] = None
+    # Defaults to the time the reading is received
+    observed_at: Optional[datetime] = None
@@ -0,0 +1,220 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from app.services import metrics
+from app.services.shared_cache import dumps, loads, shared_cache
+
+# Grid cell size in degrees. 0.05° is roughly 5.5 km, well inside the
+# resolution of the Open-Meteo air-quality model.
+CELL_SIZE_DEG = float(os.getenv("AQI_CACHE_CELL_DEG", "0.05"))
+# Open-Meteo refreshes hourly, so a few minutes of staleness is harmless.
+TTL_SECONDS = float(os.getenv("AQI_CACHE_TTL_SECONDS", "900"))
+MAX_ENTRIES = int(os.getenv("AQI_CACHE_MAX_ENTRIES", "10000"))
+# Expired entries are kept this long as a fallback while upstream is down
+STALE_SECONDS = float(os.getenv("AQI_CACHE_STALE_SECONDS", "21600"))
+
+
+def snap_to_cell(lat: float, lon: float, cell_size: float = CELL_SIZE_DEG) -> tuple:
+    """
+    Map a coordinate to the integer (row, col) of the grid cell containing it.
+    """
+    return (math.floor(lat / cell_size), math.floor(lon / cell_size))
+
+
+def cell_center(cell: tuple, cell_size: float = CELL_SIZE_DEG) -> tuple:
+    """
+    Return the (lat, lon) at the centre of a grid cell.
+    """
+    row, col = cell
+    return (round((row + 0.5) * cell_size, 6), round((col + 0.5) * cell_size, 6))
+
+
+class GeoCache:
+    """
+    TTL + LRU cache keyed on snapped lat/lon grid cells.
+
+    Concurrent misses for the same cell are coalesced: the first caller starts
+    the loader as a task and everyone (including the first caller) awaits that
+    task, so a caller that gets cancelled does not abort the shared load.
+    All access happens on the event loop, so no locking is needed.
+
+    With a `shared` tier (see shared_cache), local misses are looked up there
+    before calling the loader, and loaded values are written back, so worker
+    processes share each other's upstream results. Shared entries carry their
+    wall-clock expiry, so a value keeps its original TTL in every worker.
+
+    Expired entries are not served by get() but stay available to
+    get_stale() for `stale_seconds` more (LRU-bounded like the rest), as
+    the last known value when upstream cannot be reached.
+    """
+
+    def __init__(self, ttl: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES,
+                 cell_size: float = CELL_SIZE_DEG, clock=time.monotonic, shared=None,
+                 stale_seconds: float = STALE_SECONDS):
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.cell_size = cell_size
+        self.shared = shared
+        self._clock = clock
+        self._entries = OrderedDict()  # cell -> (expires_at, value, fetched_at wall-clock time)
+        self._inflight = {}  # cell -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.stale_served = 0
+
+    def cell_for(self, lat: float, lon: float) -> tuple:
+        return snap_to_cell(lat, lon, self.cell_size)
+
+    def get(self, cell: tuple):
+        entry = self._entries.get(cell)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        now = self._clock()
+        if expires_at <= now:
+            if expires_at + self.stale_seconds <= now:
+                del self._entries[cell]
+            return None
+        self._entries.move_to_end(cell)
+        return value
+
+    def get_stale(self, cell: tuple):
+        """(value, fetched_at) for the cell's entry even if expired, within the stale window; else None."""
+        entry = self._entries.get(cell)
+        if entry is None or entry[0] + self.stale_seconds <= self._clock():
+            return None
+        self.stale_served += 1
+        return entry[1], entry[2]
+
+    def entries(self) -> list:
+        """(cell, value, fetched_at) for every entry, expired ones in the stale window included."""
+        return [(cell, value, fetched_at) for cell, (_, value, fetched_at) in self._entries.items()]
+
+    def ttl_remaining(self, cell: tuple):
+        """Seconds until the cell's entry expires, or None if it is not cached."""
+        entry = self._entries.get(cell)
+        if entry is None:
+            return None
+        return max(0.0, entry[0] - self._clock())
+
+    def lookup(self, cell: tuple):
+        """Like get(), but counted as a hit or miss in the stats."""
+        value = self.get(cell)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, cell: tuple, value, ttl: float = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        # A shorter ttl means the value was fetched (by another worker) that much earlier
+        fetched_at = time.time() - max(0.0, self.ttl - ttl)
+        self._entries[cell] = (self._clock() + ttl, value, fetched_at)
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def shared_key(self, cell: tuple) -> str:
+        return f"geo:{self.cell_size}:{cell[0]}:{cell[1]}"
+
+    async def store(self, items: dict) -> None:
+        """Cache freshly loaded {cell: value} locally and in the shared tier."""
+        for cell, value in items.items():
+            self.put(cell, value)
+        if self.shared is not None and items:
+            expires_at = time.time() + self.ttl
+            await self.shared.set_many(
+                {self.shared_key(cell): dumps([expires_at, value]) for cell, value in items.items()},
+                self.ttl,
+            )
+
+    async def fetch_shared(self, cells: list) -> dict:
+        """Look cells up in the shared tier, caching hits locally for their remaining TTL."""
+        if self.shared is None or not cells:
+            return {}
+        found = {}
+        now = time.time()
+        for cell, payload in zip(cells, await self.shared.get_many([self.shared_key(c) for c in cells])):
+            if payload is None:
+                continue
+            expires_at, value = loads(payload)
+            if expires_at > now:
+                self.put(cell, value, ttl=expires_at - now)
+                found[cell] = value
+        self.shared_hits += len(found)
+        return found
+
+    async def lookup_many(self, cells: list) -> dict:
+        """{cell: value} for the cells cached locally or in the shared tier (counted in stats)."""
+        found = {}
+        missing = []
+        for cell in cells:
+            value = self.lookup(cell)
+            if value is None:
+                missing.append(cell)
+            else:
+                found[cell] = value
+        found.update(await self.fetch_shared(missing))
+        return found
+
+    async def get_or_load(self, lat: float, lon: float, loader, cacheable=lambda value: True):
+        """
+        Return the cached value for the cell containing (lat, lon), awaiting
+        `loader(center_lat, center_lon)` at most once per cell on a miss.
+        Values for which `cacheable(value)` is false are returned but not stored.
+        """
+        cell = self.cell_for(lat, lon)
+        value = self.get(cell)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(cell)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(cell, loader, cacheable))
+            self._inflight[cell] = task
+            task.add_done_callback(lambda t: self._inflight.pop(cell, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, cell: tuple, loader, cacheable):
+        shared = await self.fetch_shared([cell])
+        if cell in shared:
+            return shared[cell]
+        value = await loader(*cell_center(cell, self.cell_size))
+        if cacheable(value):
+            await self.store({cell: value})
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "stale_served": self.stale_served,
+            # Shared-tier hits were first counted as local misses
+            "hit_ratio": ((self.hits + self.shared_hits) / lookups) if lookups else 0.0,
+        }
+
+
+# Global instance
+location_cache = GeoCache(shared=shared_cache)
+metrics.register_cache("location", location_cache)
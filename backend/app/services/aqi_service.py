@@ -1,31 +1,98 @@
+import math
+from bisect import bisect_left
+import numpy as np
+# The sub-index tables live in shared/, where the training scripts use them too
+from shared.cpcb import (  # noqa: F401 (re-exported)
+    POLLUTANT_BREAKPOINTS, POLLUTANTS, SUB_INDEX_BREAKPOINTS, aqi_array, sub_index, sub_index_array,
+)
+
+# AQI bands: each band runs from the previous upper bound (exclusive) up to
+# and including its own. Anything above the last bound is "Severe".
+AQI_BAND_UPPER = [50, 100, 200, 300, 400]
+CATEGORIES = ["Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe", "Unknown"]
+COLORS = ["#009966", "#FFDE33", "#FF9933", "#CC0033", "#660099", "#7E0023", "#808080"]
+UNKNOWN_BAND = len(CATEGORIES) - 1
+
+# Array forms for vectorized lookups
+AQI_CATEGORIES = np.array(CATEGORIES)
+AQI_COLORS = np.array(COLORS)
+
+_BAND_UPPER_ARRAY = np.array(AQI_BAND_UPPER, dtype=np.float64)
+
+
+def _band_of(aqi: float) -> int:
+    if not aqi >= 0:  # negative or NaN
+        return UNKNOWN_BAND
+    return bisect_left(AQI_BAND_UPPER, aqi)
+
 
 def classify_aqi(aqi_value: float) -> dict:
     """
-    Classify AQI based on Indian CPCB or US EPA standards. 
-    Using a standard scale for this project:
+    Classify AQI based on the Indian CPCB scale:
     0–50 Good
     51–100 Satisfactory
     101–200 Moderate
     201–300 Poor
     301–400 Very Poor
     401–500 Severe
+    Fractional values belong to the band whose upper bound they do not
+    exceed, so 50.5 is Satisfactory.
     """
     try:
-        aqi = float(aqi_value)
-    except ValueError:
-        return {"category": "Unknown", "color": "#808080"}
-
-    if 0 <= aqi <= 50:
-        return {"category": "Good", "color": "#009966"} # Green
-    elif 51 <= aqi <= 100:
-        return {"category": "Satisfactory", "color": "#FFDE33"} # Yellow
-    elif 101 <= aqi <= 200:
-        return {"category": "Moderate", "color": "#FF9933"} # Orange
-    elif 201 <= aqi <= 300:
-        return {"category": "Poor", "color": "#CC0033"} # Red
-    elif 301 <= aqi <= 400:
-        return {"category": "Very Poor", "color": "#660099"} # Purple
-    elif aqi >= 401:
-        return {"category": "Severe", "color": "#7E0023"} # Maroon
-    else:
-        return {"category": "Unknown", "color": "#808080"}
+        band = _band_of(float(aqi_value))
+    except (TypeError, ValueError):
+        band = UNKNOWN_BAND
+    return {"category": CATEGORIES[band], "color": COLORS[band]}
+
+
+def classify_aqi_array(aqi_values) -> np.ndarray:
+    """
+    Vectorized classify_aqi. Returns band indices into AQI_CATEGORIES /
+    AQI_COLORS; negative and NaN values map to UNKNOWN_BAND.
+    """
+    aqi = np.asarray(aqi_values, dtype=np.float64)
+    bands = np.searchsorted(_BAND_UPPER_ARRAY, aqi, side="left")
+    bands[~(aqi >= 0)] = UNKNOWN_BAND
+    return bands
+
+
+def compute_aqi(pollutants: dict) -> dict:
+    """
+    CPCB AQI from pollutant concentrations keyed like POLLUTANTS (pm25, pm10,
+    no2, so2, co in mg/m³, o3). The AQI is the maximum sub-index; missing
+    pollutants are ignored. Returns the AQI, dominant pollutant, category,
+    colour and every sub-index (None where missing). With no usable
+    pollutant the AQI is NaN and the category "Unknown".
+    """
+    sub_indices = {}
+    aqi = math.nan
+    dominant = None
+    for pollutant in POLLUTANTS:
+        value = sub_index(pollutant, pollutants.get(pollutant))
+        sub_indices[pollutant] = value if value >= 0 else None
+        if value >= 0 and not value <= aqi:  # also true while aqi is NaN
+            aqi, dominant = value, pollutant
+    band = _band_of(aqi)
+    return {
+        "aqi": aqi,
+        "dominant_pollutant": dominant,
+        "category": CATEGORIES[band],
+        "color": COLORS[band],
+        "sub_indices": sub_indices,
+    }
+
+
+def compute_aqi_array(columns: dict) -> dict:
+    """
+    Vectorized compute_aqi over equal-length concentration arrays. Returns
+    arrays: `aqi` (float64, NaN where no pollutant is usable), `dominant_pollutant`
+    (index into POLLUTANTS, -1 where unknown), `band` (index into
+    AQI_CATEGORIES / AQI_COLORS) and a `sub_indices` dict.
+    """
+    aqi, dominant, sub_indices = aqi_array(columns)
+    return {
+        "aqi": aqi,
+        "dominant_pollutant": dominant,
+        "band": classify_aqi_array(aqi),
+        "sub_indices": sub_indices,
+    }
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "2"))
+MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "64"))
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-row predictions into one vectorized call.
+
+    Rows are queued by `submit()`; a worker task waits for the first row,
+    keeps collecting for up to `window_ms` or until `max_batch_size` rows are
+    queued, then runs `predict_fn` on the stacked batch in a dedicated worker
+    thread so the event loop stays free. While one batch is being scored the
+    next one accumulates. Once closed, `submit()` raises instead of quietly
+    starting a new worker; only an explicit `start()` reopens it. Closing
+    fails every row still waiting, queued or in the batch being scored.
+    """
+
+    def __init__(self, predict_fn, window_ms: float = BATCH_WINDOW_MS,
+                 max_batch_size: int = MAX_BATCH_SIZE):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+        self._executor = None
+        self._closed = False
+        # Rows taken off the queue and not yet answered
+        self._batch = []
+
+        self.batches = 0
+        self.rows = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_predict_time = 0.0
+
+    async def start(self) -> None:
+        if self._worker is not None:
+            return
+        self._closed = False
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        pending = self._batch
+        self._batch = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future, _ in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("MicroBatcher is closed"))
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, row: np.ndarray) -> float:
+        """Queue one model row and wait for its prediction."""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future, time.perf_counter()))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that gave up (e.g. client disconnected) are skipped
+            self._batch = batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            self._record_batch(batch, started)
+            X = np.stack([row for row, _, _ in batch])
+            try:
+                predictions = await loop.run_in_executor(self._executor, self.predict_fn, X)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.total_predict_time += time.perf_counter() - started
+
+            for (_, future, _), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(float(prediction))
+            self._batch = []
+
+    def _record_batch(self, batch: list, started: float) -> None:
+        self.batches += 1
+        self.rows += len(batch)
+        bucket = 0
+        while bucket < len(BATCH_SIZE_BUCKETS) and len(batch) > BATCH_SIZE_BUCKETS[bucket]:
+            bucket += 1
+        self.batch_size_counts[bucket] += 1
+        for _, _, enqueued in batch:
+            wait = started - enqueued
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict:
+        labels = [str(b) for b in BATCH_SIZE_BUCKETS] + ["+Inf"]
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": (self.rows / self.batches) if self.batches else 0.0,
+            "batch_size_histogram": dict(zip(labels, self.batch_size_counts)),
+            "mean_wait_ms": (self.total_wait / self.rows * 1000) if self.rows else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+            "mean_predict_ms": (self.total_predict_time / self.batches * 1000) if self.batches else 0.0,
+        }
@@ -0,0 +1,116 @@
+import io
+import json
+import numpy as np
+from app.services.aqi_service import classify_aqi_array, AQI_CATEGORIES, AQI_COLORS
+from app.services.inference import RAW_FEATURES
+
+JSON_CONTENT_TYPE = "application/json"
+NPZ_CONTENT_TYPE = "application/x-npz"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+SUPPORTED_CONTENT_TYPES = (JSON_CONTENT_TYPE, NPZ_CONTENT_TYPE, ARROW_CONTENT_TYPE)
+
+# Rows scored per model call / streamed response chunk
+CHUNK_ROWS = 65536
+
+
+def parse_columns(body: bytes, content_type: str) -> np.ndarray:
+    """
+    Decode a bulk prediction body into an (n, len(RAW_FEATURES)) float32 array.
+
+    Accepted bodies:
+    - application/json: a list of AQIPredictionInput-shaped objects
+    - application/x-npz: a NumPy .npz archive with one 1-D array per column
+    - application/vnd.apache.arrow.stream: an Arrow IPC stream (needs pyarrow)
+
+    Raises ValueError with a client-facing message for malformed input.
+    """
+    if content_type == JSON_CONTENT_TYPE:
+        return _from_json(body)
+    if content_type == NPZ_CONTENT_TYPE:
+        try:
+            with np.load(io.BytesIO(body), allow_pickle=False) as archive:
+                return _stack_columns({name: archive[name] for name in archive.files})
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Invalid .npz body: {e}")
+    if content_type == ARROW_CONTENT_TYPE:
+        return _from_arrow(body)
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+
+def _from_json(body: bytes) -> np.ndarray:
+    try:
+        records = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON body: {e}")
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON list of records.")
+    try:
+        rows = [[record[name] for name in RAW_FEATURES] for record in records]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Every record needs the fields {RAW_FEATURES} (missing {e}).")
+    try:
+        raw = np.array(rows, dtype=np.float32).reshape(len(rows), len(RAW_FEATURES))
+    except (TypeError, ValueError):
+        raise ValueError("All fields must be numbers.")
+    _check_finite(raw)
+    return raw
+
+
+def _from_arrow(body: bytes) -> np.ndarray:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ValueError("Arrow bodies need pyarrow, which is not installed on this server.")
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"Invalid Arrow IPC stream: {e}")
+    return _stack_columns({
+        name: table.column(name).to_numpy() for name in table.column_names
+    })
+
+
+def _stack_columns(columns: dict) -> np.ndarray:
+    missing = [name for name in RAW_FEATURES if name not in columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+    lengths = {np.shape(columns[name]) for name in RAW_FEATURES}
+    if len(lengths) != 1 or len(next(iter(lengths))) != 1:
+        raise ValueError("Columns must be 1-D arrays of equal length.")
+    for name in RAW_FEATURES:
+        if columns[name].dtype.kind not in "biuf":
+            raise ValueError(f"Column {name} must be numeric.")
+    raw = np.column_stack([columns[name] for name in RAW_FEATURES]).astype(np.float32, copy=False)
+    _check_finite(raw)
+    return raw
+
+
+def _check_finite(raw: np.ndarray) -> None:
+    bad = ~np.isfinite(raw)
+    if bad.any():
+        row, col = np.argwhere(bad)[0]
+        raise ValueError(f"Non-finite value in column {RAW_FEATURES[col]} at row {row}.")
+
+
+def predict_chunks(engine, raw: np.ndarray, ordered: bool = True):
+    """
+    Yield (aqi, band) array pairs for consecutive CHUNK_ROWS slices of `raw`.
+    When rows are ordered, each slice is built with the preceding rows as
+    context so lag/rolling features match a single pass over the whole array.
+    """
+    context = engine.rolling_window - 1 if ordered else 0
+    for start in range(0, raw.shape[0], CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, raw.shape[0])
+        lead = min(start, context)
+        X = engine.build_features_batch(raw[start - lead:end], ordered=ordered)[lead:]
+        aqi = engine.predict(X)
+        yield aqi, classify_aqi_array(aqi)
+
+
+def format_ndjson(aqi: np.ndarray, bands: np.ndarray) -> str:
+    categories = AQI_CATEGORIES[bands]
+    colors = AQI_COLORS[bands]
+    return "".join(
+        f'{{"aqi":{a:.3f},"category":"{c}","color":"{k}"}}\n'
+        for a, c, k in zip(aqi.tolist(), categories.tolist(), colors.tolist())
+    )
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+from app.services import metrics
+from app.services.shared_cache import dumps, loads, shared_cache
+
+TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600"))
+MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1024"))
+# Cosine similarity above which a cached answer is reused for a new wording
+# (which must also have the same content words, see content_signature)
+SIMILARITY_THRESHOLD = float(os.getenv("CHAT_CACHE_SIMILARITY", "0.9"))
+VECTOR_DIM = 2048
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Words that can differ between two wordings of the same question. Negations
+# are not among them; the stems of contractions are ("isn't" -> "isn t").
+STOP_WORDS = frozenset("""
+    a an the is are was were be been being am do does did doing have has had having
+    i me my we our you your he she it its they them their this that these those
+    what which who whom how when where why whether if then so than
+    to of in on at by for with from about into over as and or but
+    can could should would will shall may might must please tell
+    isn aren wasn weren don doesn didn haven hasn hadn couldn shouldn wouldn won
+""".split())
+# Folded to "not", so "isn't safe" and "is not safe" agree
+NEGATIONS = frozenset(("not", "no", "never", "nor", "neither", "none", "nothing", "cannot", "without", "t"))
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def content_signature(normalized: str) -> frozenset:
+    """
+    The set of content words of a normalized query: stop words dropped,
+    negations folded to "not", a plural "s" stripped. Two wordings share a
+    cached answer only if these match, since a changed subject ("kids" vs
+    "dog") or an added "not" can flip the answer while barely moving the
+    trigram vector.
+    """
+    words = set()
+    for word in normalized.split():
+        if word in NEGATIONS:
+            words.add("not")
+        elif word not in STOP_WORDS:
+            words.add(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word)
+    return frozenset(words)
+
+
+def embed(normalized: str, dim: int = VECTOR_DIM) -> np.ndarray:
+    """
+    Unit-length hashed character-trigram vector of a normalized query.
+    crc32 keeps the hashing stable across processes.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in normalized.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode()) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class ChatResponseCache:
+    """
+    Chatbot answers keyed by (AQI category, normalized question).
+
+    Lookups try an exact match on the normalized text first, then the most
+    similar cached question in the same category by cosine similarity of
+    hashed trigram vectors, provided it has the same content words
+    (content_signature). Entries expire after `ttl` seconds and the least
+    recently used entry is evicted once `max_entries` is reached. Vectors
+    live in one preallocated matrix so a semantic lookup is a single
+    matrix-vector product.
+
+    With a `shared` tier, answers are also stored there by exact key, and
+    `aget` falls back to it on a local miss, so one worker's Gemini answer
+    serves the others. Answers fetched that way join the local semantic
+    index.
+    """
+
+    def __init__(self, ttl: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES,
+                 threshold: float = SIMILARITY_THRESHOLD, dim: int = VECTOR_DIM, clock=time.monotonic,
+                 shared=None):
+        self.ttl = ttl
+        self.shared = shared
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.dim = dim
+        self._clock = clock
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._categories = np.full(max_entries, -1, dtype=np.int32)
+        self._signatures = [None] * max_entries
+        self._category_ids = {}
+        self._entries = OrderedDict()  # (category, normalized) -> (slot, expires_at, response)
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _category_id(self, category: str) -> int:
+        return self._category_ids.setdefault(category, len(self._category_ids))
+
+    def get(self, message: str, category: str):
+        response = self._get_local((category, normalize_query(message)))
+        if response is None:
+            self.misses += 1
+        return response
+
+    def _get_local(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > self._clock():
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[2]
+            self._remove(key)
+
+        match = self._nearest(key)
+        if match is not None:
+            self._entries.move_to_end(match)
+            self.semantic_hits += 1
+            return self._entries[match][2]
+        return None
+
+    @staticmethod
+    def _shared_key(key: tuple) -> str:
+        digest = hashlib.sha1(f"{key[0]}\x00{key[1]}".encode()).hexdigest()
+        return f"chat:{digest}"
+
+    async def aget(self, message: str, category: str):
+        """get(), falling back to the shared tier on a local miss."""
+        key = (category, normalize_query(message))
+        response = self._get_local(key)
+        if response is None and self.shared is not None:
+            payload = await self.shared.get(self._shared_key(key))
+            if payload is not None:
+                response = loads(payload)
+                self.shared_hits += 1
+                self.put(message, category, response)
+                return response
+        if response is None:
+            self.misses += 1
+        return response
+
+    async def aput(self, message: str, category: str, response: str) -> None:
+        self.put(message, category, response)
+        if self.shared is not None:
+            key = (category, normalize_query(message))
+            await self.shared.set(self._shared_key(key), dumps(response), self.ttl)
+
+    def _nearest(self, key: tuple):
+        category_id = self._category_ids.get(key[0])
+        if category_id is None or not key[1]:
+            return None
+        similarity = self._vectors @ embed(key[1], self.dim)
+        similarity[self._categories != category_id] = -1.0
+        signature = content_signature(key[1])
+        now = self._clock()
+        # Walk candidates best-first, dropping expired ones as we meet them
+        for slot in np.argsort(similarity)[::-1]:
+            if similarity[slot] < self.threshold:
+                return None
+            match = self._slot_keys[slot]
+            if self._entries[match][1] <= now:
+                self._remove(match)
+                similarity[slot] = -1.0
+            elif self._signatures[slot] == signature:
+                return match
+        return None
+
+    def put(self, message: str, category: str, response: str) -> None:
+        key = (category, normalize_query(message))
+        if key in self._entries:
+            self._remove(key)
+        if not self._free_slots:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._vectors[slot] = embed(key[1], self.dim)
+        self._categories[slot] = self._category_id(category)
+        self._signatures[slot] = content_signature(key[1])
+        self._slot_keys[slot] = key
+        self._entries[key] = (slot, self._clock() + self.ttl, response)
+
+    def _remove(self, key: tuple) -> None:
+        slot = self._entries.pop(key)[0]
+        self._vectors[slot] = 0.0
+        self._categories[slot] = -1
+        self._signatures[slot] = None
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def clear(self) -> None:
+        for key in list(self._entries):
+            self._remove(key)
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits + self.shared_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (hits / lookups) if lookups else 0.0,
+        }
+
+
+# Global instance
+chat_response_cache = ChatResponseCache(shared=shared_cache)
+metrics.register_cache("chat", chat_response_cache)
@@ -1,12 +1,36 @@
+import asyncio
+import logging
 import os
+import time
 import google.generativeai as genai
-from typing import Optional
+from typing import AsyncIterator, Optional
+from app.services import metrics
+from app.services.chat_cache import chat_response_cache
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# Gemini calls allowed in flight per process; extra requests wait their turn
+MAX_CONCURRENT_REQUESTS = int(os.getenv("CHAT_MAX_CONCURRENCY", "8"))
+# Longest wait for a reply, or for each streamed chunk
+TIMEOUT_SECONDS = float(os.getenv("CHAT_TIMEOUT_SECONDS", "20"))
+# Replies slower than this (to the first chunk, when streaming) count against the circuit breaker
+SLOW_CALL_SECONDS = float(os.getenv("CHAT_SLOW_CALL_SECONDS", "10"))
+
+logger = logging.getLogger(__name__)
 
 class ChatService:
-    def __init__(self):
+    def __init__(self, model=None, max_concurrency: int = MAX_CONCURRENT_REQUESTS, cache=chat_response_cache,
+                 timeout: float = TIMEOUT_SECONDS, breaker: CircuitBreaker = None):
         self.api_key = os.getenv("GEMINI_API_KEY")
-        self.model = None
-        if self.api_key:
+        # Anything with Gemini's generate_content_async() works, e.g. a fake in tests
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        # While Gemini keeps failing or stalling, answer from the fallback at once
+        self.breaker = breaker or CircuitBreaker("gemini", slow_seconds=SLOW_CALL_SECONDS)
+        # Answers depend on the AQI, so they are cached per AQI category
+        self.cache = cache
+        self._semaphore = None
+        if self.model is None and self.api_key:
             genai.configure(api_key=self.api_key)
             # using gemini-pro for text-only chat
             self.model = genai.GenerativeModel('gemini-pro')
@@ -28,22 +52,106 @@ class ChatService:
         You: "I am specialized in Air Quality and Health. Please ask me about pollution, masks, or health tips!"
         """
 
-    async def generate_response(self, user_message: str) -> str:
+    def _build_prompt(self, user_message: str, aqi_category: Optional[str] = None) -> str:
+        # Gemini Pro doesn't have a rigid "system" role in the same way as GPT-4, 
+        # but pre-pending instructions works well.
+        context = f"\n\nThe user's current AQI category is: {aqi_category}." if aqi_category else ""
+        return f"{self.system_prompt}{context}\n\nUser: {user_message}\nAirGuard:"
+
+    def _limit(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def generate_response(self, user_message: str, aqi_category: Optional[str] = None) -> str:
         if not self.model:
             return self._fallback_response(user_message)
+
+        cache_category = aqi_category or "Unknown"
+        cached = await self.cache.aget(user_message, cache_category)
+        if cached is not None:
+            return cached
             
         try:
-            # Construct the full prompt with system context
-            # Gemini Pro doesn't have a rigid "system" role in the same way as GPT-4, 
-            # but pre-pending instructions works well.
-            full_prompt = f"{self.system_prompt}\n\nUser: {user_message}\nAirGuard:"
-            
-            response = self.model.generate_content(full_prompt)
+            self.breaker.before_call()
+            async with self._limit():
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(self._build_prompt(user_message, aqi_category)),
+                        self.timeout,
+                    )
+                except Exception as e:
+                    self.breaker.record(time.perf_counter() - started, ok=False)
+                    metrics.observe_upstream("gemini", started, type(e).__name__)
+                    raise
+                self.breaker.record(time.perf_counter() - started)
+                metrics.observe_upstream("gemini", started)
+            await self.cache.aput(user_message, cache_category, response.text)
             return response.text
         except Exception as e:
-            print(f"Error generating AI response: {e}")
+            self._log_failure("Error generating AI response: %s", e)
             return self._fallback_response(user_message, error=True)
 
+    async def stream_response(self, user_message: str, aqi_category: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Yield the reply in chunks as Gemini produces them. If the consumer
+        stops iterating (e.g. the client disconnected) the upstream stream is
+        abandoned and the concurrency slot released. Cached answers are sent
+        as a single chunk; a reply is only cached once it streamed completely.
+        """
+        if not self.model:
+            yield self._fallback_response(user_message)
+            return
+
+        cache_category = aqi_category or "Unknown"
+        cached = await self.cache.aget(user_message, cache_category)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        try:
+            self.breaker.before_call()
+            async with self._limit():
+                started = time.perf_counter()
+                first_chunk = None
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(self._build_prompt(user_message, aqi_category), stream=True),
+                        self.timeout,
+                    )
+                    stream = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - started
+                        if chunk.text:
+                            chunks.append(chunk.text)
+                            yield chunk.text
+                except Exception as e:
+                    self.breaker.record(time.perf_counter() - started, ok=False)
+                    metrics.observe_upstream("gemini_stream", started, type(e).__name__)
+                    raise
+                self.breaker.record(first_chunk if first_chunk is not None else time.perf_counter() - started)
+                # Includes time the client took to read the chunks
+                metrics.observe_upstream("gemini_stream", started)
+            await self.cache.aput(user_message, cache_category, "".join(chunks))
+        except Exception as e:
+            self._log_failure("Error streaming AI response: %s", e)
+            if not chunks:
+                yield self._fallback_response(user_message, error=True)
+
+    def _log_failure(self, message: str, e: Exception) -> None:
+        # An open circuit is reported by the breaker once, not per refused call
+        if not isinstance(e, CircuitOpenError):
+            logger.warning(message, e)
+        metrics.ERRORS.labels("chatbot").inc()
+
     def _fallback_response(self, message: str, error: bool = False) -> str:
         """
         Fallback logic strictly for when AI is unavailable.
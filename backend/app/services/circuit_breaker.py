@@ -0,0 +1,130 @@
+import logging
+import os
+import time
+from collections import deque
+from app.services import metrics
+
+# Defaults for every breaker; each dependency sets its own slow-call threshold
+WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+# Trip when at least this fraction of the window failed or was slow
+FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Gauge values, ordered by severity so the worst worker wins in aggregates
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency that keeps failing or responding slowly.
+
+    Closed: calls go through and their outcomes fill a rolling window; a
+    call counts as bad if it failed or took longer than `slow_seconds`.
+    Once the window holds `min_calls` outcomes and the bad fraction reaches
+    `failure_ratio`, the circuit opens. Open: calls are refused
+    (CircuitOpenError) for `open_seconds`, so callers fall back at once
+    instead of queueing behind a sick upstream. Half-open: up to
+    `half_open_probes` trial calls are let through; if they all succeed
+    quickly the circuit closes, one bad probe opens it again.
+
+    State is per process. Usage: `breaker.before_call()`, then
+    `breaker.record(elapsed, ok)` once the call finished.
+    """
+
+    def __init__(self, name: str, slow_seconds: float, window: int = WINDOW, min_calls: int = MIN_CALLS,
+                 failure_ratio: float = FAILURE_RATIO, open_seconds: float = OPEN_SECONDS,
+                 half_open_probes: int = HALF_OPEN_PROBES, clock=time.monotonic):
+        self.name = name
+        self.slow_seconds = slow_seconds
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self._outcomes = deque(maxlen=window)  # True for a bad call
+        self._bad = 0
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_started = 0
+        self._probes_passed = 0
+        self._probe_at = 0.0
+
+        self.rejected = 0
+        self.transitions = 0
+        self._state_gauge = metrics.BREAKER_STATE.labels(name)
+        self._state_gauge.set(STATE_VALUES[CLOSED])
+
+    def _transition(self, state: str) -> None:
+        logger.warning("Circuit for %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        self.transitions += 1
+        self._state_gauge.set(STATE_VALUES[state])
+        metrics.BREAKER_TRANSITIONS.labels(self.name, state).inc()
+        if state == OPEN:
+            self._opened_at = self._clock()
+        elif state == HALF_OPEN:
+            self._probes_started = 0
+            self._probes_passed = 0
+        else:
+            self._outcomes.clear()
+            self._bad = 0
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call must not be made now."""
+        if self.state == OPEN:
+            if self._clock() - self._opened_at < self.open_seconds:
+                self._reject()
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes_started >= self.half_open_probes:
+                # Probes that never reported back (e.g. cancelled) are retried after a while
+                if self._clock() - self._probe_at < self.open_seconds:
+                    self._reject()
+                self._probes_started = 0
+            self._probes_started += 1
+            self._probe_at = self._clock()
+
+    def _reject(self):
+        self.rejected += 1
+        metrics.BREAKER_REJECTED.labels(self.name).inc()
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record(self, elapsed: float, ok: bool = True) -> None:
+        bad = not ok or elapsed >= self.slow_seconds
+        if self.state == HALF_OPEN:
+            if bad:
+                self._transition(OPEN)
+            else:
+                self._probes_passed += 1
+                if self._probes_passed >= self.half_open_probes:
+                    self._transition(CLOSED)
+            return
+        if self.state == OPEN:
+            # A call started before the circuit opened
+            return
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._bad -= self._outcomes[0]
+        self._outcomes.append(bad)
+        self._bad += bad
+        if len(self._outcomes) >= self.min_calls and self._bad >= self.failure_ratio * len(self._outcomes):
+            self._transition(OPEN)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_bad": self._bad,
+            "rejected": self.rejected,
+            "transitions": self.transitions,
+        }
@@ -1,10 +1,153 @@
-import requests
-from app.services.aqi_service import classify_aqi
+import asyncio
+import logging
+import os
+import random
+import time
+import httpx
+import numpy as np
+from app.services import metrics
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.aqi_service import compute_aqi
 from app.services.health_service import get_health_advice
+from app.services.aqi_cache import location_cache, cell_center
+from app.services.inference import RAW_FEATURES
+from app.services.measurement_store import measurement_store
+from app.services.spatial_index import spatial_service
 
-OPEN_METEO_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+# Overridable so tests and local runs can point at a stub server
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://air-quality-api.open-meteo.com/v1/air-quality")
+TIMEOUT_SECONDS = float(os.getenv("OPEN_METEO_TIMEOUT_SECONDS", "5"))
+# Calls slower than this count against the circuit breaker like failures
+SLOW_CALL_SECONDS = float(os.getenv("OPEN_METEO_SLOW_CALL_SECONDS", "2"))
+MAX_RETRIES = int(os.getenv("OPEN_METEO_MAX_RETRIES", "2"))
+BACKOFF_SECONDS = float(os.getenv("OPEN_METEO_BACKOFF_SECONDS", "0.2"))
+MAX_CONCURRENCY = int(os.getenv("OPEN_METEO_MAX_CONCURRENCY", "32"))
+# Locations packed into one multi-coordinate request by fetch_aqi_batch
+BATCH_CHUNK_SIZE = int(os.getenv("OPEN_METEO_BATCH_CHUNK_SIZE", "100"))
 
-def fetch_aqi_by_location(lat: float, lon: float):
+CURRENT_VARIABLES = "pm10,pm2_5,nitrogen_dioxide,sulphur_dioxide,ozone,carbon_monoxide"
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class OpenMeteoClient:
+    """
+    Async Open-Meteo client sharing one pooled keep-alive connection set.
+
+    Each attempt is bounded by a total timeout, transient failures are
+    retried with full-jitter exponential backoff, and a semaphore caps how
+    many requests are in flight upstream at once. A circuit breaker watches
+    every attempt; while it is open, calls raise CircuitOpenError at once.
+    """
+
+    def __init__(self, base_url: str = OPEN_METEO_URL, timeout: float = TIMEOUT_SECONDS,
+                 max_retries: int = MAX_RETRIES, backoff: float = BACKOFF_SECONDS,
+                 max_concurrency: int = MAX_CONCURRENCY, breaker: CircuitBreaker = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker("open_meteo", slow_seconds=SLOW_CALL_SECONDS)
+        self._client = None
+        self._semaphore = None
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_json(self, params: dict):
+        if self._client is None:
+            # Allows use outside the app lifecycle (scripts, ad-hoc calls)
+            await self.start()
+
+        for attempt in range(self.max_retries + 1):
+            # Refused here, without queueing for a slot, while the circuit is open
+            self.breaker.before_call()
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    # httpx's timeout is per network operation; this bounds the whole attempt
+                    response = await asyncio.wait_for(self._client.get(self.base_url, params=params), self.timeout)
+                except (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError) as e:
+                    self.breaker.record(time.perf_counter() - started, ok=False)
+                    metrics.observe_upstream("open_meteo", started, type(e).__name__)
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    # Other 4xx responses are our fault, not a sign of upstream trouble
+                    healthy = response.status_code not in RETRYABLE_STATUS
+                    self.breaker.record(time.perf_counter() - started, ok=healthy)
+                    metrics.observe_upstream("open_meteo", started,
+                                             None if response.is_success else f"http_{response.status_code}")
+                    if healthy or attempt == self.max_retries:
+                        response.raise_for_status()
+                        return response.json()
+            await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+
+# Global instance, opened and closed with the app lifecycle
+open_meteo_client = OpenMeteoClient()
+
+async def fetch_aqi_by_location(lat: float, lon: float):
+    """
+    Fetch air quality for a location, served from the geo-bucketed cache.
+    All coordinates in one grid cell share a single lookup, which is
+    answered from nearby recent samples when the spatial index can (marked
+    "estimated", not cached) and from upstream otherwise.
+    If upstream fails (or its circuit is open), the cell's last known value
+    is returned with a staleness marker; aqi -1 only if there is none.
+    """
+    result = await location_cache.get_or_load(
+        lat, lon, _load_cell, cacheable=lambda result: result["aqi"] != -1 and "estimated" not in result
+    )
+    if result["aqi"] == -1:
+        return _stale_or(location_cache.cell_for(lat, lon), result)
+    return result
+
+def _stale_or(cell: tuple, error_result: dict) -> dict:
+    stale = location_cache.get_stale(cell)
+    if stale is None:
+        return error_result
+    value, fetched_at = stale
+    return {**value, "stale": True, "fetched_at": fetched_at}
+
+def _log_failure(message: str, e: Exception) -> None:
+    # An open circuit is reported by the breaker once, not per refused call
+    if not isinstance(e, CircuitOpenError):
+        logger.warning(message, e)
+    metrics.ERRORS.labels("location_aqi").inc()
+
+async def _load_cell(lat: float, lon: float):
+    estimate = spatial_service.estimate(lat, lon)
+    if estimate is None:
+        return await _fetch_from_upstream(lat, lon)
+    pollutants, details = estimate
+    # Back to the units of Open-Meteo results
+    co = pollutants["co"]
+    aqi_data = {**pollutants, "co": None if co is None else round(co * 1000.0, 1),
+                "temperature": 25.0, "humidity": 50.0}
+    result = _result_for(aqi_data)
+    if result["aqi"] == -1:
+        return await _fetch_from_upstream(lat, lon)
+    return {**result, "estimated": details}
+
+async def _fetch_from_upstream(lat: float, lon: float):
     """
     Fetch real-time air quality data from Open-Meteo.
     Ref: https://open-meteo.com/en/docs/air-quality-api
@@ -13,62 +156,132 @@ def fetch_aqi_by_location(lat: float, lon: float):
         params = {
             "latitude": lat,
             "longitude": lon,
-            "current": "pm10,pm2_5,nitrogen_dioxide,sulphur_dioxide,ozone,carbon_monoxide",
+            "current": CURRENT_VARIABLES,
             "timezone": "auto"
         }
         
-        response = requests.get(OPEN_METEO_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        current = data.get("current", {})
-        
-        # Map Open-Meteo keys to our internal keys
-        aqi_data = {
-            "pm25": current.get("pm2_5", 0),
-            "pm10": current.get("pm10", 0),
-            "no2": current.get("nitrogen_dioxide", 0),
-            "so2": current.get("sulphur_dioxide", 0),
-            "o3": current.get("ozone", 0),
-            "co": current.get("carbon_monoxide", 0), # Open-Meteo gives CO in ug/m3 usually
-            "temperature": 25.0, # Not in air-quality API usually, mock or separate call
-            "humidity": 50.0 # Mock or separate call
-        }
-        
-        # Calculate AQI (Simplified for demo, usually complex formula)
-        # Using a weighted max similar to previous logic
-        # NOTE: Open-Meteo also provides 'us_aqi' or 'european_aqi' directly if requested!
-        # Let's request 'us_aqi' for simplicity if available, else calc.
-        # Checking docs: Open-Meteo has `us_aqi` and `european_aqi` hourly. 
-        # But `current` supports specific vars. Let's stick to raw vars for consistency with our 'Model'.
-        
-        # Heuristic AQI calc
-        calculated_aqi = (
-            0.5 * aqi_data["pm25"] + 
-            0.3 * aqi_data["pm10"] + 
-            0.1 * aqi_data["no2"] + 
-            0.1 * aqi_data["so2"]
-        )
-        
-        # Classification & Advice
-        classification = classify_aqi(calculated_aqi)
-        advice = get_health_advice(classification["category"])
-        
-        return {
-            "aqi": calculated_aqi,
-            "category": classification["category"],
-            "color": classification["color"],
-            "advice": advice,
-            "components": aqi_data
-        }
+        data = await open_meteo_client.get_json(params)
+        result = _build_result(data.get("current", {}))
+        if result["aqi"] != -1:
+            _record_reading(lat, lon, result["components"])
+        return result
         
     except Exception as e:
-        print(f"Error fetching AQI: {e}")
-        # Return fallback or error
-        return {
-            "aqi": -1,
-            "category": "Error",
-            "color": "#808080",
-            "advice": {"general": "Could not fetch data."},
-            "components": {}
+        _log_failure("Error fetching AQI: %s", e)
+        return _error_result()
+
+async def fetch_aqi_batch(points: list) -> list:
+    """
+    Fetch air quality for many (lat, lon) points.
+
+    Points are deduplicated by cache cell, cached cells are answered from the
+    local or shared cache, and the remaining cells are packed into multi-coordinate Open-Meteo calls
+    of at most BATCH_CHUNK_SIZE locations each. Results come back in input
+    order; points of a failed chunk get their cell's last known value
+    (marked stale) or, failing that, an error.
+    """
+    cells = [location_cache.cell_for(lat, lon) for lat, lon in points]
+    unique = list(dict.fromkeys(cells))
+    by_cell = await location_cache.lookup_many(unique)
+    missing = [cell for cell in unique if cell not in by_cell]
+
+    chunks = [missing[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(missing), BATCH_CHUNK_SIZE)]
+    for chunk_results in await asyncio.gather(*(_fetch_chunk(chunk) for chunk in chunks)):
+        by_cell.update({
+            cell: _stale_or(cell, result) if result["aqi"] == -1 else result
+            for cell, result in chunk_results.items()
+        })
+
+    return [
+        {"latitude": lat, "longitude": lon, **by_cell[cell]}
+        for (lat, lon), cell in zip(points, cells)
+    ]
+
+async def refresh_cells(cells: list) -> int:
+    """
+    Re-fetch the given cache cells from upstream and store fresh results,
+    regardless of what is cached. Returns the number of upstream requests.
+    """
+    chunks = [cells[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(cells), BATCH_CHUNK_SIZE)]
+    await asyncio.gather(*(_fetch_chunk(chunk) for chunk in chunks))
+    return len(chunks)
+
+async def _fetch_chunk(cells: list) -> dict:
+    centers = [cell_center(cell, location_cache.cell_size) for cell in cells]
+    try:
+        params = {
+            "latitude": ",".join(str(lat) for lat, _ in centers),
+            "longitude": ",".join(str(lon) for _, lon in centers),
+            "current": CURRENT_VARIABLES,
+            "timezone": "auto"
         }
+        data = await open_meteo_client.get_json(params)
+        # A single location comes back as an object, several as a list
+        if isinstance(data, dict):
+            data = [data]
+        if len(data) != len(cells):
+            raise ValueError(f"expected {len(cells)} locations, got {len(data)}")
+    except Exception as e:
+        _log_failure("Error fetching AQI batch: %s", e)
+        return {cell: _error_result(str(e)) for cell in cells}
+
+    results = {}
+    for cell, (lat, lon), item in zip(cells, centers, data):
+        result = _build_result(item.get("current", {}))
+        if result["aqi"] != -1:
+            _record_reading(lat, lon, result["components"])
+        results[cell] = result
+    await location_cache.store({cell: result for cell, result in results.items() if result["aqi"] != -1})
+    return results
+
+def _build_result(current: dict) -> dict:
+    # Map Open-Meteo keys to our internal keys
+    aqi_data = {
+        "pm25": current.get("pm2_5", 0),
+        "pm10": current.get("pm10", 0),
+        "no2": current.get("nitrogen_dioxide", 0),
+        "so2": current.get("sulphur_dioxide", 0),
+        "o3": current.get("ozone", 0),
+        "co": current.get("carbon_monoxide", 0), # Open-Meteo gives CO in ug/m3 usually
+        "temperature": 25.0, # Not in air-quality API usually, mock or separate call
+        "humidity": 50.0 # Mock or separate call
+    }
+    return _result_for(aqi_data)
+
+def _result_for(aqi_data: dict) -> dict:
+    # CPCB sub-index method; CPCB tables take CO in mg/m3
+    co = aqi_data["co"]
+    aqi_info = compute_aqi({**aqi_data, "co": None if co is None else co / 1000.0})
+    if aqi_info["dominant_pollutant"] is None:
+        # Every pollutant null: no AQI to report, and nothing worth caching
+        return _error_result("No pollutant readings")
+    advice = get_health_advice(aqi_info["category"])
+    
+    return {
+        "aqi": aqi_info["aqi"],
+        "category": aqi_info["category"],
+        "color": aqi_info["color"],
+        "dominant_pollutant": aqi_info["dominant_pollutant"],
+        "advice": advice,
+        "components": aqi_data
+    }
+
+def _record_reading(lat: float, lon: float, components: dict) -> None:
+    # The model and CPCB tables take CO in mg/m3; wind speed is not reported.
+    # Open-Meteo reports null for pollutants it has no data for (None -> NaN)
+    co = components.get("co")
+    reading = {**components, "co": None if co is None else co / 1000.0}
+    raw = np.array([reading.get(name, np.nan) for name in RAW_FEATURES], dtype=np.float32)
+    measurement_store.record(lat, lon, raw, source="open-meteo")
+
+def _error_result(error: str = None) -> dict:
+    result = {
+        "aqi": -1,
+        "category": "Error",
+        "color": "#808080",
+        "advice": {"general": "Could not fetch data."},
+        "components": {}
+    }
+    if error:
+        result["error"] = error
+    return result
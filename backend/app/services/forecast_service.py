@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import time
+import numpy as np
+from app.services.aqi_cache import snap_to_cell
+from app.services import metrics
+from app.services.inference import InferenceEngine, model_exists
+from app.services.measurement_store import measurement_store
+from app.services.shared_cache import shared_cache
+
+FORECAST_MODEL_PATH = os.getenv("FORECAST_MODEL_PATH", "ml_engine/aqi_forecast_model.joblib")
+FORECAST_PATH = os.getenv("FORECAST_PATH", "ml_engine/aqi_forecasts.npz")
+REFRESH_SECONDS = float(os.getenv("FORECAST_REFRESH_SECONDS", "3600"))
+# How often each worker checks whether the table is due or was rewritten
+CHECK_SECONDS = float(os.getenv("FORECAST_CHECK_SECONDS", "60"))
+# Locations whose newest reading is older than this get no forecast
+MAX_READING_AGE_SECONDS = float(os.getenv("FORECAST_MAX_READING_AGE_SECONDS", "86400"))
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastTable:
+    """
+    Precomputed forecasts: one float32 row of AQI values per grid cell, one
+    column per horizon. Serving is a dict lookup plus a row slice.
+    """
+
+    def __init__(self, cells: np.ndarray, aqi: np.ndarray, horizons: np.ndarray, generated_at: float):
+        self.cells = cells
+        self.aqi = aqi
+        self.horizons = horizons
+        self.generated_at = generated_at
+        self._index = {(int(r), int(c)): i for i, (r, c) in enumerate(cells)}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, cell: tuple):
+        i = self._index.get(cell)
+        return None if i is None else self.aqi[i]
+
+    def save(self, path: str) -> None:
+        # Write next to the target and rename, so readers never see a partial file
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, cells=self.cells, aqi=self.aqi, horizons=self.horizons,
+                 generated_at=np.float64(self.generated_at))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["cells"], data["aqi"], data["horizons"], float(data["generated_at"]))
+
+
+class ForecastService:
+    """
+    Multi-horizon AQI forecasts for every location in the measurement store.
+
+    A batch job scores all cells in one vectorized model call (from each
+    cell's latest readings) and stores the result as a ForecastTable on disk.
+    The API only ever looks forecasts up. The job runs inside the app at
+    startup when the table is missing or older than refresh_seconds, and
+    whenever it comes due after that; while there are no recent readings to
+    score it is skipped and checked again every check_seconds. With several
+    worker processes one of them (whichever takes the shared-cache lock)
+    computes the table from the readings in the database, which every worker
+    writes to; the others reload the file when its mtime changes. It can
+    also be run standalone:
+
+        PYTHONPATH=backend python -m app.services.forecast_service  # from the repo root
+    """
+
+    def __init__(self, model_path: str = FORECAST_MODEL_PATH, forecast_path: str = FORECAST_PATH,
+                 refresh_seconds: float = REFRESH_SECONDS, store=measurement_store, shared=shared_cache,
+                 check_seconds: float = CHECK_SECONDS, max_reading_age: float = MAX_READING_AGE_SECONDS):
+        self.model_path = model_path
+        self.forecast_path = forecast_path
+        self.refresh_seconds = refresh_seconds
+        self.check_seconds = min(check_seconds, refresh_seconds)
+        self.max_reading_age = max_reading_age
+        self.store = store
+        self.shared = shared
+        self.engine = None
+        self.table = None
+        self._table_mtime = None
+        self._task = None
+
+    def load(self) -> None:
+        """Load the model (once) and the table file if it changed. Blocking."""
+        if self.engine is None and model_exists(self.model_path):
+            self.engine = InferenceEngine.load(self.model_path)
+        self.reload()
+
+    def reload(self) -> None:
+        """Load the table file if it changed since we last loaded or wrote it."""
+        try:
+            mtime = os.path.getmtime(self.forecast_path)
+        except FileNotFoundError:
+            return
+        if mtime != self._table_mtime:
+            self.table = ForecastTable.load(self.forecast_path)
+            self._table_mtime = mtime
+
+    def is_due(self) -> bool:
+        return self.table is None or time.time() - self.table.generated_at >= self.refresh_seconds
+
+    def lookup(self, lat: float, lon: float):
+        """(horizons, float32 AQI per horizon, generated_at) for a location, or None."""
+        if self.table is None:
+            return None
+        row = self.table.get(snap_to_cell(lat, lon))
+        if row is None:
+            return None
+        return self.table.horizons, row, self.table.generated_at
+
+    def has_recent_readings(self) -> bool:
+        """Whether this process has seen a reading within max_reading_age."""
+        since = time.time() - self.max_reading_age
+        return any(
+            series is not None and series.latest_time() >= since
+            for series in map(self.store.series, self.store.cells())
+        )
+
+    async def readings(self) -> tuple:
+        """
+        (cells, recent) with each recently seen cell's last rolling_window
+        readings: from the database when there is one, so every worker's
+        readings count, else from this process's buffers.
+        """
+        since = time.time() - self.max_reading_age
+        await self.store.flush()
+        windows = await asyncio.to_thread(self.store.latest_windows, self.engine.rolling_window, since)
+        return windows if windows is not None else self.snapshot(since)
+
+    def snapshot(self, since: float = None) -> tuple:
+        """Copy each cell's last rolling_window buffered readings (cheap, on the event loop)."""
+        window = self.engine.rolling_window
+        cells, recent = [], []
+        for cell in self.store.cells():
+            series = self.store.series(cell)
+            if series is None or not series.count:
+                continue
+            if since is not None and series.latest_time() < since:
+                continue
+            _, values = series.history()
+            cells.append(cell)
+            recent.append(values[-window:].copy())
+        return cells, recent
+
+    def compute(self, cells: list, recent: list) -> ForecastTable:
+        """Score every cell's latest reading in one model call."""
+        horizons = np.array(self.engine.metadata.get("horizons", []), dtype=np.int16)
+        if not cells:
+            return ForecastTable(np.empty((0, 2), np.int32), np.empty((0, len(horizons)), np.float32),
+                                 horizons, time.time())
+        # Featurize each cell's latest reading with its own preceding readings
+        X = np.stack([self.engine.build_features_batch(values, ordered=True)[-1] for values in recent])
+        aqi = np.asarray(self.engine.predict(X), dtype=np.float32).reshape(len(cells), -1)
+        return ForecastTable(np.array(cells, dtype=np.int32), aqi, horizons, time.time())
+
+    async def refresh(self) -> None:
+        await asyncio.to_thread(self.load)
+        if self.engine is None:
+            return
+        await self._build(*await self.readings())
+
+    async def _build(self, cells: list, recent: list) -> None:
+        table = await asyncio.to_thread(self.compute, cells, recent)
+        await asyncio.to_thread(table.save, self.forecast_path)
+        self.table = table
+        self._table_mtime = os.path.getmtime(self.forecast_path)
+
+    def start(self) -> None:
+        # The model and table are loaded by the task, off the event loop
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # The first check runs right away, so a missing or stale table is
+        # rebuilt at startup instead of after a full interval
+        while True:
+            try:
+                await asyncio.to_thread(self.load)
+                # Nothing to score yet (e.g. a fresh start): check again next
+                # tick rather than taking the lock for the whole interval
+                if (self.engine is not None and self.is_due() and self.has_recent_readings()
+                        and await self.shared.add("lock:forecast", b"1", self.refresh_seconds * 0.9)):
+                    await self._build(*await self.readings())
+            except Exception as e:
+                logger.exception("Error computing forecasts: %s", e)
+                metrics.ERRORS.labels("forecast").inc()
+            await asyncio.sleep(self.check_seconds)
+
+
+# Global instance
+forecast_service = ForecastService()
+
+
+async def _run_batch_job() -> None:
+    await measurement_store.start()
+    try:
+        await forecast_service.refresh()
+        if forecast_service.table is None:
+            print(f"No forecast model at {forecast_service.model_path}; run ml_engine/train_forecast.py first.")
+        else:
+            print(f"Forecasts for {len(forecast_service.table)} locations saved to {forecast_service.forecast_path}")
+    finally:
+        await measurement_store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_run_batch_job())
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+import numpy as np
+from app.services import metrics
+from app.services.tree_predictor import TreeEnsemble
+
+# Raw request fields, in the order they are packed into the input vector
+RAW_FEATURES = ["pm25", "pm10", "no2", "so2", "co", "o3", "temperature", "humidity", "wind_speed"]
+LAG_SUFFIX = "_lag1"
+ROLLING_SUFFIX = "_rolling_mean_3"
+DEFAULT_ROLLING_WINDOW = 3
+
+
+def schema_path_for(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".features.json"
+
+
+def trees_path_for(model_path: str) -> str:
+    """Exported trees for a .joblib model (see ml_engine/export_trees.py)."""
+    return os.path.splitext(model_path)[0] + ".trees"
+
+
+def model_exists(model_path: str) -> bool:
+    """
+    Whether InferenceEngine.load can serve `model_path`: the .joblib itself,
+    or its exported trees and schema. Only the latter are checked in; the
+    pickle is a training output.
+    """
+    if os.path.exists(model_path):
+        return True
+    return os.path.exists(schema_path_for(model_path)) and os.path.isdir(trees_path_for(model_path))
+
+
+class _BoosterPredictor:
+    """Fallback for models without exported trees: needs xgboost installed."""
+
+    def __init__(self, booster):
+        self.booster = booster
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.booster.inplace_predict(X, validate_features=False)
+
+
+class InferenceEngine:
+    """
+    Serves the trained model with the exact feature layout it was trained on.
+
+    Column positions are resolved once at load time, so building a request's
+    feature vector is a handful of NumPy fancy-index assignments. The model
+    itself is normally a TreeEnsemble evaluated in NumPy; xgboost is only
+    imported for models that have not been exported to arrays.
+    """
+
+    def __init__(self, predictor, features: list, rolling_window: int = DEFAULT_ROLLING_WINDOW,
+                 metadata: dict = None, name: str = None):
+        self.predictor = predictor
+        self.features = list(features)
+        self.rolling_window = rolling_window
+        # The full schema file, for model-specific extras (e.g. forecast horizons)
+        self.metadata = metadata or {}
+        # Label for the inference metrics: registry version or model file name
+        self.name = name or self.metadata.get("version") or "model"
+        self._inference_seconds = metrics.INFERENCE_SECONDS.labels(self.name)
+        self._inference_rows = metrics.INFERENCE_ROWS.labels(self.name)
+
+        index = {name: i for i, name in enumerate(self.features)}
+        missing = [name for name in RAW_FEATURES if name not in index]
+        if missing:
+            raise ValueError(f"Model schema is missing raw features: {missing}")
+        self._raw_dst = np.array([index[name] for name in RAW_FEATURES])
+
+        # Raw columns that also have lag / rolling features, as positions in
+        # the raw vector (src) and in the model vector (dst)
+        lagged = [i for i, name in enumerate(RAW_FEATURES) if name + LAG_SUFFIX in index]
+        rolled = [i for i, name in enumerate(RAW_FEATURES) if name + ROLLING_SUFFIX in index]
+        self._lag_src = np.array(lagged, dtype=np.intp)
+        self._lag_dst = np.array([index[RAW_FEATURES[i] + LAG_SUFFIX] for i in lagged], dtype=np.intp)
+        self._roll_src = np.array(rolled, dtype=np.intp)
+        self._roll_dst = np.array([index[RAW_FEATURES[i] + ROLLING_SUFFIX] for i in rolled], dtype=np.intp)
+
+    @classmethod
+    def load(cls, model_path: str):
+        """Load a .joblib model, preferring its exported trees when present."""
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        schema_path = schema_path_for(model_path)
+        schema = None
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                schema = json.load(f)
+
+        trees_path = trees_path_for(model_path)
+        if schema is not None and os.path.isdir(trees_path):
+            predictor = TreeEnsemble.load(trees_path)
+            return cls(predictor, schema["features"], schema.get("rolling_window", DEFAULT_ROLLING_WINDOW), schema, name)
+
+        import joblib
+        model = joblib.load(model_path)
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        if schema is not None:
+            return cls(_BoosterPredictor(booster), schema["features"],
+                       schema.get("rolling_window", DEFAULT_ROLLING_WINDOW), schema, name)
+        # Older models: XGBoost keeps the training column names on the booster
+        if not booster.feature_names:
+            raise ValueError(f"No feature schema found for {model_path}")
+        return cls(_BoosterPredictor(booster), booster.feature_names, name=name)
+
+    @classmethod
+    def load_native(cls, version_dir: str):
+        """
+        Load a model registry version from its manifest: the exported trees/
+        arrays when present, else the XGBoost UBJSON booster.
+        """
+        with open(os.path.join(version_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        trees_path = os.path.join(version_dir, "trees")
+        if os.path.isdir(trees_path):
+            predictor = TreeEnsemble.load(trees_path)
+        else:
+            import xgboost as xgb
+            booster = xgb.Booster(model_file=os.path.join(version_dir, manifest.get("model_file", "model.ubj")))
+            predictor = _BoosterPredictor(booster)
+        return cls(predictor, manifest["features"], manifest.get("rolling_window", DEFAULT_ROLLING_WINDOW), manifest)
+
+    def build_features(self, raw: np.ndarray, context=None) -> np.ndarray:
+        """
+        Build one model row from a raw reading and the location's feature
+        context from the measurement store: (previous reading, sum and
+        per-column count of the last rolling_window - 1 readings). Without a
+        context, or where values are missing, the reading is assumed to be
+        steady, so lags and rolling means fall back to the current value.
+        """
+        x = np.empty(len(self.features), dtype=np.float32)
+        x[self._raw_dst] = raw
+
+        if context is None:
+            x[self._lag_dst] = raw[self._lag_src]
+            x[self._roll_dst] = raw[self._roll_src]
+            return x
+
+        previous, recent_sum, recent_count = context
+        lag = previous[self._lag_src]
+        x[self._lag_dst] = np.where(np.isnan(lag), raw[self._lag_src], lag)
+
+        current = raw[self._roll_src]
+        # Pad a short history with the current reading
+        padding = self.rolling_window - recent_count[self._roll_src]
+        x[self._roll_dst] = (recent_sum[self._roll_src] + current * padding) / self.rolling_window
+        return x
+
+    def build_features_batch(self, raw: np.ndarray, ordered: bool = True) -> np.ndarray:
+        """
+        Build model rows for an (n, len(RAW_FEATURES)) array of readings.
+        With `ordered`, rows are treated as one time series (oldest first) and
+        each row's lag/rolling features come from the rows before it, padded
+        with the current reading at the start exactly like build_features.
+        Otherwise every row is scored as if it had no history.
+        """
+        n = raw.shape[0]
+        X = np.empty((n, len(self.features)), dtype=np.float32)
+        X[:, self._raw_dst] = raw
+        if not ordered or n == 0:
+            X[:, self._lag_dst] = raw[:, self._lag_src]
+            X[:, self._roll_dst] = raw[:, self._roll_src]
+            return X
+
+        lag = raw[:, self._lag_src]
+        X[1:, self._lag_dst] = lag[:-1]
+        X[0, self._lag_dst] = lag[0]
+
+        current = raw[:, self._roll_src]
+        total = current.copy()
+        for k in range(1, self.rolling_window):
+            shifted = current.copy()
+            shifted[k:] = current[:-k]
+            total += shifted
+        X[:, self._roll_dst] = total / self.rolling_window
+        return X
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict AQI for a 2-D float32 array of model rows."""
+        started = time.perf_counter()
+        predictions = self.predictor.predict(X)
+        self._inference_seconds.observe(time.perf_counter() - started)
+        self._inference_rows.inc(len(X))
+        return predictions
+
+    def predict_one(self, raw: np.ndarray, context=None) -> float:
+        x = self.build_features(raw, context)
+        return float(self.predict(x[np.newaxis, :])[0])
+
+
+def raw_vector(data) -> np.ndarray:
+    """Pack an AQIPredictionInput (or anything with the same attributes)."""
+    return np.array([getattr(data, name) for name in RAW_FEATURES], dtype=np.float32)
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import os
+from app.services import metrics
+from app.services.aqi_cache import location_cache, cell_center
+from app.services.external_aqi import fetch_aqi_batch, fetch_aqi_by_location
+
+# How often each subscribed cell is refreshed. Lookups go through the
+# location cache, so a cell costs an upstream call only once its entry expires
+REFRESH_SECONDS = float(os.getenv("LIVE_FEED_REFRESH_SECONDS", "60"))
+MAX_CONNECTIONS = int(os.getenv("LIVE_FEED_MAX_CONNECTIONS", "10000"))
+MAX_SUBSCRIPTIONS = int(os.getenv("LIVE_FEED_MAX_SUBSCRIPTIONS", "10"))
+# A client that takes longer than this to accept one message is disconnected
+SEND_TIMEOUT_SECONDS = float(os.getenv("LIVE_FEED_SEND_TIMEOUT_SECONDS", "5"))
+MAX_PENDING_REPLIES = 32
+
+logger = logging.getLogger(__name__)
+
+
+def cell_id(cell: tuple) -> str:
+    return f"{cell[0]}:{cell[1]}"
+
+
+def _encode(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"))
+
+
+def diff(old: dict, new: dict) -> dict:
+    """
+    Top-level fields of `new` that differ from `old`, with removed fields as
+    None. A changed nested dict (components, advice) is sent whole, so
+    clients apply a delta with a shallow merge.
+    """
+    changed = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if value != old.get(key):
+            changed[key] = value
+    return changed
+
+
+class CellFeed:
+    """
+    Latest reading for one cell. Each refresh that changes it bumps the
+    version and encodes the snapshot and the delta from the previous version
+    once, however many clients receive them.
+    """
+
+    def __init__(self, cell: tuple):
+        self.cell = cell
+        self.id = cell_id(cell)
+        self.subscribers = set()
+        self.version = 0
+        self.state = None
+        self.snapshot = None
+        self.delta = None
+
+    def update(self, state: dict) -> bool:
+        """Apply a fresh reading; False if nothing changed."""
+        if self.state is not None:
+            changed = diff(self.state, state)
+            if not changed:
+                return False
+            self.delta = _encode({"type": "delta", "cell": self.id, "v": self.version + 1, "data": changed})
+        self.version += 1
+        self.state = state
+        self.snapshot = _encode({"type": "snapshot", "cell": self.id, "v": self.version, "data": state})
+        return True
+
+    def message_for(self, sent_version: int) -> str:
+        """The delta if the client holds the previous version, else the full snapshot."""
+        if self.delta is not None and sent_version == self.version - 1:
+            return self.delta
+        return self.snapshot
+
+
+class Subscriber:
+    """
+    One WebSocket client. Updates are conflated rather than queued: the
+    client has at most one pending update per subscribed cell, and a slow
+    client skips intermediate versions (it gets a snapshot instead of a
+    delta), so its memory stays bounded and it never holds up the refresh
+    loop. A client that stalls a single send past SEND_TIMEOUT_SECONDS, or
+    lets MAX_PENDING_REPLIES replies pile up, is dropped.
+
+    All sends happen in run(), so replies and updates never interleave.
+    """
+
+    def __init__(self, websocket, feed):
+        self.websocket = websocket
+        self.feed = feed
+        self.sent = {}  # cell -> version last sent
+        self._replies = []
+        self._pending = set()
+        self._wakeup = asyncio.Event()
+
+    def reply(self, message: dict) -> None:
+        if len(self._replies) >= MAX_PENDING_REPLIES:
+            raise OverflowError("Client is not reading its replies.")
+        self._replies.append(_encode(message))
+        self._wakeup.set()
+
+    def notify(self, cell: tuple) -> None:
+        self._pending.add(cell)
+        self._wakeup.set()
+
+    async def _send(self, text: str) -> None:
+        try:
+            await asyncio.wait_for(self.websocket.send_text(text), SEND_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.feed.dropped += 1
+            raise
+
+    async def run(self) -> None:
+        """Deliver replies and pending updates until the connection fails or stalls."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            replies, self._replies = self._replies, []
+            for text in replies:
+                await self._send(text)
+            pending, self._pending = self._pending, set()
+            for cell in pending:
+                cell_feed = self.feed.cells.get(cell)
+                # Unsubscribed meanwhile, nothing fetched yet, or already current
+                if cell_feed is None or cell not in self.sent or cell_feed.snapshot is None:
+                    continue
+                if self.sent[cell] == cell_feed.version:
+                    continue
+                # The cell may move on while the send waits on the client
+                version = cell_feed.version
+                message = cell_feed.message_for(self.sent[cell])
+                await self._send(message)
+                if cell in self.sent:  # not unsubscribed meanwhile
+                    self.sent[cell] = version
+                metrics.LIVE_FEED_MESSAGES.labels("delta" if message is cell_feed.delta else "snapshot").inc()
+
+
+class LiveFeed:
+    """
+    Pushes live AQI for subscribed location cells to WebSocket clients.
+
+    Every `refresh_seconds` the cells that have subscribers are looked up in
+    one fetch_aqi_batch call (cache first, then multi-location upstream
+    requests) and each changed cell is fanned out to its subscribers, so the
+    upstream cost depends on the number of distinct cells, not clients.
+    Connections are capped per process.
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, max_connections: int = MAX_CONNECTIONS,
+                 max_subscriptions: int = MAX_SUBSCRIPTIONS, cache=location_cache):
+        self.refresh_seconds = refresh_seconds
+        self.max_connections = max_connections
+        self.max_subscriptions = max_subscriptions
+        self.cache = cache
+        self.cells = {}  # cell -> CellFeed
+        self.subscribers = set()
+        self._task = None
+
+        self.refreshes = 0
+        self.updates = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def connect(self, websocket):
+        """Register a client, or return None when the process is at capacity."""
+        if len(self.subscribers) >= self.max_connections:
+            self.rejected += 1
+            return None
+        subscriber = Subscriber(websocket, self)
+        self.subscribers.add(subscriber)
+        metrics.LIVE_FEED_CONNECTIONS.inc()
+        return subscriber
+
+    def disconnect(self, subscriber: Subscriber) -> None:
+        if subscriber not in self.subscribers:
+            return
+        self.subscribers.discard(subscriber)
+        metrics.LIVE_FEED_CONNECTIONS.dec()
+        for cell in list(subscriber.sent):
+            self._drop(subscriber, cell)
+
+    async def subscribe(self, subscriber: Subscriber, lat: float, lon: float) -> tuple:
+        cell = self.cache.cell_for(lat, lon)
+        if cell in subscriber.sent:
+            return cell
+        if len(subscriber.sent) >= self.max_subscriptions:
+            raise ValueError(f"At most {self.max_subscriptions} subscriptions per connection.")
+        cell_feed = self.cells.get(cell)
+        if cell_feed is None:
+            cell_feed = self.cells[cell] = CellFeed(cell)
+        cell_feed.subscribers.add(subscriber)
+        subscriber.sent[cell] = 0
+        if cell_feed.state is None:
+            # First subscriber: fetch now rather than at the next tick;
+            # concurrent first subscribers share the lookup via the cache
+            result = await fetch_aqi_by_location(*cell_center(cell, self.cache.cell_size))
+            if result["aqi"] != -1:
+                cell_feed.update(result)
+        subscriber.notify(cell)
+        return cell
+
+    def unsubscribe(self, subscriber: Subscriber, cell: tuple) -> None:
+        if cell in subscriber.sent:
+            self._drop(subscriber, cell)
+
+    def _drop(self, subscriber: Subscriber, cell: tuple) -> None:
+        del subscriber.sent[cell]
+        cell_feed = self.cells.get(cell)
+        if cell_feed is not None:
+            cell_feed.subscribers.discard(subscriber)
+            if not cell_feed.subscribers:
+                del self.cells[cell]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.exception("Error refreshing live feed: %s", e)
+                metrics.ERRORS.labels("live_feed").inc()
+
+    async def refresh(self) -> None:
+        cells = list(self.cells)
+        if not cells:
+            return
+        self.refreshes += 1
+        centers = [cell_center(cell, self.cache.cell_size) for cell in cells]
+        for cell, result in zip(cells, await fetch_aqi_batch(centers)):
+            cell_feed = self.cells.get(cell)
+            # Failed lookups keep the last good reading
+            if cell_feed is None or result["aqi"] == -1:
+                continue
+            result = {k: v for k, v in result.items() if k not in ("latitude", "longitude")}
+            if cell_feed.update(result):
+                self.updates += 1
+                for subscriber in cell_feed.subscribers:
+                    subscriber.notify(cell)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.subscribers),
+            "cells": len(self.cells),
+            "subscriptions": sum(len(s.subscribers) for s in self.cells.values()),
+            "refreshes": self.refreshes,
+            "updates": self.updates,
+            "rejected_connections": self.rejected,
+            "dropped_slow_clients": self.dropped,
+            "worker_pid": os.getpid(),
+        }
+
+
+# Global instance; the refresh loop runs with the app lifecycle
+live_feed = LiveFeed()
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+import numpy as np
+from sqlalchemy import (
+    Column, Float, Index, Integer, MetaData, String, Table, bindparam, create_engine, func,
+    inspect, select, text
+)
+from app.services import metrics
+from app.services.aqi_cache import snap_to_cell
+from app.services.inference import RAW_FEATURES, DEFAULT_ROLLING_WINDOW
+
+# docker-compose points this at Postgres; SQLite is the local stand-in
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///airguard.db")
+# Readings kept in memory per location. Open-Meteo readings arrive on every
+# location cache refill (about every AQI_CACHE_TTL_SECONDS, 15 min by default,
+# while a cell is in use) and sensors post at their own pace, so 168 is about
+# the last two days of a busy cell, not a week.
+BUFFER_SIZE = int(os.getenv("MEASUREMENT_BUFFER_SIZE", "168"))
+MAX_LOCATIONS = int(os.getenv("MEASUREMENT_MAX_LOCATIONS", "50000"))
+FLUSH_SECONDS = float(os.getenv("MEASUREMENT_FLUSH_SECONDS", "5"))
+# Unwritten readings kept while the database is unreachable
+MAX_PENDING = int(os.getenv("MEASUREMENT_MAX_PENDING", "100000"))
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+measurements = Table(
+    "measurements", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("latitude", Float, nullable=False, index=True),
+    Column("longitude", Float, nullable=False, index=True),
+    Column("observed_at", Float, nullable=False, index=True),  # unix seconds
+    Column("source", String(32), nullable=False),
+    # Grid cell (aqi_cache.snap_to_cell) the reading was recorded under
+    Column("cell_row", Integer, nullable=True),
+    Column("cell_col", Integer, nullable=True),
+    *[Column(name, Float, nullable=True) for name in RAW_FEATURES],
+)
+cell_index = Index("ix_measurements_cell", measurements.c.cell_row, measurements.c.cell_col,
+                   measurements.c.observed_at)
+
+
+class LocationSeries:
+    """
+    Ring buffer of the last `capacity` readings for one location, with the
+    source of each, plus the running state needed for lag/rolling features
+    and the newest reading from each source.
+
+    `recent_sum` / `recent_count` cover the last `window - 1` readings and
+    are updated in O(1) per append (add the new reading, subtract the one
+    falling out of the window). Missing values (NaN) are tracked per column
+    so they never poison the running sums.
+    """
+
+    def __init__(self, capacity: int = BUFFER_SIZE, window: int = DEFAULT_ROLLING_WINDOW):
+        if capacity < window:
+            raise ValueError("capacity must be at least the rolling window")
+        n = len(RAW_FEATURES)
+        self.window = window
+        self.values = np.full((capacity, n), np.nan, dtype=np.float32)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.sources = [None] * capacity
+        self.count = 0
+        self.recent_sum = np.zeros(n, dtype=np.float64)
+        self.recent_count = np.zeros(n, dtype=np.int32)
+        self.latest_by_source = {}  # source -> (observed_at, values); a handful of sources
+
+    def append(self, observed_at: float, raw: np.ndarray, source: str = None) -> None:
+        capacity = len(self.times)
+        span = self.window - 1
+        if span > 0:
+            present = ~np.isnan(raw)
+            self.recent_sum += np.where(present, raw, 0.0)
+            self.recent_count += present
+            if self.count >= span:
+                dropped = self.values[(self.count - span) % capacity]
+                kept = ~np.isnan(dropped)
+                self.recent_sum -= np.where(kept, dropped, 0.0)
+                self.recent_count -= kept
+        slot = self.count % capacity
+        self.values[slot] = raw
+        self.times[slot] = observed_at
+        self.sources[slot] = source
+        self.count += 1
+        self.latest_by_source[source] = (float(observed_at), self.values[slot].copy())
+
+    def latest(self):
+        if not self.count:
+            return None
+        return self.values[(self.count - 1) % len(self.times)]
+
+    def latest_time(self) -> float:
+        """observed_at of the newest reading (-inf when empty)."""
+        if not self.count:
+            return float("-inf")
+        return float(self.times[(self.count - 1) % len(self.times)])
+
+    def latest_from(self, sources) -> tuple:
+        """(observed_at, values) of the newest reading from one of `sources`, or None."""
+        found = [self.latest_by_source[source] for source in sources if source in self.latest_by_source]
+        return max(found, key=lambda latest: latest[0], default=None)
+
+    def context(self) -> tuple:
+        """(previous reading, sum and per-column count of the last window-1 readings)."""
+        return self.latest(), self.recent_sum, self.recent_count
+
+    def history(self) -> tuple:
+        """All buffered (times, values), oldest first."""
+        capacity = len(self.times)
+        n = min(self.count, capacity)
+        order = (np.arange(self.count - n, self.count)) % capacity
+        return self.times[order], self.values[order]
+
+
+class MeasurementStore:
+    """
+    Per-location time series of readings: in-memory ring buffers for serving,
+    written behind to a SQL database (Postgres in docker-compose, SQLite
+    locally) by a background flush task, and reloaded from it on startup.
+    Locations are grid cells from aqi_cache, so they line up with the
+    location cache.
+    """
+
+    def __init__(self, database_url: str = DATABASE_URL, buffer_size: int = BUFFER_SIZE,
+                 max_locations: int = MAX_LOCATIONS, window: int = DEFAULT_ROLLING_WINDOW):
+        self.database_url = database_url
+        self.buffer_size = buffer_size
+        self.max_locations = max_locations
+        self.window = window
+        self._series = {}
+        self._pending = deque(maxlen=MAX_PENDING)
+        self._db = None
+        self._flusher = None
+        self.dropped = 0
+        self.out_of_order = 0
+
+    def record(self, lat: float, lon: float, raw: np.ndarray,
+               observed_at: float = None, source: str = "api") -> bool:
+        """
+        Append one reading (RAW_FEATURES order, NaN for unknown) in O(1).
+        Readings older than the location's newest one would corrupt the lag
+        and rolling features, so they are rejected; returns whether it was kept.
+        """
+        observed_at = time.time() if observed_at is None else observed_at
+        cell = snap_to_cell(lat, lon)
+        series = self._series_for(cell)
+        if observed_at < series.latest_time():
+            self.out_of_order += 1
+            return False
+        series.append(observed_at, raw, source)
+        if len(self._pending) == MAX_PENDING:
+            # The deque drops the oldest unwritten reading
+            self.dropped += 1
+        self._pending.append((lat, lon, cell, observed_at, source, raw))
+        return True
+
+    def _series_for(self, cell: tuple) -> LocationSeries:
+        series = self._series.get(cell)
+        if series is None:
+            if len(self._series) >= self.max_locations:
+                # Drop the oldest-created location (dicts keep insertion order)
+                del self._series[next(iter(self._series))]
+            series = self._series[cell] = LocationSeries(self.buffer_size, self.window)
+        return series
+
+    def get(self, lat: float, lon: float):
+        return self._series.get(snap_to_cell(lat, lon))
+
+    def series(self, cell: tuple):
+        return self._series.get(cell)
+
+    def context(self, lat: float, lon: float):
+        """Feature context for the next reading at a location, or None."""
+        series = self.get(lat, lon)
+        return series.context() if series is not None and series.count else None
+
+    def cells(self) -> list:
+        return list(self._series)
+
+    def latest_readings(self, sources, since: float = 0.0) -> list:
+        """
+        (cell, observed_at, reading) with each location's newest reading from
+        one of `sources`, for locations where it is at or after `since`.
+        """
+        readings = []
+        for cell, series in self._series.items():
+            latest = series.latest_from(sources)
+            if latest is not None and latest[0] >= since:
+                readings.append((cell, *latest))
+        return readings
+
+    async def start(self) -> None:
+        if self._db is not None:
+            return
+        try:
+            await asyncio.to_thread(self._open)
+            await asyncio.to_thread(self._load)
+        except Exception as e:
+            logger.warning("Measurement store running in memory only: %s", e)
+            self._db = None
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _open(self) -> None:
+        connect_args = {"check_same_thread": False} if self.database_url.startswith("sqlite") else {}
+        self._db = create_engine(self.database_url, pool_pre_ping=True, connect_args=connect_args)
+        metadata.create_all(self._db)
+        with self._db.begin() as conn:
+            self._add_cell_columns(conn)
+
+    def _add_cell_columns(self, conn) -> None:
+        """Add and backfill cell_row / cell_col on tables created before they existed."""
+        if "cell_row" in {column["name"] for column in inspect(conn).get_columns("measurements")}:
+            return
+        conn.execute(text("ALTER TABLE measurements ADD COLUMN cell_row INTEGER"))
+        conn.execute(text("ALTER TABLE measurements ADD COLUMN cell_col INTEGER"))
+        rows = conn.execute(select(measurements.c.id, measurements.c.latitude, measurements.c.longitude))
+        updates = []
+        for row_id, lat, lon in rows:
+            cell_row, cell_col = snap_to_cell(lat, lon)
+            updates.append({"row_id": row_id, "cell_row": cell_row, "cell_col": cell_col})
+        if updates:
+            conn.execute(
+                measurements.update()
+                .where(measurements.c.id == bindparam("row_id"))
+                .values(cell_row=bindparam("cell_row"), cell_col=bindparam("cell_col")),
+                updates,
+            )
+        cell_index.create(conn, checkfirst=True)
+
+    def _latest_rows(self, conn, size: int, since: float = None):
+        """Each location's newest `size` rows (at or after `since`), oldest first."""
+        ranked = select(
+            measurements,
+            func.row_number().over(
+                partition_by=(measurements.c.cell_row, measurements.c.cell_col),
+                order_by=measurements.c.observed_at.desc(),
+            ).label("rank"),
+        )
+        if since is not None:
+            ranked = ranked.where(measurements.c.observed_at >= since)
+        ranked = ranked.subquery()
+        query = (
+            select(ranked)
+            .where(ranked.c.rank <= size)
+            .order_by(ranked.c.observed_at)
+        )
+        for row in conn.execute(query).mappings():
+            raw = np.array([np.nan if row[name] is None else row[name] for name in RAW_FEATURES],
+                           dtype=np.float32)
+            yield (row["cell_row"], row["cell_col"]), row, raw
+
+    def _load(self) -> None:
+        """Warm the ring buffers with the latest buffer_size readings per location."""
+        with self._db.connect() as conn:
+            for cell, row, raw in self._latest_rows(conn, self.buffer_size):
+                self._series_for(cell).append(row["observed_at"], raw, row["source"])
+
+    def latest_windows(self, size: int, since: float = None):
+        """
+        (cells, windows) with each location's last `size` readings as an array,
+        oldest first, read from the database so that readings written by
+        every worker process count. None when running in memory only.
+        Blocking; flush() first to include this process's pending readings.
+        """
+        if self._db is None:
+            return None
+        windows = {}
+        with self._db.connect() as conn:
+            for cell, _, raw in self._latest_rows(conn, size, since):
+                windows.setdefault(cell, []).append(raw)
+        return list(windows), [np.stack(rows) for rows in windows.values()]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._db is None or not self._pending:
+            return
+        batch = list(self._pending)
+        self._pending.clear()
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.warning("Error writing measurements: %s", e)
+            metrics.ERRORS.labels("measurement_store").inc()
+            # Keep them for the next attempt, newest last; whatever no longer
+            # fits is the oldest and is lost
+            kept = batch + list(self._pending)
+            self.dropped += max(0, len(kept) - MAX_PENDING)
+            self._pending = deque(kept, maxlen=MAX_PENDING)
+
+    def _write(self, batch: list) -> None:
+        rows = [
+            {
+                "latitude": lat, "longitude": lon, "observed_at": observed_at, "source": source,
+                "cell_row": cell_row, "cell_col": cell_col,
+                **{name: (None if np.isnan(v) else float(v)) for name, v in zip(RAW_FEATURES, raw)},
+            }
+            for lat, lon, (cell_row, cell_col), observed_at, source, raw in batch
+        ]
+        with self._db.begin() as conn:
+            conn.execute(measurements.insert(), rows)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._db is not None:
+            self._db.dispose()
+            self._db = None
+
+
+# Global instance
+measurement_store = MeasurementStore()
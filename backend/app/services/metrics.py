@@ -0,0 +1,195 @@
+import contextvars
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Fraction of requests whose span timings are logged and returned in a
+# Server-Timing header; 0 disables tracing (one context lookup per span)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Set by serve.py when running several workers, so /metrics aggregates all of them
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "airguard_http_request_duration_seconds", "Time from request to the end of the response body.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "airguard_http_requests_in_flight", "Requests currently being handled.",
+    ["route"], multiprocess_mode="livesum",
+)
+UPSTREAM_SECONDS = Histogram(
+    "airguard_upstream_request_duration_seconds", "Duration of calls to external dependencies.",
+    ["dependency", "outcome"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "airguard_upstream_errors_total", "Failed calls to external dependencies.",
+    ["dependency", "reason"],
+)
+INFERENCE_SECONDS = Histogram(
+    "airguard_model_inference_duration_seconds", "Duration of one vectorized model call.",
+    ["model"], buckets=LATENCY_BUCKETS,
+)
+INFERENCE_ROWS = Counter("airguard_model_inference_rows_total", "Rows scored by the model.", ["model"])
+BREAKER_STATE = Gauge(
+    "airguard_circuit_breaker_state", "Circuit state per dependency: 0 closed, 1 half-open, 2 open.",
+    ["dependency"], multiprocess_mode="livemax",
+)
+BREAKER_TRANSITIONS = Counter(
+    "airguard_circuit_breaker_transitions_total", "Circuit state changes, by the state entered.",
+    ["dependency", "state"],
+)
+BREAKER_REJECTED = Counter(
+    "airguard_circuit_breaker_rejected_total", "Calls refused because the circuit was open.", ["dependency"],
+)
+SPATIAL_ANSWERS = Counter(
+    "airguard_spatial_answers_total", "Location queries answered from nearby samples instead of upstream.",
+    ["method"],
+)
+LIVE_FEED_CONNECTIONS = Gauge(
+    "airguard_live_feed_connections", "Open live-feed WebSocket connections.", multiprocess_mode="livesum",
+)
+LIVE_FEED_MESSAGES = Counter("airguard_live_feed_messages_total", "Live-feed messages sent.", ["kind"])
+ERRORS = Counter(
+    "airguard_errors_total", "Errors handled without failing the request (fallbacks, dropped writes).",
+    ["component"],
+)
+
+
+def observe_upstream(dependency: str, started: float, error: str = None) -> None:
+    """Record a call to `dependency` that began at perf_counter() `started`."""
+    elapsed = time.perf_counter() - started
+    UPSTREAM_SECONDS.labels(dependency, "error" if error else "ok").observe(elapsed)
+    if error:
+        UPSTREAM_ERRORS.labels(dependency, error).inc()
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(dependency, started, elapsed)
+
+
+# Caches report their own stats(); they are read at scrape time, not counted per lookup
+_caches = {}
+
+
+def register_cache(name: str, cache) -> None:
+    _caches[name] = cache
+
+
+class CacheCollector:
+    """Exposes each registered cache's hit ratio, size and hit/miss counters."""
+
+    def collect(self):
+        # With several workers each scrape is answered by one of them, so
+        # cache series carry the worker's pid
+        labels = ["cache", "pid"] if MULTIPROCESS_DIR else ["cache"]
+        extra = [str(os.getpid())] if MULTIPROCESS_DIR else []
+        ratio = GaugeMetricFamily("airguard_cache_hit_ratio", "Cache hits over lookups since start.", labels=labels)
+        entries = GaugeMetricFamily("airguard_cache_entries", "Entries currently cached.", labels=labels)
+        events = CounterMetricFamily("airguard_cache_events", "Cache hits and misses by kind.",
+                                     labels=labels + ["event"])
+        for name, cache in _caches.items():
+            stats = cache.stats()
+            ratio.add_metric([name] + extra, stats.get("hit_ratio", 0.0))
+            if "entries" in stats:
+                entries.add_metric([name] + extra, stats["entries"])
+            for key, value in stats.items():
+                if key.endswith(("hits", "misses", "coalesced")):
+                    events.add_metric([name] + extra + [key], value)
+        yield ratio
+        yield entries
+        yield events
+
+
+REGISTRY.register(CacheCollector())
+
+
+def render() -> tuple:
+    """(body, content type) for a /metrics response."""
+    if MULTIPROCESS_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(CacheCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_worker_exit() -> None:
+    """Drop this worker's live gauges from the multiprocess aggregate."""
+    if MULTIPROCESS_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class Trace:
+    """Span timings for one sampled request, as (name, start offset, duration) in seconds."""
+
+    __slots__ = ("started", "spans")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name: str, started: float, elapsed: float) -> None:
+        self.spans.append((name, started - self.started, elapsed))
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={elapsed * 1000:.2f}" for name, _, elapsed in self.spans)
+
+    def describe(self) -> str:
+        return " ".join(f"{name}@{offset * 1000:.1f}ms+{elapsed * 1000:.2f}ms"
+                        for name, offset, elapsed in self.spans)
+
+
+# Set by the metrics middleware for sampled requests only; tasks started
+# while handling a request inherit it
+_current_trace = contextvars.ContextVar("airguard_trace", default=None)
+
+
+def start_trace() -> tuple:
+    """Begin tracing the current request; returns (trace, token for end_trace)."""
+    trace = Trace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token) -> None:
+    _current_trace.reset(token)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, self.started, time.perf_counter() - self.started)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Context manager timing a block as a span of the current trace, if any."""
+    trace = _current_trace.get()
+    return _NO_SPAN if trace is None else _Span(trace, name)
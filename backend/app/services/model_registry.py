@@ -0,0 +1,302 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from app.services import metrics
+from app.services.aqi_service import classify_aqi
+from app.services.batching import MicroBatcher
+from app.services.inference import InferenceEngine, model_exists
+
+# Layout and pointer files are written by ml_engine/registry.py
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "ml_engine/registry")
+# Served when the registry has no active version (models trained before it existed)
+LEGACY_MODEL_PATH = os.getenv("MODEL_PATH", "ml_engine/aqi_xgboost_model.joblib")
+WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "5"))
+# Fraction of /predict-aqi requests also scored by the shadow model
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1.0"))
+# Shadow predictions further than this from the served AQI are logged
+SHADOW_LOG_DIVERGENCE = float(os.getenv("SHADOW_LOG_DIVERGENCE", "25"))
+# How long a replaced model keeps serving requests already queued for it
+RETIRE_GRACE_SECONDS = 5.0
+# Version names are single directory names (registry.py uses timestamps);
+# anything else, such as "../x", is refused before it reaches a path
+VERSION_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}")
+
+logger = logging.getLogger(__name__)
+
+
+class ServedModel:
+    """One loaded model version with its own micro-batcher."""
+
+    def __init__(self, version: str, engine: InferenceEngine):
+        self.version = version
+        self.engine = engine
+        self.loaded_at = time.time()
+        # Rows are built with this engine's schema, so they are batched and
+        # scored by this engine only, even while a newer version takes over
+        self.batcher = MicroBatcher(engine.predict)
+
+    async def predict(self, raw, context=None) -> float:
+        # Includes time spent queued for the batch
+        with metrics.span("inference"):
+            return await self.batcher.submit(self.engine.build_features(raw, context))
+
+    def describe(self) -> dict:
+        manifest = self.engine.metadata
+        return {
+            "version": self.version,
+            "created_at": manifest.get("created_at"),
+            "loaded_at": self.loaded_at,
+            "features": len(self.engine.features),
+            "metrics": manifest.get("metrics", {}),
+        }
+
+
+class ShadowStats:
+    """Running divergence between shadow and served predictions."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.scored = 0
+        self.failed = 0
+        self.total_abs_diff = 0.0
+        self.max_abs_diff = 0.0
+        self.category_mismatches = 0
+        self.logged = 0
+
+    def stats(self) -> dict:
+        return {
+            "scored": self.scored,
+            "failed": self.failed,
+            "mean_abs_diff": (self.total_abs_diff / self.scored) if self.scored else 0.0,
+            "max_abs_diff": self.max_abs_diff,
+            "category_mismatch_ratio": (self.category_mismatches / self.scored) if self.scored else 0.0,
+            "logged": self.logged,
+        }
+
+
+class ModelRegistry:
+    """
+    Serves the registry's active model and hot-swaps it without downtime.
+
+    A new version is loaded (native UBJSON, no pickle) in a worker thread
+    while the current one keeps serving; the swap is a single reference
+    assignment, so each request uses whichever model it started with. The
+    replaced model keeps its batcher running for a grace period so queued
+    rows still complete. Swaps are triggered by the `active` pointer file
+    changing (polled every MODEL_WATCH_SECONDS) or by the admin endpoints.
+
+    An optional shadow version scores a sample of live traffic off the
+    request path; divergence from the served prediction is tracked and
+    large differences are logged, but shadow results are never returned.
+    """
+
+    def __init__(self, registry_dir: str = MODEL_REGISTRY_DIR, legacy_path: str = LEGACY_MODEL_PATH,
+                 watch_seconds: float = WATCH_SECONDS, shadow_sample_rate: float = SHADOW_SAMPLE_RATE,
+                 log_divergence: float = SHADOW_LOG_DIVERGENCE):
+        self.registry_dir = registry_dir
+        self.legacy_path = legacy_path
+        self.watch_seconds = watch_seconds
+        self.shadow_sample_rate = shadow_sample_rate
+        self.log_divergence = log_divergence
+        self.active = None
+        self.shadow = None
+        self.shadow_stats = ShadowStats()
+        self.swaps = 0
+        self._lock = asyncio.Lock()
+        self._watcher = None
+        self._background = set()
+        # Replaced models whose batchers are still open for the grace period
+        self._retired = set()
+
+    # Registry files
+
+    def _read_pointer(self, name: str):
+        try:
+            with open(os.path.join(self.registry_dir, name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _version_dir(self, version: str) -> str:
+        if not isinstance(version, str) or not VERSION_PATTERN.fullmatch(version):
+            raise ValueError(f"Invalid model version {version!r}")
+        return os.path.join(self.registry_dir, version)
+
+    def _write_pointer(self, name: str, version) -> None:
+        path = os.path.join(self.registry_dir, name)
+        if version is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        self._version_dir(version)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp_path, path)
+
+    def versions(self) -> list:
+        if not os.path.isdir(self.registry_dir):
+            return []
+        manifests = []
+        for name in sorted(os.listdir(self.registry_dir)):
+            path = os.path.join(self.registry_dir, name, "manifest.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    manifests.append(json.load(f))
+        return manifests
+
+    async def _load(self, version: str) -> ServedModel:
+        version_dir = self._version_dir(version)
+        if not os.path.exists(os.path.join(version_dir, "manifest.json")):
+            raise ValueError(f"No model version {version!r} in {self.registry_dir}")
+        engine = await asyncio.to_thread(InferenceEngine.load_native, version_dir)
+        model = ServedModel(version, engine)
+        await model.batcher.start()
+        return model
+
+    # Swapping
+
+    async def activate(self, version: str, persist: bool = False) -> None:
+        """
+        Serve `version`. With `persist`, the `active` pointer is updated too,
+        so the watcher (and other workers, and restarts) agree with the swap.
+        """
+        async with self._lock:
+            if self.active is None or self.active.version != version:
+                model = await self._load(version)
+                previous, self.active = self.active, model
+                self.swaps += 1
+                logger.info("Serving model version %s", version)
+                self._retire(previous)
+            if persist:
+                await asyncio.to_thread(self._write_pointer, "active", version)
+
+    async def set_shadow(self, version, persist: bool = False) -> None:
+        """Start shadowing a version, or stop shadowing with None."""
+        async with self._lock:
+            await self._set_shadow(version)
+            if persist:
+                await asyncio.to_thread(self._write_pointer, "shadow", version)
+
+    async def _set_shadow(self, version) -> None:
+        if version is None:
+            previous, self.shadow = self.shadow, None
+        elif self.shadow is not None and self.shadow.version == version:
+            return
+        else:
+            model = await self._load(version)
+            previous, self.shadow = self.shadow, model
+            logger.info("Shadowing model version %s", version)
+        self.shadow_stats.reset()
+        self._retire(previous)
+
+    def _retire(self, model) -> None:
+        if model is not None:
+            self._retired.add(model)
+            self._spawn(self._close_later(model))
+
+    async def _close_later(self, model: ServedModel) -> None:
+        await asyncio.sleep(RETIRE_GRACE_SECONDS)
+        self._retired.discard(model)
+        await model.batcher.close()
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _sync(self) -> None:
+        """Bring the loaded models in line with the pointer files."""
+        active = self._read_pointer("active")
+        if active is not None:
+            await self.activate(active)
+        shadow = self._read_pointer("shadow")
+        if (self.shadow.version if self.shadow else None) != shadow:
+            await self.set_shadow(shadow)
+
+    async def start(self) -> None:
+        try:
+            await self._sync()
+        except Exception as e:
+            logger.exception("Error loading model registry: %s", e)
+        if self.active is None and model_exists(self.legacy_path):
+            # e.g. a joblib-only model in an image without xgboost: start
+            # without a model (predictions return 503) rather than not at all
+            try:
+                engine = await asyncio.to_thread(InferenceEngine.load, self.legacy_path)
+            except Exception as e:
+                logger.exception("Error loading model %s: %s", self.legacy_path, e)
+            else:
+                self.active = ServedModel(os.path.basename(self.legacy_path), engine)
+                await self.active.batcher.start()
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.watch_seconds)
+            try:
+                await self._sync()
+            except Exception as e:
+                # Keep serving the current model; retried on the next poll
+                logger.exception("Error reloading model: %s", e)
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        for task in list(self._background):
+            task.cancel()
+        # Retired models are closed here, not left to their cancelled timers
+        retired, self._retired = self._retired, set()
+        for model in (self.active, self.shadow, *retired):
+            if model is not None:
+                await model.batcher.close()
+
+    # Shadow scoring
+
+    def observe(self, raw, context, served_aqi: float) -> None:
+        """Score a served request on the shadow model in the background."""
+        shadow = self.shadow
+        if shadow is None or random.random() >= self.shadow_sample_rate:
+            return
+        self._spawn(self._score_shadow(shadow, raw, context, served_aqi))
+
+    async def _score_shadow(self, shadow: ServedModel, raw, context, served_aqi: float) -> None:
+        stats = self.shadow_stats
+        try:
+            aqi = await shadow.predict(raw, context)
+        except Exception:
+            stats.failed += 1
+            return
+        diff = abs(aqi - served_aqi)
+        stats.scored += 1
+        stats.total_abs_diff += diff
+        stats.max_abs_diff = max(stats.max_abs_diff, diff)
+        if classify_aqi(aqi)["category"] != classify_aqi(served_aqi)["category"]:
+            stats.category_mismatches += 1
+        if diff >= self.log_divergence:
+            stats.logged += 1
+            logger.info("Shadow model %s diverged: served %.1f, shadow %.1f", shadow.version, served_aqi, aqi)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active.describe() if self.active else None,
+            "shadow": self.shadow.describe() if self.shadow else None,
+            "shadow_divergence": self.shadow_stats.stats(),
+            "swaps": self.swaps,
+        }
+
+
+# Global instance, started from the API startup hook
+model_registry = ModelRegistry()
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import time
+from app.services import metrics
+from app.services.aqi_cache import location_cache
+from app.services.external_aqi import BATCH_CHUNK_SIZE, refresh_cells
+from app.services.shared_cache import shared_cache
+
+# Heavy-hitter counters kept (bounded memory regardless of traffic)
+TRACKED_CELLS = int(os.getenv("PREFETCH_TRACKED_CELLS", "1000"))
+# Hottest cells kept warm, and how often a cell must be asked for to qualify
+TOP_CELLS = int(os.getenv("PREFETCH_TOP_CELLS", "100"))
+MIN_REQUESTS = int(os.getenv("PREFETCH_MIN_REQUESTS", "2"))
+# Refresh cells whose cache entry expires within this many seconds
+LEAD_SECONDS = float(os.getenv("PREFETCH_LEAD_SECONDS", "120"))
+INTERVAL_SECONDS = float(os.getenv("PREFETCH_INTERVAL_SECONDS", "30"))
+# Upstream request budget for prefetching
+REQUESTS_PER_MINUTE = float(os.getenv("PREFETCH_REQUESTS_PER_MINUTE", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class HeavyHitters:
+    """
+    Space-Saving top-k counter: at most `capacity` cells are tracked. A new
+    cell replaces the least-counted one and inherits its count, so counts
+    overestimate by at most the evicted count (kept as `error`). Counts are
+    halved by `decay()` so popularity follows recent traffic.
+
+    Cells are also grouped by count (the stream-summary structure) with the
+    smallest count tracked, so `add()` is O(1): counts only ever grow by
+    one, and finding an eviction victim never scans the tracked cells.
+    """
+
+    def __init__(self, capacity: int = TRACKED_CELLS):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._buckets = {}  # count -> {cell: None}, insertion-ordered
+        self._min_count = 0
+
+    def add(self, cell: tuple) -> None:
+        count = self.counts.get(cell)
+        if count is not None:
+            self._unlink(cell, count)
+            self._link(cell, count + 1)
+            if count == self._min_count and count not in self._buckets:
+                self._min_count = count + 1
+            return
+        if len(self.counts) < self.capacity:
+            self.errors[cell] = 0
+            self._link(cell, 1)
+            self._min_count = 1
+            return
+        # Evict the cell that has sat longest at the smallest count
+        floor = self._min_count
+        victim = next(iter(self._buckets[floor]))
+        self._unlink(victim, floor)
+        del self.counts[victim], self.errors[victim]
+        self.errors[cell] = floor
+        self._link(cell, floor + 1)
+        if floor not in self._buckets:
+            self._min_count = floor + 1
+
+    def _link(self, cell: tuple, count: int) -> None:
+        self.counts[cell] = count
+        self._buckets.setdefault(count, {})[cell] = None
+
+    def _unlink(self, cell: tuple, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[cell]
+        if not bucket:
+            del self._buckets[count]
+
+    def top(self, n: int, min_count: int = 1) -> list:
+        """Up to n cells whose guaranteed count is at least min_count, hottest first."""
+        ranked = sorted(self.counts, key=self.counts.get, reverse=True)
+        return [c for c in ranked if self.counts[c] - self.errors[c] >= min_count][:n]
+
+    def decay(self) -> None:
+        for cell in list(self.counts):
+            self.counts[cell] //= 2
+            self.errors[cell] //= 2
+            if self.counts[cell] == 0:
+                del self.counts[cell], self.errors[cell]
+        self._buckets = {}
+        for cell, count in self.counts.items():
+            self._buckets.setdefault(count, {})[cell] = None
+        self._min_count = min(self._buckets, default=0)
+
+
+class PrefetchScheduler:
+    """
+    Keeps the most requested location cells warm in the geo cache.
+
+    Every `interval` seconds the hottest cells whose entries are missing or
+    about to expire are refreshed with multi-location upstream calls. A
+    token bucket holds upstream traffic to `requests_per_minute`; cells that
+    do not fit in the budget wait for the next tick, hottest first.
+
+    Every worker process runs its own scheduler. Before refreshing, due
+    cells are looked up in the shared cache tier (another worker may have
+    refreshed them already) and each remaining cell is claimed there, so a
+    cell is refreshed by one worker per lead window.
+    """
+
+    def __init__(self, cache=location_cache, interval: float = INTERVAL_SECONDS,
+                 lead: float = LEAD_SECONDS, top: int = TOP_CELLS, min_requests: int = MIN_REQUESTS,
+                 requests_per_minute: float = REQUESTS_PER_MINUTE, tracked: int = TRACKED_CELLS,
+                 shared=shared_cache):
+        self.cache = cache
+        self.shared = shared
+        self.interval = interval
+        self.lead = lead
+        self.top = top
+        self.min_requests = min_requests
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1.0, requests_per_minute * interval / 60.0)
+        self.hitters = HeavyHitters(tracked)
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._task = None
+        self._ticks = 0
+
+        self.refreshed_cells = 0
+        self.upstream_requests = 0
+        self.deferred_cells = 0
+
+    def record(self, lat: float, lon: float) -> None:
+        self.hitters.add(self.cache.cell_for(lat, lon))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.exception("Error prefetching AQI: %s", e)
+                metrics.ERRORS.labels("prefetch").inc()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _due(self, cells: list) -> list:
+        due = []
+        for cell in cells:
+            remaining = self.cache.ttl_remaining(cell)
+            if remaining is None or remaining <= self.lead:
+                due.append(cell)
+        return due
+
+    async def _claim(self, cells: list) -> list:
+        claims = await asyncio.gather(*(
+            self.shared.add(f"prefetch:{self.cache.shared_key(cell)}", b"1", self.lead) for cell in cells
+        ))
+        return [cell for cell, claimed in zip(cells, claims) if claimed]
+
+    async def tick(self) -> None:
+        self._refill()
+        due = self._due(self.hitters.top(self.top, self.min_requests))
+        if due:
+            # Pick up what other workers refreshed, then claim the rest
+            await self.cache.fetch_shared(due)
+            due = self._due(due)
+
+        affordable = due[:int(self._tokens) * BATCH_CHUNK_SIZE]
+        self.deferred_cells = len(due) - len(affordable)
+        batch = await self._claim(affordable) if affordable else []
+        if batch:
+            requests = await refresh_cells(batch)
+            self._tokens -= requests
+            self.upstream_requests += requests
+            self.refreshed_cells += len(batch)
+
+        # Roughly every ten minutes, let old popularity fade
+        self._ticks += 1
+        if self._ticks * self.interval >= 600:
+            self._ticks = 0
+            self.hitters.decay()
+
+    def stats(self) -> dict:
+        return {
+            "tracked_cells": len(self.hitters.counts),
+            "refreshed_cells": self.refreshed_cells,
+            "upstream_requests": self.upstream_requests,
+            "deferred_cells": self.deferred_cells,
+            "budget_tokens": round(self._tokens, 2),
+        }
+
+
+# Global instance, started from the app startup hook
+location_prefetcher = PrefetchScheduler()
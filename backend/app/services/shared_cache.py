@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from app.services import metrics
+
+# Set to share caches between worker processes (docker-compose runs Redis);
+# without it every process keeps its own in-memory stand-in
+REDIS_URL = os.getenv("REDIS_URL")
+KEY_PREFIX = os.getenv("SHARED_CACHE_PREFIX", "airguard:")
+# Per-operation timeout; a slow or unreachable Redis is treated as a miss
+TIMEOUT_SECONDS = float(os.getenv("SHARED_CACHE_TIMEOUT_SECONDS", "0.05"))
+# After a failure, skip Redis for this long instead of paying the timeout on every request
+RETRY_AFTER_SECONDS = float(os.getenv("SHARED_CACHE_RETRY_AFTER_SECONDS", "5"))
+# Entry cap for the in-process stand-in (least recently used are evicted)
+LOCAL_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_LOCAL_MAX_ENTRIES", "10000"))
+
+logger = logging.getLogger(__name__)
+
+
+class LocalSharedCache:
+    """
+    In-process stand-in for the shared cache tier, with the same interface
+    as RedisSharedCache. Used for a single worker and in tests. Holds at
+    most `max_entries` keys, evicting the least recently used.
+    """
+
+    def __init__(self, clock=time.monotonic, max_entries: int = LOCAL_MAX_ENTRIES):
+        self._clock = clock
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self._clock():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def get(self, key: str):
+        return self._get(key)
+
+    async def get_many(self, keys: list) -> list:
+        return [self._get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def set_many(self, items: dict, ttl: float) -> None:
+        for key, value in items.items():
+            await self.set(key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Set only if absent; True if this call set it (used as a lock)."""
+        if self._get(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "local",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class RedisSharedCache(LocalSharedCache):
+    """
+    Cache tier shared by all worker processes, backed by Redis.
+
+    Every call is bounded by a short timeout and failures degrade to a
+    miss (or a no-op write), so Redis trouble costs cache hits, not
+    requests. After a failure Redis is skipped for RETRY_AFTER_SECONDS.
+    """
+
+    def __init__(self, url: str, prefix: str = KEY_PREFIX, timeout: float = TIMEOUT_SECONDS,
+                 retry_after: float = RETRY_AFTER_SECONDS, clock=time.monotonic):
+        super().__init__(clock)
+        self.url = url
+        self.prefix = prefix
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._redis = None
+        self._down_until = 0.0
+
+    async def start(self) -> None:
+        if self._redis is None:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.url, socket_timeout=self.timeout,
+                                         socket_connect_timeout=self.timeout)
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _call(self, fn, *args, default=None):
+        if self._redis is None:
+            await self.start()
+        if self._clock() < self._down_until:
+            return default
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(fn(*args), self.timeout)
+        except Exception as e:
+            metrics.observe_upstream("redis", started, type(e).__name__)
+            self.errors += 1
+            self._down_until = self._clock() + self.retry_after
+            logger.warning("Shared cache unavailable, using local state only: %r", e)
+            return default
+        metrics.observe_upstream("redis", started)
+        return result
+
+    async def get(self, key: str):
+        value = await self._call(self._redis_get, self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def _redis_get(self, key):
+        return await self._redis.get(key)
+
+    async def get_many(self, keys: list) -> list:
+        if not keys:
+            return []
+        values = await self._call(self._redis_mget, [self.prefix + key for key in keys],
+                                  default=[None] * len(keys))
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(values) - found
+        return values
+
+    async def _redis_mget(self, keys):
+        return await self._redis.mget(keys)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._call(self._redis_set, self.prefix + key, value, ttl)
+
+    async def _redis_set(self, key, value, ttl, nx=False):
+        return await self._redis.set(key, value, px=max(1, int(ttl * 1000)), nx=nx)
+
+    async def set_many(self, items: dict, ttl: float) -> None:
+        if items:
+            await self._call(self._redis_set_many, items, ttl)
+
+    async def _redis_set_many(self, items, ttl):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+            await pipe.execute()
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        # Without Redis no worker can coordinate, so every worker acts alone
+        result = await self._call(self._redis_set, self.prefix + key, value, ttl, True, default=True)
+        return bool(result)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "redis"}
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def loads(value: bytes):
+    return json.loads(value)
+
+
+def create_shared_cache(url: str = REDIS_URL):
+    return RedisSharedCache(url) if url else LocalSharedCache()
+
+
+# Global instance, opened and closed with the app lifecycle
+shared_cache = create_shared_cache()
+metrics.register_cache("shared", shared_cache)
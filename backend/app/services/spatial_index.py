@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import numpy as np
+from app.services import metrics
+from app.services.aqi_cache import TTL_SECONDS, location_cache, cell_center
+from app.services.aqi_service import POLLUTANTS, compute_aqi_array
+from app.services.inference import RAW_FEATURES
+from app.services.measurement_store import measurement_store
+
+# Samples are bucketed on this coarser grid; a query scans the buckets its radius overlaps
+BUCKET_DEG = float(os.getenv("SPATIAL_BUCKET_DEG", "0.25"))
+# Samples older than a location cache entry may get are left out, so an
+# estimate is never staler than a cache hit would be
+MAX_AGE_SECONDS = float(os.getenv("SPATIAL_MAX_AGE_SECONDS", str(TTL_SECONDS)))
+# A sample this close answers a query as is. Samples sit at location cache
+# cell centres, so by default this is half a cell's diagonal: a sample for
+# the query's own cell always qualifies
+NEAREST_KM = float(os.getenv("SPATIAL_NEAREST_KM", "0")) or None
+# Otherwise up to NEIGHBOURS samples within the radius are blended by inverse distance,
+# if there are at least MIN_NEIGHBOURS of them
+RADIUS_KM = float(os.getenv("SPATIAL_RADIUS_KM", "15"))
+NEIGHBOURS = int(os.getenv("SPATIAL_NEIGHBOURS", "8"))
+MIN_NEIGHBOURS = int(os.getenv("SPATIAL_MIN_NEIGHBOURS", "3"))
+# Radius for answering /api/location-aqi cache misses without an upstream call; 0 disables
+QUERY_RADIUS_KM = float(os.getenv("SPATIAL_QUERY_RADIUS_KM", "10"))
+# Only these measurement-store sources are indexed: anyone can post the
+# others, and an estimate is served to every user nearby
+TRUSTED_SOURCES = ("open-meteo", "sensor")
+REBUILD_SECONDS = float(os.getenv("SPATIAL_REBUILD_SECONDS", "30"))
+MAX_HEATMAP_CELLS = int(os.getenv("SPATIAL_MAX_HEATMAP_CELLS", "40000"))
+IDW_POWER = 2
+
+KM_PER_DEG = 111.195
+# RAW_FEATURES columns holding POLLUTANTS, in POLLUTANTS order
+_POLLUTANT_COLUMNS = [RAW_FEATURES.index(p) for p in POLLUTANTS]
+
+NO_ESTIMATE = 0
+NEAREST = 1
+IDW = 2
+METHODS = {NEAREST: "nearest", IDW: "idw"}
+
+logger = logging.getLogger(__name__)
+
+
+class SpatialIndex:
+    """
+    Immutable set of AQI samples: one location per sample with its pollutant
+    concentrations (POLLUTANTS order, CPCB units, NaN where unknown) and
+    observation time.
+
+    Samples are sorted by a coarse grid bucket, so finding the candidates
+    near a point is a few dict lookups plus array slices. Distances use an
+    equirectangular approximation, well under 1% off at these radii.
+    """
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, values: np.ndarray, observed_at: np.ndarray,
+                 bucket_deg: float = BUCKET_DEG):
+        self.bucket_deg = bucket_deg
+        self.built_at = time.time()
+        rows = np.floor(lats / bucket_deg).astype(np.int64)
+        cols = np.floor(lons / bucket_deg).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.values = values[order]
+        self.observed_at = observed_at[order]
+        rows, cols = rows[order], cols[order]
+        # One contiguous run of samples per bucket
+        starts = np.flatnonzero(np.r_[True, (np.diff(rows) != 0) | (np.diff(cols) != 0)]) if len(order) else []
+        ends = np.r_[starts[1:], len(order)] if len(order) else []
+        self._buckets = {(int(rows[s]), int(cols[s])): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def candidates(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Indices of the samples in buckets overlapping the box (a superset of the box)."""
+        b = self.bucket_deg
+        rows = range(math.floor(south / b), math.floor(north / b) + 1)
+        cols = range(math.floor(west / b), math.floor(east / b) + 1)
+        if len(rows) * len(cols) <= len(self._buckets):
+            spans = [self._buckets.get((r, c)) for r in rows for c in cols]
+        else:
+            # Wide box over a sparse index: cheaper to filter the buckets
+            spans = [span for (r, c), span in self._buckets.items() if r in rows and c in cols]
+        spans = [span for span in spans if span is not None]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in spans])
+
+    def interpolate(self, lats, lons, radius_km: float = RADIUS_KM, nearest_km: float = 0.0,
+                    neighbours: int = NEIGHBOURS, min_neighbours: int = MIN_NEIGHBOURS) -> dict:
+        """
+        Estimate concentrations at each (lat, lon). Returns arrays: `values`
+        (points x POLLUTANTS, NaN where unknown), `method` (NO_ESTIMATE,
+        NEAREST or IDW), `distance_km` to the closest sample, `neighbours`
+        used and the closest sample's `observed_at`.
+
+        A point within `nearest_km` of a sample takes that sample's values;
+        otherwise, with at least `min_neighbours` samples within `radius_km`,
+        each pollutant is the inverse-distance-weighted mean of the nearest
+        `neighbours` of them that report it.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        n = len(lats)
+        result = {
+            "values": np.full((n, len(POLLUTANTS)), np.nan, dtype=np.float64),
+            "method": np.full(n, NO_ESTIMATE, dtype=np.int8),
+            "distance_km": np.full(n, np.inf),
+            "neighbours": np.zeros(n, dtype=np.int64),
+            "observed_at": np.full(n, np.nan),
+        }
+        if not n or not len(self):
+            return result
+
+        dlat = radius_km / KM_PER_DEG
+        widest = min(max(abs(lats.min()), abs(lats.max())) + dlat, 89.0)
+        dlon = radius_km / (KM_PER_DEG * math.cos(math.radians(widest)))
+        idx = self.candidates(lats.min() - dlat, lons.min() - dlon, lats.max() + dlat, lons.max() + dlon)
+        if not len(idx):
+            return result
+
+        dy = (lats[:, None] - self.lats[idx][None, :]) * KM_PER_DEG
+        dx = (lons[:, None] - self.lons[idx][None, :]) * (KM_PER_DEG * np.cos(np.radians(lats)))[:, None]
+        distances = np.hypot(dx, dy)
+        k = min(neighbours, len(idx))
+        if k < len(idx):
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(len(idx)), distances.shape)
+        near_km = np.take_along_axis(distances, nearest, axis=1)
+        near_idx = idx[nearest]
+        within = near_km <= radius_km
+
+        values = self.values[near_idx]  # points x k x pollutants
+        present = ~np.isnan(values) & within[:, :, None]
+        weights = 1.0 / np.maximum(near_km, 1e-3) ** IDW_POWER
+        weighted = weights[:, :, None] * present
+        with np.errstate(invalid="ignore", divide="ignore"):
+            blended = (weighted * np.where(present, values, 0.0)).sum(axis=1) / weighted.sum(axis=1)
+
+        points = np.arange(n)
+        closest = np.argmin(near_km, axis=1)
+        distance = near_km[points, closest]
+        count = within.sum(axis=1)
+        use_nearest = distance <= nearest_km
+        use_idw = ~use_nearest & (count >= min_neighbours)
+
+        result["values"][use_nearest] = values[points, closest][use_nearest]
+        result["values"][use_idw] = blended[use_idw]
+        result["method"][use_nearest] = NEAREST
+        result["method"][use_idw] = IDW
+        result["distance_km"] = distance
+        result["neighbours"] = np.where(use_nearest, 1, np.where(use_idw, count, 0))
+        result["observed_at"] = self.observed_at[near_idx[points, closest]]
+        return result
+
+
+class SpatialService:
+    """
+    Location-to-AQI lookups answered from recent samples instead of upstream.
+
+    Every `rebuild_seconds` a SpatialIndex is rebuilt from the location
+    cache entries fetched within `max_age` and the measurement store's
+    latest readings from trusted sources (Open-Meteo and authenticated
+    sensors), one sample per grid cell, whichever is newer. Like the caches
+    it feeds on, the index is per process.
+    """
+
+    def __init__(self, cache=location_cache, store=measurement_store, max_age: float = MAX_AGE_SECONDS,
+                 rebuild_seconds: float = REBUILD_SECONDS, query_radius_km: float = QUERY_RADIUS_KM,
+                 nearest_km: float = NEAREST_KM):
+        self.cache = cache
+        self.store = store
+        self.max_age = max_age
+        self.rebuild_seconds = rebuild_seconds
+        self.query_radius_km = query_radius_km
+        self.nearest_km = nearest_km if nearest_km is not None else cache.cell_size * KM_PER_DEG / math.sqrt(2)
+        self.index = None
+        self._task = None
+
+        self.rebuilds = 0
+        self.answered = {name: 0 for name in METHODS.values()}
+
+    def snapshot(self) -> tuple:
+        """(lats, lons, values, observed_at) of the current samples (cheap, on the event loop)."""
+        since = time.time() - self.max_age
+        samples = {}  # cell -> (observed_at, pollutant values)
+        for cell, value, fetched_at in self.cache.entries():
+            components = value.get("components")
+            if fetched_at < since or value.get("aqi", -1) == -1 or not components:
+                continue
+            row = [np.nan if components.get(p) is None else components[p] for p in POLLUTANTS]
+            # Cached results carry Open-Meteo units; CPCB tables take CO in mg/m3
+            row[POLLUTANTS.index("co")] /= 1000.0
+            samples[cell] = (fetched_at, row)
+        for cell, observed_at, raw in self.store.latest_readings(TRUSTED_SOURCES, since):
+            if cell not in samples or samples[cell][0] < observed_at:
+                samples[cell] = (observed_at, raw[_POLLUTANT_COLUMNS])
+
+        centers = np.array([cell_center(cell, self.cache.cell_size) for cell in samples], dtype=np.float64)
+        centers = centers.reshape(-1, 2)
+        return (
+            centers[:, 0], centers[:, 1],
+            np.array([row for _, row in samples.values()], dtype=np.float64).reshape(-1, len(POLLUTANTS)),
+            np.array([observed_at for observed_at, _ in samples.values()], dtype=np.float64),
+        )
+
+    async def rebuild(self) -> None:
+        lats, lons, values, observed_at = self.snapshot()
+        self.index = await asyncio.to_thread(SpatialIndex, lats, lons, values, observed_at)
+        self.rebuilds += 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.exception("Error rebuilding spatial index: %s", e)
+                metrics.ERRORS.labels("spatial_index").inc()
+            await asyncio.sleep(self.rebuild_seconds)
+
+    def estimate(self, lat: float, lon: float):
+        """
+        (pollutants dict in CPCB units, None where unknown; details) for a
+        location from nearby samples within query_radius_km, or None.
+        """
+        if self.index is None or not self.query_radius_km:
+            return None
+        found = self.index.interpolate([lat], [lon], radius_km=self.query_radius_km, nearest_km=self.nearest_km)
+        method = int(found["method"][0])
+        if method == NO_ESTIMATE:
+            return None
+        values = found["values"][0]
+        if np.isnan(values).all():
+            return None
+        pollutants = {p: (None if np.isnan(v) else round(float(v), 3)) for p, v in zip(POLLUTANTS, values)}
+        self.answered[METHODS[method]] += 1
+        metrics.SPATIAL_ANSWERS.labels(METHODS[method]).inc()
+        return pollutants, {
+            "method": METHODS[method],
+            "neighbours": int(found["neighbours"][0]),
+            "distance_km": round(float(found["distance_km"][0]), 2),
+            "observed_at": float(found["observed_at"][0]),
+        }
+
+    def heatmap(self, south: float, west: float, north: float, east: float, cell_deg: float) -> dict:
+        """
+        AQI over a bounding box on a grid of `cell_deg` cells, estimated at
+        each cell centre from the index alone (NaN where there is no
+        estimate). Rows run south to north, columns west to east.
+        """
+        # Rounded first, so a box an exact multiple of cell_deg wide gets no extra sliver column
+        rows = max(1, math.ceil(round((north - south) / cell_deg, 9)))
+        cols = max(1, math.ceil(round((east - west) / cell_deg, 9)))
+        if rows * cols > MAX_HEATMAP_CELLS:
+            raise ValueError(f"At most {MAX_HEATMAP_CELLS} heatmap cells; use a larger cell size.")
+        aqi = np.full((rows, cols), np.nan)
+        if self.index is None:
+            return {"rows": rows, "cols": cols, "aqi": aqi}
+
+        lons = west + (np.arange(cols) + 0.5) * cell_deg
+        # A row at a time keeps the distance matrix at cols x nearby samples
+        for row in range(rows):
+            lat = south + (row + 0.5) * cell_deg
+            found = self.index.interpolate(np.full(cols, lat), lons, nearest_km=self.nearest_km)
+            values = found["values"]
+            aqi[row] = compute_aqi_array({p: values[:, i] for i, p in enumerate(POLLUTANTS)})["aqi"]
+        return {"rows": rows, "cols": cols, "aqi": aqi}
+
+    def stats(self) -> dict:
+        return {
+            "samples": len(self.index) if self.index is not None else 0,
+            "built_at": self.index.built_at if self.index is not None else None,
+            "rebuilds": self.rebuilds,
+            "answered": dict(self.answered),
+        }
+
+
+# Global instance; the rebuild loop runs with the app lifecycle
+spatial_service = SpatialService()
@@ -0,0 +1,85 @@
+import json
+import os
+import numpy as np
+
+# Rows walked through the trees at once; keeps the (rows x trees) node
+# index arrays small enough to stay in cache
+CHUNK_ROWS = 1024
+ARRAYS = ("feature", "threshold", "left", "default_right", "value", "roots", "targets")
+# Format 1 stored int32 indices and default_left; still read, at the cost of
+# converted copies in every process
+FORMAT_VERSIONS = (1, 2)
+
+
+class TreeEnsemble:
+    """
+    XGBoost tree ensemble evaluated with NumPy only, from the packed arrays
+    written by ml_engine/export_trees.py.
+
+    All rows walk all trees in lock-step: each step gathers every (row, tree)
+    pair's split feature and threshold and moves to the left child, or the
+    one after it when `not x < threshold` (missing values follow
+    default_right, as in XGBoost). Leaves point at themselves and never go
+    right, even for an infinite x, so after max_depth steps every pair sits
+    on its leaf. Leaf values are summed per output column and added to base_score.
+    """
+
+    def __init__(self, arrays: dict, meta: dict):
+        # Exported indices are already intp, so these are the (memory-mapped)
+        # arrays themselves; anything narrower is widened once here, since
+        # NumPy would otherwise convert it on every gather
+        self.feature = np.asarray(arrays["feature"], dtype=np.intp)
+        self.left = np.asarray(arrays["left"], dtype=np.intp)
+        self.roots = np.asarray(arrays["roots"], dtype=np.intp)
+        self.threshold = np.asarray(arrays["threshold"])
+        self.go_right_if_missing = np.asarray(arrays["default_right"])
+        self.value = np.asarray(arrays["value"])
+        self.num_features = meta["num_features"]
+        self.num_targets = meta["num_targets"]
+        self.max_depth = meta["max_depth"]
+        self.base_score = np.asarray(meta["base_score"], dtype=np.float64)
+        # (trees, targets) 0/1 matrix: summing leaves per target is one matmul
+        self._target_matrix = np.zeros((len(self.roots), self.num_targets), dtype=np.float64)
+        self._target_matrix[np.arange(len(self.roots)), arrays["targets"]] = 1.0
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """Load an exported trees directory; value arrays are memory-mapped by default."""
+        with open(os.path.join(path, "trees.json")) as f:
+            meta = json.load(f)
+        version = meta.get("format_version")
+        if version not in FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported trees format in {path}")
+        mode = "r" if mmap else None
+        names = [("default_left" if name == "default_right" and version == 1 else name) for name in ARRAYS]
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in names}
+        if version == 1:
+            arrays["default_right"] = ~arrays.pop("default_left")
+        return cls(arrays, meta)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict for a 2-D float32 array; (n,) for one target, else (n, targets)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.num_features:
+            raise ValueError(f"Expected rows of {self.num_features} features, got shape {X.shape}")
+        out = np.empty((X.shape[0], self.num_targets), dtype=np.float32)
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            rows = X[start:start + CHUNK_ROWS]
+            out[start:start + len(rows)] = self._predict_chunk(rows)
+        return out[:, 0] if self.num_targets == 1 else out
+
+    def _predict_chunk(self, rows: np.ndarray) -> np.ndarray:
+        flat = rows.ravel()
+        row_offset = (np.arange(len(rows), dtype=np.intp) * self.num_features)[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (len(rows), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            x = flat[row_offset + self.feature[node]]
+            go_right = ~(x < self.threshold[node])
+            # NaN compares False, so only missing values need the default direction
+            missing = np.isnan(x)
+            if missing.any():
+                go_right = np.where(missing, self.go_right_if_missing[node], go_right)
+            child = self.left[node]
+            # A leaf is its own left child; `not inf < inf` must not step off it
+            node = child + (go_right & (child != node))
+        return self.value[node] @ self._target_matrix + self.base_score
@@ -1,9 +1,92 @@
+import logging
+import os
+import random
+import sys
+import time
+
+# shared/ (the CPCB tables, also used by ml_engine) lives at the repo root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import Response
 from app.api import endpoints
+from app.services import metrics
+from app.services.prefetch import location_prefetcher
+from app.services.forecast_service import forecast_service
+from app.services.live_feed import live_feed
+from app.services.spatial_index import spatial_service
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+# httpx logs every upstream request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="AirGuard API", version="1.0.0")
 
+
+class MetricsMiddleware:
+    """
+    Records latency, status and in-flight count per route for /metrics.
+
+    Latency runs until the last body chunk is sent, so streamed responses
+    count in full. A TRACE_SAMPLE_RATE fraction of requests is also traced:
+    spans recorded while handling it (upstream calls, inference) are logged
+    and returned in a Server-Timing header, with `app` as the time to the
+    first response byte.
+    """
+
+    def __init__(self, app, sample_rate: float = metrics.TRACE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self._paths = None
+
+    def _route_for(self, path: str) -> str:
+        # Unknown paths share one label so scanners can't blow up cardinality
+        if self._paths is None:
+            self._paths = {route.path for route in app.routes if hasattr(route, "path")}
+        return path if path in self._paths else "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route_for(scope["path"])
+        in_flight = metrics.REQUESTS_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        trace = token = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            trace, token = metrics.start_trace()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace is not None:
+                    trace.add("app", started, time.perf_counter() - started)
+                    message.setdefault("headers", []).append((b"server-timing", trace.server_timing().encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            metrics.REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            if trace is not None:
+                metrics.end_trace(token)
+                logger.info("trace %s %s %d %.1fms %s", scope["method"], scope["path"], status,
+                            elapsed * 1000, trace.describe())
+
+
 # CORS
 origins = ["*"] # Allow all for dev
 app.add_middleware(
@@ -13,9 +96,34 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(endpoints.router, prefix="/api")
 
+@app.on_event("startup")
+async def start_background_tasks():
+    # Keeps the most requested /api/location-aqi cells warm in the cache
+    location_prefetcher.start()
+    # Periodically recomputes the /api/forecast table
+    forecast_service.start()
+    # Refreshes the cells that /api/location-aqi/live clients follow
+    live_feed.start()
+    # Rebuilds the index behind /api/location-aqi estimates and heatmaps
+    spatial_service.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await location_prefetcher.stop()
+    await forecast_service.stop()
+    await live_feed.stop()
+    await spatial_service.stop()
+    metrics.mark_worker_exit()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to AirGuard API. Visit /docs for Swagger UI."}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
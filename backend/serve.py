@@ -0,0 +1,62 @@
+"""
+Production entry point: one uvicorn worker process per core.
+
+    python backend/serve.py
+
+Each worker runs its own event loop, so state that must be common to all
+of them lives in the shared cache tier (set REDIS_URL; see
+app/services/shared_cache.py) or the measurement database. Models are
+memory-mapped from their exported arrays, so the OS page cache holds one
+copy for every worker.
+
+Some state stays per worker:
+
+- measurement ring buffers hold the readings that worker fetched or was
+  sent; every worker flushes them to the one database, and forecasts are
+  built from the database, so they cover all workers;
+- the spatial index is built from that worker's own buffers, so estimates
+  use the readings it has seen;
+- live feed connections are served by the worker that accepted them, each
+  refreshing its own subscribed cells (through the shared cache).
+
+Several workers flushing into one SQLite file fail with "database is
+locked", so more than one worker needs a server database (DATABASE_URL,
+e.g. the Postgres in docker-compose).
+
+With several workers, Prometheus metrics are written to a directory shared
+by all of them (PROMETHEUS_MULTIPROC_DIR, a fresh temporary one by default),
+so /metrics reports the whole server whichever worker answers it.
+"""
+import glob
+import os
+import sys
+import tempfile
+import uvicorn
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# WEB_CONCURRENCY is the usual knob on PaaS hosts; async workers need one per core
+WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# Same default as app/services/measurement_store.py
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///airguard.db")
+
+if __name__ == "__main__":
+    if WORKERS > 1 and DATABASE_URL.startswith("sqlite"):
+        sys.exit(f"{WORKERS} workers cannot share the SQLite database {DATABASE_URL}: "
+                 "set DATABASE_URL to a server database or WEB_CONCURRENCY=1")
+    if WORKERS > 1:
+        # Must be set before the workers import prometheus_client
+        metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="airguard-metrics-"))
+        os.makedirs(metrics_dir, exist_ok=True)
+        # Files left by a previous run would be counted again
+        for name in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.remove(name)
+    uvicorn.run(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=HOST,
+        port=PORT,
+        workers=WORKERS,
+        proxy_headers=True,
+        timeout_keep_alive=int(os.getenv("KEEPALIVE_SECONDS", "5")),
+    )
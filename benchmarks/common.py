@@ -0,0 +1,41 @@
+"""Shared helpers for the benchmark scripts: import paths, run metadata, result files."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def add_import_paths() -> None:
+    """Make `app` (backend), `shared` and the ml_engine modules importable."""
+    for path in (REPO_ROOT, os.path.join(REPO_ROOT, "backend"), os.path.join(REPO_ROOT, "ml_engine")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def run_metadata(kind: str, params: dict) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "kind": kind,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+    }
+
+
+def write_results(path: str, results: dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
@@ -0,0 +1,67 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 10]
+
+Works on output from load_test.py and micro.py. Every numeric metric present
+in both files is compared; latencies, ns/op and allocation sizes are worse
+when they grow, throughput when it shrinks. Exits with status 1 if any metric
+is worse by more than --threshold percent, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("_rps", "ops_per_sec")
+LOWER_IS_BETTER = ("_ms", "ns_per_op", "_kb_p50", "_kb_mean", "_kb_max", "_bytes_per_request")
+
+
+def flatten(results: dict) -> dict:
+    """{"route.metric": value} for every comparable metric, skipping metadata."""
+    metrics = {}
+    for section, entries in results.items():
+        if section == "meta":
+            continue
+        for name, values in entries.items():
+            for metric, value in values.items():
+                if isinstance(value, (int, float)) and metric.endswith(HIGHER_IS_BETTER + LOWER_IS_BETTER):
+                    metrics[f"{name}.{metric}"] = float(value)
+    return metrics
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    """Rows of (metric, baseline, candidate, change %, regressed)."""
+    old, new = flatten(baseline), flatten(candidate)
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        change = ((after - before) / before * 100) if before else 0.0
+        worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+        rows.append((key, before, after, change, worse > threshold))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed slowdown in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline {baseline['meta'].get('commit')}  vs  candidate {candidate['meta'].get('commit')}")
+    rows = compare(baseline, candidate, args.threshold)
+    width = max((len(row[0]) for row in rows), default=10)
+    for key, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:<{width}}  {before:>14,.2f}  {after:>14,.2f}  {change:+7.1f}%{flag}")
+
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+    print("No regressions")
@@ -0,0 +1,160 @@
+"""
+Fault-injection run for the circuit breakers and the stale fallback.
+
+    python benchmarks/fault_injection.py
+
+Starts the Open-Meteo stub (separate process) and drives /api/location-aqi
+and /api/chatbot in-process (Gemini is FakeGeminiModel), through phases:
+
+    healthy     normal upstreams; fills the location cache
+    errors      every upstream call fails
+    recovering  upstreams healthy again, after the open period
+    slow        upstreams answer, but slower than the slow-call threshold
+    recovered   upstreams healthy again, after the open period
+
+Breaker timings are shortened and the location cache TTL is 1 s, and each
+phase waits for it, so every phase's lookups really go upstream (or fall
+back). For each phase it reports status counts, how many location replies
+were stale, how many chat replies were fallbacks, latency and the breaker
+states afterwards. While a circuit is open, location requests should still
+get 200 with "stale": true and stay fast. Results go to a JSON file.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import RESULTS_DIR, add_import_paths, run_metadata, write_results  # noqa: E402
+from load_test import _free_port, _wait_for_port  # noqa: E402
+from stubs import FakeGeminiModel, serve_open_meteo  # noqa: E402
+
+OPEN_SECONDS = 2.0
+SETTINGS = {
+    "AQI_CACHE_TTL_SECONDS": "1",
+    "CHAT_CACHE_TTL_SECONDS": "0.001",
+    "BREAKER_MIN_CALLS": "5",
+    "BREAKER_WINDOW": "10",
+    "BREAKER_OPEN_SECONDS": str(OPEN_SECONDS),
+    "OPEN_METEO_TIMEOUT_SECONDS": "1",
+    "OPEN_METEO_SLOW_CALL_SECONDS": "0.3",
+    "OPEN_METEO_MAX_RETRIES": "1",
+    "OPEN_METEO_BACKOFF_SECONDS": "0.05",
+    "CHAT_TIMEOUT_SECONDS": "1",
+    "CHAT_SLOW_CALL_SECONDS": "0.3",
+}
+# name, upstream error rate, upstream latency in ms, wait for the open period first
+PHASES = [
+    ("healthy", 0.0, 20.0, False),
+    ("errors", 1.0, 20.0, False),
+    ("recovering", 0.0, 20.0, True),
+    ("slow", 0.0, 600.0, False),
+    ("recovered", 0.0, 20.0, True),
+]
+
+
+async def run_phase(client, stub, gemini, locations: list, requests: int, concurrency: int,
+                    phase: str, error_rate: float, latency_ms: float) -> dict:
+    await stub.get("/faults", params={"error_rate": error_rate, "latency_ms": latency_ms})
+    gemini.error_rate = error_rate
+    gemini.latency = latency_ms / 1000.0
+
+    latencies = {"location": [], "chatbot": []}
+    statuses = {}
+    counts = {"stale": 0, "fallback": 0}
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            started = time.perf_counter()
+            if i % 2 == 0:
+                lat, lon = locations[(i // 2) % len(locations)]
+                response = await client.post("/api/location-aqi", json={"latitude": lat, "longitude": lon})
+                route = "location"
+                counts["stale"] += response.status_code == 200 and response.json().get("stale", False)
+            else:
+                response = await client.post("/api/chatbot", json={"message": f"Question {i} during {phase}"})
+                route = "chatbot"
+                counts["fallback"] += response.json()["response"].startswith("[AI Unavailable]")
+            latencies[route].append((time.perf_counter() - started) * 1000)
+            key = f"{route}_{response.status_code}"
+            statuses[key] = statuses.get(key, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    location_stats = (await client.get("/api/location-aqi/cache-stats")).json()
+    chat_stats = (await client.get("/api/chatbot/cache-stats")).json()
+    result = {
+        "status_counts": statuses,
+        "stale_replies": counts["stale"],
+        "fallback_replies": counts["fallback"],
+        "open_meteo_breaker": location_stats["breaker"]["state"],
+        "gemini_breaker": chat_stats["breaker"]["state"],
+    }
+    for route, values in latencies.items():
+        if values:
+            result[f"{route}_latency_p50_ms"] = round(float(np.percentile(values, 50)), 2)
+            result[f"{route}_latency_max_ms"] = round(max(values), 2)
+    return result
+
+
+async def run(args) -> dict:
+    import httpx
+
+    stub_port = _free_port()
+    stub_process = multiprocessing.get_context("spawn").Process(
+        target=serve_open_meteo, args=(stub_port, 20.0), daemon=True)
+    stub_process.start()
+    await _wait_for_port(stub_port)
+
+    # Module-level settings are read at import, so configure before importing the app
+    workdir = tempfile.mkdtemp(prefix="airguard-faults-")
+    os.environ.update(SETTINGS)
+    os.environ["OPEN_METEO_URL"] = f"http://127.0.0.1:{stub_port}/v1/air-quality"
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'faults.db')}")
+    os.environ.setdefault("FORECAST_PATH", os.path.join(workdir, "forecasts.npz"))
+    add_import_paths()
+    from main import app
+    from app.services.chat_service import chat_service
+
+    gemini = FakeGeminiModel(20.0, chunks=2)
+    chat_service.model = gemini
+    # Distinct cells, so each lookup is its own upstream call
+    locations = [(28.0 + 0.1 * i, 77.0 + 0.1 * i) for i in range(args.locations)]
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=30) as client, \
+                httpx.AsyncClient(base_url=f"http://127.0.0.1:{stub_port}") as stub:
+            for phase, error_rate, latency_ms, wait_open in PHASES:
+                await asyncio.sleep(OPEN_SECONDS if wait_open else 1.0)
+                results[phase] = await run_phase(client, stub, gemini, locations, args.requests,
+                                                 args.concurrency, phase, error_rate, latency_ms)
+                summary = results[phase]
+                print(f"[{phase}] {summary['status_counts']}, stale {summary['stale_replies']}, "
+                      f"fallback {summary['fallback_replies']}, location p50 "
+                      f"{summary.get('location_latency_p50_ms')} ms, breakers open_meteo="
+                      f"{summary['open_meteo_breaker']} gemini={summary['gemini_breaker']}")
+    finally:
+        stub_process.terminate()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60, help="Requests per phase, half per route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--locations", type=int, default=20, help="Distinct cells for /location-aqi")
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "faults.json"))
+    args = parser.parse_args()
+
+    phases = asyncio.run(run(args))
+    write_results(args.out, {"meta": run_metadata("faults", vars(args)), "phases": phases})
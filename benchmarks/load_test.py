@@ -0,0 +1,241 @@
+"""
+Load test for the AirGuard API routes.
+
+    python benchmarks/load_test.py --concurrency 32 --requests 2000
+
+Starts the app in its own process on a local port, with Open-Meteo replaced
+by a stub server (another process) and Gemini by FakeGeminiModel (see
+stubs.serve_api), then drives each route at the given concurrency:
+
+    predict   POST /api/predict-aqi        random readings, half with a location
+    location  POST /api/location-aqi       points drawn from --locations distinct spots
+    chatbot   POST /api/chatbot            questions drawn from a small pool
+    advice    GET  /api/health-advice      random AQI values
+
+For every route it reports throughput, p50/p95/p99/max latency and status
+counts, then replays --alloc-samples requests one at a time while the
+server traces its allocations, for the peak memory allocated per request.
+Results go to a JSON file that benchmarks/compare.py can diff against
+another run. The run exits with status 1 if more than --max-error-ratio of
+any route's measured responses were not 2xx.
+
+With --url the routes are driven against an already running server instead
+(no stubs, no allocation stats).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import REPO_ROOT, RESULTS_DIR, run_metadata, write_results  # noqa: E402
+from stubs import serve_api, serve_open_meteo  # noqa: E402
+
+ROUTES = ("predict", "location", "chatbot", "advice")
+QUESTIONS = [
+    "Is it safe to go jogging?", "What precautions should I take?", "Should I wear a mask?",
+    "Can my kids play outside?", "Is it safe outside for elderly people?", "What does PM2.5 mean?",
+    "Should I open the windows?", "Will the AQI be better tomorrow?", "Is cycling to work okay?",
+    "How does air pollution affect asthma?",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_for_port(port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def make_request(route: str, rng: random.Random, locations: list):
+    """(method, path, json body or None, query params or None) for one request."""
+    if route == "predict":
+        body = {
+            "pm25": rng.uniform(10, 300), "pm10": rng.uniform(20, 400), "no2": rng.uniform(5, 100),
+            "so2": rng.uniform(5, 50), "co": rng.uniform(0.1, 5), "o3": rng.uniform(10, 150),
+            "temperature": rng.uniform(5, 45), "humidity": rng.uniform(20, 90), "wind_speed": rng.uniform(0, 20),
+        }
+        if rng.random() < 0.5:
+            body["latitude"], body["longitude"] = rng.choice(locations)
+        return "POST", "/api/predict-aqi", body, None
+    if route == "location":
+        lat, lon = rng.choice(locations)
+        return "POST", "/api/location-aqi", {"latitude": lat, "longitude": lon}, None
+    if route == "chatbot":
+        return "POST", "/api/chatbot", {"message": rng.choice(QUESTIONS), "aqi": rng.choice([40, 90, 150, 250])}, None
+    if route == "advice":
+        return "GET", "/api/health-advice", None, {"aqi": round(rng.uniform(0, 500), 1)}
+    raise ValueError(f"Unknown route {route!r}")
+
+
+async def _send(client, request):
+    method, path, body, params = request
+    return await client.request(method, path, json=body, params=params)
+
+
+async def drive(client, route: str, total: int, concurrency: int, rng: random.Random, locations: list) -> dict:
+    requests = [make_request(route, rng, locations) for _ in range(total)]
+    latencies = np.zeros(total)
+    statuses = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                status = (await _send(client, requests[i])).status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies[i] = time.perf_counter() - started
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    ms = latencies * 1000
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 1),
+        "latency_p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "latency_p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "latency_p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "latency_max_ms": round(float(ms.max()), 3),
+        "latency_mean_ms": round(float(ms.mean()), 3),
+        "status_counts": statuses,
+    }
+
+
+async def measure_allocations(client, route: str, samples: int, rng: random.Random, locations: list) -> dict:
+    """Peak bytes the server allocated per request, one request at a time."""
+    requests = [make_request(route, rng, locations) for _ in range(samples)]
+    (await client.post("/_bench/alloc/start")).raise_for_status()
+    for request in requests:
+        await _send(client, request)
+    traced = (await client.post("/_bench/alloc/stop")).json()
+    peaks = np.asarray(traced["peaks"]) / 1024
+    return {
+        "alloc_samples": samples,
+        "alloc_peak_kb_p50": round(float(np.percentile(peaks, 50)), 2),
+        "alloc_peak_kb_mean": round(float(peaks.mean()), 2),
+        "alloc_peak_kb_max": round(float(peaks.max()), 2),
+        "alloc_retained_bytes_per_request": round(traced["retained"] / samples, 1),
+    }
+
+
+def error_ratio(summary: dict) -> float:
+    """Fraction of measured responses that were not 2xx (connection errors included)."""
+    failed = sum(count for status, count in summary["status_counts"].items() if not status.startswith("2"))
+    return failed / summary["requests"]
+
+
+def _spawn(target, *args):
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args, daemon=True)
+    process.start()
+    return process
+
+
+async def run(args) -> dict:
+    import httpx
+
+    rng = random.Random(args.seed)
+    # Spread over ~1° so the location cache sees a realistic hit/miss mix
+    locations = [(round(28.0 + rng.random(), 4), round(77.0 + rng.random(), 4)) for _ in range(args.locations)]
+    routes = args.routes.split(",")
+
+    processes = []
+    base_url = args.url
+    if base_url is None:
+        stub_port = _free_port()
+        processes.append(_spawn(serve_open_meteo, stub_port, args.upstream_latency_ms))
+        await _wait_for_port(stub_port)
+
+        # The server process reads its settings from the environment at import.
+        # Model paths are absolute so the run does not depend on the working directory
+        workdir = tempfile.mkdtemp(prefix="airguard-bench-")
+        os.environ["OPEN_METEO_URL"] = f"http://127.0.0.1:{stub_port}/v1/air-quality"
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        os.environ.setdefault("FORECAST_PATH", os.path.join(workdir, "forecasts.npz"))
+        ml_engine = os.path.join(REPO_ROOT, "ml_engine")
+        os.environ.setdefault("MODEL_PATH", os.path.join(ml_engine, "aqi_xgboost_model.joblib"))
+        os.environ.setdefault("MODEL_REGISTRY_DIR", os.path.join(ml_engine, "registry"))
+        os.environ.setdefault("FORECAST_MODEL_PATH", os.path.join(ml_engine, "aqi_forecast_model.joblib"))
+
+        port = _free_port()
+        processes.append(_spawn(serve_api, port, args.gemini_latency_ms))
+        await _wait_for_port(port, timeout=60)
+        base_url = f"http://127.0.0.1:{port}"
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            for route in routes:
+                print(f"[{route}] warming up...")
+                await drive(client, route, args.warmup, args.concurrency, rng, locations)
+                print(f"[{route}] {args.requests} requests at concurrency {args.concurrency}...")
+                results[route] = await drive(client, route, args.requests, args.concurrency, rng, locations)
+                if args.url is None and args.alloc_samples:
+                    results[route].update(await measure_allocations(client, route, args.alloc_samples, rng, locations))
+                summary = results[route]
+                print(f"[{route}] {summary['throughput_rps']} req/s, p50 {summary['latency_p50_ms']} ms, "
+                      f"p99 {summary['latency_p99_ms']} ms, statuses {summary['status_counts']}")
+            if args.url is None:
+                stats = (await client.get("/_bench/stats")).json()
+                results.setdefault("chatbot", {})["upstream_calls"] = stats["gemini_calls"]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(10)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default=",".join(ROUTES), help=f"Comma-separated subset of {', '.join(ROUTES)}")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per route")
+    parser.add_argument("--warmup", type=int, default=200, help="Unmeasured requests per route first")
+    parser.add_argument("--locations", type=int, default=500, help="Distinct points for /location-aqi")
+    parser.add_argument("--alloc-samples", type=int, default=200, help="Requests replayed under tracemalloc (0 to skip)")
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0, help="Open-Meteo stub delay")
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0, help="Fake Gemini delay")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one")
+    parser.add_argument("--max-error-ratio", type=float, default=0.01,
+                        help="Exit 1 if more than this fraction of a route's responses are not 2xx")
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "load.json"))
+    args = parser.parse_args()
+
+    unknown = set(args.routes.split(",")) - set(ROUTES)
+    if unknown:
+        parser.error(f"Unknown routes: {', '.join(sorted(unknown))}")
+    routes = asyncio.run(run(args))
+    write_results(args.out, {"meta": run_metadata("load", vars(args)), "routes": routes})
+    failing = {route: error_ratio(summary) for route, summary in routes.items() if "status_counts" in summary}
+    failing = {route: ratio for route, ratio in failing.items() if ratio > args.max_error_ratio}
+    for route, ratio in failing.items():
+        print(f"[{route}] {ratio:.1%} of responses were not 2xx (limit {args.max_error_ratio:.1%})")
+    sys.exit(1 if failing else 0)
@@ -0,0 +1,80 @@
+"""
+Micro-benchmarks for hot helper functions.
+
+    python benchmarks/micro.py
+
+Times classify_aqi, get_health_advice and feature_engineering (on a week of
+hourly rows and on a year) with timeit, taking the best of --repeat runs,
+and writes ns/op to a JSON file that benchmarks/compare.py understands.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import RESULTS_DIR, add_import_paths, run_metadata, write_results  # noqa: E402
+
+add_import_paths()
+from app.services.aqi_service import classify_aqi  # noqa: E402
+from app.services.health_service import get_health_advice  # noqa: E402
+from preprocessing import feature_engineering  # noqa: E402
+
+
+def _readings(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=rows, freq="h").astype(str),
+        "pm25": rng.uniform(10, 300, rows), "pm10": rng.uniform(20, 400, rows),
+        "no2": rng.uniform(5, 100, rows), "so2": rng.uniform(5, 50, rows),
+        "co": rng.uniform(0.1, 5, rows), "o3": rng.uniform(10, 150, rows),
+    })
+    return df
+
+
+def bench(fn, repeat: int) -> dict:
+    """Best-of-`repeat` timing; each run loops enough to take ~0.2s."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"ns_per_op": round(best * 1e9, 1), "ops_per_sec": round(1 / best, 1), "loops": number}
+
+
+def run(repeat: int) -> dict:
+    aqi_values = [12.0, 75.0, 130.0, 180.0, 260.0, 420.0]
+    categories = [classify_aqi(v)["category"] for v in aqi_values] + ["unknown"]
+    week, year = _readings(168), _readings(24 * 365)
+
+    cases = {
+        "classify_aqi": lambda: [classify_aqi(v) for v in aqi_values],
+        "get_health_advice": lambda: [get_health_advice(c) for c in categories],
+        # feature_engineering modifies its input, so each call gets a copy;
+        # the copy alone is reported alongside for reference
+        "feature_engineering_168_rows": lambda: feature_engineering(week.copy()),
+        "feature_engineering_8760_rows": lambda: feature_engineering(year.copy()),
+        "dataframe_copy_8760_rows": lambda: year.copy(),
+    }
+    per_call = {"classify_aqi": len(aqi_values), "get_health_advice": len(categories)}
+
+    results = {}
+    for name, fn in cases.items():
+        result = bench(fn, repeat)
+        calls = per_call.get(name, 1)
+        if calls > 1:
+            # Report per single call, not per batch of inputs
+            result["ns_per_op"] = round(result["ns_per_op"] / calls, 1)
+            result["ops_per_sec"] = round(result["ops_per_sec"] * calls, 1)
+        results[name] = result
+        print(f"{name}: {result['ns_per_op']:,.1f} ns/op")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "micro.json"))
+    args = parser.parse_args()
+    write_results(args.out, {"meta": run_metadata("micro", vars(args)), "functions": run(args.repeat)})
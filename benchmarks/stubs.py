@@ -0,0 +1,189 @@
+"""
+Stand-ins for AirGuard's external dependencies, so benchmarks measure our
+own code and never touch the network.
+
+- Open-Meteo: a small ASGI app answering the air-quality endpoint (single
+  and multi-coordinate requests) with deterministic readings after a
+  configurable delay. Run it with `serve_open_meteo(port, latency_ms)` in a
+  separate process. Faults can be injected while it runs:
+  `GET /faults?error_rate=0.5&latency_ms=3000` makes that fraction of
+  requests fail with 503 and delays the rest; `GET /faults` with no
+  parameters resets to healthy.
+- Gemini: FakeGeminiModel implements generate_content_async (plain and
+  streamed) with a configurable delay, and plugs into ChatService(model=...).
+  Its `latency` and `error_rate` attributes can be changed between calls.
+- The app itself: `serve_api(port, gemini_latency_ms)` runs it with
+  FakeGeminiModel in place of Gemini (use a separate process, configured
+  through the environment). Benchmark hooks are served next to the API:
+  `GET /_bench/stats` counts Gemini calls, and between
+  `POST /_bench/alloc/start` and `POST /_bench/alloc/stop` every request's
+  peak traced allocation is recorded (send them one at a time).
+"""
+import asyncio
+import json
+import random
+import tracemalloc
+import zlib
+
+
+def _reading(lat: float, lon: float) -> dict:
+    # Stable per location, so repeated runs see identical payloads
+    seed = zlib.crc32(f"{lat:.4f},{lon:.4f}".encode())
+    level = (seed % 1000) / 1000.0
+    return {
+        "time": "2026-01-01T00:00",
+        "interval": 3600,
+        "pm10": round(40 + 200 * level, 1),
+        "pm2_5": round(20 + 150 * level, 1),
+        "nitrogen_dioxide": round(10 + 60 * level, 1),
+        "sulphur_dioxide": round(5 + 20 * level, 1),
+        "ozone": round(30 + 80 * (1 - level), 1),
+        "carbon_monoxide": round(200 + 1500 * level, 1),
+    }
+
+
+def open_meteo_app(latency_ms: float = 20.0):
+    """ASGI app mimicking GET /v1/air-quality?latitude=..&longitude=..&current=.."""
+    from urllib.parse import parse_qs
+
+    faults = {"error_rate": 0.0, "latency_ms": latency_ms}
+
+    async def respond(send, status: int, payload) -> None:
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        query = parse_qs(scope["query_string"].decode())
+        if scope["path"] == "/faults":
+            faults["error_rate"] = float(query.get("error_rate", ["0"])[0])
+            faults["latency_ms"] = float(query.get("latency_ms", [str(latency_ms)])[0])
+            await respond(send, 200, faults)
+            return
+        lats = [float(v) for v in query.get("latitude", ["0"])[0].split(",")]
+        lons = [float(v) for v in query.get("longitude", ["0"])[0].split(",")]
+        if random.random() < faults["error_rate"]:
+            await respond(send, 503, {"error": True, "reason": "injected fault"})
+            return
+        await asyncio.sleep(faults["latency_ms"] / 1000.0)
+        items = [{"latitude": lat, "longitude": lon, "current": _reading(lat, lon)}
+                 for lat, lon in zip(lats, lons)]
+        await respond(send, 200, items[0] if len(items) == 1 else items)
+
+    return app
+
+
+def serve_open_meteo(port: int, latency_ms: float = 20.0) -> None:
+    """Blocking: run the Open-Meteo stub on 127.0.0.1:port (use a separate process)."""
+    import uvicorn
+    uvicorn.run(open_meteo_app(latency_ms), host="127.0.0.1", port=port, log_level="warning")
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Stream:
+    def __init__(self, chunks: list, delay: float):
+        self._chunks = chunks
+        self._delay = delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield _Chunk(chunk)
+
+
+class FakeGeminiModel:
+    """
+    Drop-in for genai.GenerativeModel in ChatService. Replies echo a hash of
+    the prompt so distinct questions get distinct answers.
+    """
+
+    def __init__(self, latency_ms: float = 300.0, chunks: int = 8, error_rate: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.chunks = chunks
+        self.error_rate = error_rate
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        if random.random() < self.error_rate:
+            raise RuntimeError("injected fault")
+        words = [f"word{(zlib.crc32(prompt.encode()) + i) % 997}" for i in range(self.chunks * 6)]
+        pieces = [" ".join(words[i:i + 6]) + " " for i in range(0, len(words), 6)]
+        if stream:
+            return _Stream(pieces, self.latency / self.chunks)
+        await asyncio.sleep(self.latency)
+        return _Chunk("".join(pieces))
+
+
+class BenchmarkHooks:
+    """ASGI wrapper adding the /_bench/ endpoints described above."""
+
+    def __init__(self, app, gemini: FakeGeminiModel):
+        self.app = app
+        self.gemini = gemini
+        self.peaks = None
+        self.baseline = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/_bench/"):
+            await self._hook(scope["path"], send)
+            return
+        if scope["type"] != "http" or self.peaks is None:
+            await self.app(scope, receive, send)
+            return
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.peaks.append(tracemalloc.get_traced_memory()[1] - before)
+
+    async def _hook(self, path: str, send) -> None:
+        status, payload = 200, {}
+        if path == "/_bench/stats":
+            payload = {"gemini_calls": self.gemini.calls}
+        elif path == "/_bench/alloc/start":
+            tracemalloc.start()
+            self.baseline = tracemalloc.get_traced_memory()[0]
+            self.peaks = []
+        elif path == "/_bench/alloc/stop" and self.peaks is not None:
+            payload = {"peaks": self.peaks, "retained": tracemalloc.get_traced_memory()[0] - self.baseline}
+            tracemalloc.stop()
+            self.peaks = None
+        else:
+            status, payload = 404, {"error": "unknown benchmark hook"}
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+
+def serve_api(port: int, gemini_latency_ms: float = 300.0) -> None:
+    """
+    Blocking: run the AirGuard app on 127.0.0.1:port with FakeGeminiModel
+    (use a separate process). Settings are read from the environment at
+    import, so set OPEN_METEO_URL, DATABASE_URL etc. before starting it.
+    """
+    from common import add_import_paths
+    add_import_paths()
+    import uvicorn
+    from main import app
+    from app.services.chat_service import chat_service
+
+    gemini = FakeGeminiModel(gemini_latency_ms)
+    chat_service.model = gemini
+    uvicorn.run(BenchmarkHooks(app, gemini), host="127.0.0.1", port=port, log_level="warning")
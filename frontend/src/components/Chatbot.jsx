@@ -1,5 +1,4 @@
 import React, { useState, useRef, useEffect } from 'react'
-import axios from 'axios'
 import { MessageCircle, X, Send } from 'lucide-react'
 
 const Chatbot = () => {
@@ -22,15 +21,45 @@ const Chatbot = () => {
         if (!input.trim()) return
 
         const userMsg = { sender: 'user', text: input }
-        setMessages(prev => [...prev, userMsg])
+        setMessages(prev => [...prev, userMsg, { sender: 'bot', text: '' }])
         setInput('')
 
+        // Append streamed tokens to the last (bot) message as they arrive
+        const appendToReply = (token) => {
+            setMessages(prev => {
+                const last = prev[prev.length - 1]
+                return [...prev.slice(0, -1), { ...last, text: last.text + token }]
+            })
+        }
+
         try {
-            const response = await axios.post('http://localhost:8000/api/chatbot', { message: input })
-            const botMsg = { sender: 'bot', text: response.data.response }
-            setMessages(prev => [...prev, botMsg])
+            const response = await fetch('http://localhost:8000/api/chatbot/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ message: input })
+            })
+            if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`)
+
+            const reader = response.body.getReader()
+            const decoder = new TextDecoder()
+            let buffer = ''
+            while (true) {
+                const { value, done } = await reader.read()
+                if (done) break
+                buffer += decoder.decode(value, { stream: true })
+
+                // Server-Sent Events are separated by a blank line
+                const events = buffer.split('\n\n')
+                buffer = events.pop()
+                for (const event of events) {
+                    const data = event.split('\n').find(line => line.startsWith('data: '))
+                    if (!data || event.startsWith('event: done')) continue
+                    const { token } = JSON.parse(data.slice(6))
+                    if (token) appendToReply(token)
+                }
+            }
         } catch (error) {
-            setMessages(prev => [...prev, { sender: 'bot', text: "Sorry, I'm having trouble connecting to the server." }])
+            setMessages(prev => [...prev.slice(0, -1), { sender: 'bot', text: "Sorry, I'm having trouble connecting to the server." }])
         }
     }
 
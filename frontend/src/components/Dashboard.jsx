@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import axios from 'axios'
 import { Wind, Droplets, Thermometer, Activity, MapPin } from 'lucide-react'
 
@@ -7,6 +7,7 @@ const Dashboard = () => {
     const [loading, setLoading] = useState(false)
     const [useLocation, setUseLocation] = useState(false)
     const [locationError, setLocationError] = useState(null)
+    const liveFeed = useRef(null)
 
     const [formData, setFormData] = useState({
         pm25: 45,
@@ -20,8 +21,31 @@ const Dashboard = () => {
         wind_speed: 10
     })
 
+    // Live updates for a location: the server pushes a snapshot, then only the fields that change
+    const stopLiveFeed = () => {
+        liveFeed.current?.close()
+        liveFeed.current = null
+    }
+
+    const startLiveFeed = (latitude, longitude) => {
+        stopLiveFeed()
+        const ws = new WebSocket('ws://localhost:8000/api/location-aqi/live')
+        ws.onopen = () => ws.send(JSON.stringify({ action: 'subscribe', latitude, longitude }))
+        ws.onmessage = (event) => {
+            const message = JSON.parse(event.data)
+            if (message.type === 'snapshot') {
+                setAqiData(message.data)
+            } else if (message.type === 'delta') {
+                // Changed fields arrive whole, nested ones included
+                setAqiData(prev => ({ ...prev, ...message.data }))
+            }
+        }
+        liveFeed.current = ws
+    }
+
     // Manual prediction (ML Model)
     const predictAQI = async () => {
+        stopLiveFeed()
         setLoading(true)
         try {
             const response = await axios.post('http://localhost:8000/api/predict-aqi', formData)
@@ -54,6 +78,7 @@ const Dashboard = () => {
                     })
                     setAqiData(response.data)
                     setUseLocation(true)
+                    startLiveFeed(latitude, longitude)
 
                     // Update inputs to show fetched components if available
                     if (response.data.components) {
@@ -89,6 +114,7 @@ const Dashboard = () => {
         // Initial load: Try location first, else manual default
         // fetchLocationAQI() // Optional: auto-fetch on load
         predictAQI()
+        return stopLiveFeed
     }, [])
 
     const handleChange = (e) => {
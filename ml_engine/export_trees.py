@@ -0,0 +1,152 @@
+"""
+Flatten a trained XGBoost model into packed NumPy arrays for serving.
+
+The API evaluates these arrays directly (backend/app/services/tree_predictor.py)
+so it never imports xgboost. Every tree's nodes are renumbered breadth-first
+so that a node's children are adjacent (right = left + 1) and concatenated
+into one set of arrays. Leaves point back at themselves and always "go left",
+so all rows can walk all trees in lock-step for `max_depth` steps.
+
+    <out_dir>/
+        trees.json          <- num_features, num_targets, max_depth, base_score
+        feature.npy         <- intp    split feature per node
+        threshold.npy       <- float32 go left when x < threshold (+inf for leaves)
+        left.npy            <- intp    left child (right is left + 1; self for leaves)
+        default_right.npy   <- bool    missing values go right (False for leaves)
+        value.npy           <- float32 leaf value (0 for split nodes)
+        roots.npy           <- intp    root node of each tree
+        targets.npy         <- int32   output column each tree adds to
+
+Index arrays are stored as intp and the missing-value direction the way the
+evaluator uses it, so memory-mapped arrays are used as loaded, shared by all
+worker processes, with no per-process conversion copies.
+
+Registry versions get a `trees/` directory automatically (see registry.py).
+Existing models can be converted with:
+
+    python ml_engine/export_trees.py ml_engine/aqi_forecast_model.joblib
+    python ml_engine/export_trees.py ml_engine/registry/<version>
+"""
+import argparse
+import json
+import os
+import numpy as np
+
+FORMAT_VERSION = 2
+# Objectives whose prediction is the raw margin (base_score + sum of leaves)
+IDENTITY_OBJECTIVES = ('reg:squarederror', 'reg:squaredlogerror', 'reg:pseudohubererror',
+                       'reg:absoluteerror', 'reg:quantileerror')
+
+
+def trees_dir_for(model_path):
+    """Where the exported trees for a .joblib model live."""
+    return os.path.splitext(model_path)[0] + '.trees'
+
+
+def _parse_base_score(value):
+    # XGBoost 3 stores a vector string like "[1.5E2,1.4E2]", older versions a scalar
+    parsed = json.loads(value) if value.startswith('[') else float(value)
+    return np.atleast_1d(np.asarray(parsed, dtype=np.float32))
+
+
+def export_booster(model, out_dir):
+    """Write the packed arrays for a Booster (or XGBRegressor) into out_dir."""
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+
+    objective = learner['objective']['name']
+    if objective not in IDENTITY_OBJECTIVES:
+        raise ValueError(f"Cannot export objective {objective!r}: only identity-link regressors are supported")
+    gbm = learner['gradient_booster']
+    if gbm['name'] != 'gbtree':
+        raise ValueError(f"Cannot export booster type {gbm['name']!r}")
+
+    params = learner['learner_model_param']
+    num_targets = max(int(params.get('num_target', 1)), 1)
+    base_score = _parse_base_score(params['base_score'])
+    if len(base_score) == 1 and num_targets > 1:
+        base_score = np.repeat(base_score, num_targets)
+
+    trees = gbm['model']['trees']
+    feature, threshold, left, default_right, value, roots = [], [], [], [], [], []
+    max_depth = 0
+    offset = 0
+    for tree in trees:
+        if any(tree.get('split_type', [])):
+            raise ValueError("Categorical splits are not supported")
+        if int(tree['tree_param'].get('size_leaf_vector', 1)) > 1:
+            raise ValueError("Vector-leaf (multi_output_tree) models are not supported")
+        lc = np.asarray(tree['left_children'], dtype=np.int32)
+        rc = np.asarray(tree['right_children'], dtype=np.int32)
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        order, depth = _breadth_first(lc, rc)
+        new_id = np.empty(len(lc), dtype=np.int32)
+        new_id[order] = np.arange(len(order), dtype=np.int32) + offset
+
+        is_leaf = lc[order] == -1
+        feature.append(np.where(is_leaf, 0, np.asarray(tree['split_indices'])[order]).astype(np.int32))
+        threshold.append(np.where(is_leaf, np.float32(np.inf), conditions[order]))
+        left.append(np.where(is_leaf, new_id[order], new_id[np.maximum(lc[order], 0)]))
+        default_right.append(~np.asarray(tree['default_left'], dtype=bool)[order] & ~is_leaf)
+        # For leaves XGBoost keeps the (learning-rate scaled) leaf value in split_conditions
+        value.append(np.where(is_leaf, conditions[order], np.float32(0)))
+        roots.append(offset)
+        max_depth = max(max_depth, depth)
+        offset += len(order)
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        'feature': np.concatenate(feature).astype(np.intp),
+        'threshold': np.concatenate(threshold).astype(np.float32),
+        'left': np.concatenate(left).astype(np.intp),
+        'default_right': np.concatenate(default_right),
+        'value': np.concatenate(value).astype(np.float32),
+        'roots': np.asarray(roots, dtype=np.intp),
+        'targets': np.asarray(gbm['model']['tree_info'], dtype=np.int32),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f'{name}.npy'), array)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'num_features': int(params['num_feature']),
+        'num_targets': num_targets,
+        'num_trees': len(trees),
+        'max_depth': max_depth,
+        'base_score': base_score.tolist(),
+    }
+    with open(os.path.join(out_dir, 'trees.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _breadth_first(left, right):
+    """Reachable nodes in breadth-first order (siblings adjacent) and the tree depth."""
+    order = [0]
+    level = [0]
+    depth = 0
+    while True:
+        children = [child for node in level if left[node] != -1 for child in (left[node], right[node])]
+        if not children:
+            return np.asarray(order, dtype=np.int32), depth
+        order.extend(children)
+        level = children
+        depth += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export an XGBoost model to packed NumPy arrays.")
+    parser.add_argument('model', help='A .joblib model or a model registry version directory')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.model):
+        import xgboost as xgb
+        with open(os.path.join(args.model, 'manifest.json')) as f:
+            manifest = json.load(f)
+        model = xgb.Booster(model_file=os.path.join(args.model, manifest.get('model_file', 'model.ubj')))
+        out_dir = os.path.join(args.model, 'trees')
+    else:
+        import joblib
+        model = joblib.load(args.model)
+        out_dir = trees_dir_for(args.model)
+    meta = export_booster(model, out_dir)
+    print(f"Exported {meta['num_trees']} trees (max depth {meta['max_depth']}) to {out_dir}")
@@ -1,6 +1,14 @@
+import os
+import sys
 import pandas as pd
 import numpy as np
 
+# shared/ (the CPCB tables, also used by the API) lives at the repo root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from shared.cpcb import POLLUTANTS, aqi_array
+
 def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Basic data cleaning: drop duplicates, handle missing values.
@@ -28,3 +36,11 @@ def feature_engineering(df: pd.DataFrame) -> pd.DataFrame:
     # Drop rows with NaN created by lag/rolling
     df = df.dropna()
     return df
+
+def cpcb_aqi(df: pd.DataFrame) -> np.ndarray:
+    """
+    CPCB AQI of every row, from the pollutant columns (CO in mg/m³), using
+    the same sub-index tables as the API so labels match the AQI it serves.
+    """
+    columns = {p: df[p].to_numpy(dtype=np.float64) for p in POLLUTANTS if p in df.columns}
+    return aqi_array(columns)[0]
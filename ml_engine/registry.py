@@ -0,0 +1,138 @@
+"""
+Versioned model registry shared by the training scripts and the API.
+
+    ml_engine/registry/
+        active                  <- name of the version being served
+        shadow                  <- optional candidate scored alongside it
+        20260101-120000/
+            model.ubj           <- XGBoost native (UBJSON) booster
+            trees/              <- the same trees as NumPy arrays (export_trees.py)
+            manifest.json       <- version, feature schema, metrics
+
+The API watches the `active` and `shadow` pointers and hot-swaps models when
+they change. Manage them with:
+
+    python ml_engine/registry.py list
+    python ml_engine/registry.py activate <version>
+    python ml_engine/registry.py shadow <version>
+    python ml_engine/registry.py shadow --clear
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from export_trees import export_booster
+
+REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "ml_engine/registry")
+MODEL_FILE = "model.ubj"
+MANIFEST_FILE = "manifest.json"
+POINTERS = ("active", "shadow")
+
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def publish(model, features, metrics, registry_dir=REGISTRY_DIR, version=None,
+            rolling_window=3, extra=None, activate=True):
+    """Save a trained model (Booster or XGBRegressor) as a new registry version."""
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    version_dir = os.path.join(registry_dir, version)
+    if os.path.exists(version_dir):
+        raise FileExistsError(f"Model version {version} already exists in {registry_dir}")
+
+    # Build the version in a scratch directory and rename it into place, so a
+    # watcher never sees a half-written version. A scratch directory left by
+    # an interrupted run is discarded, not built on.
+    tmp_dir = version_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    booster.save_model(os.path.join(tmp_dir, MODEL_FILE))
+    # What the API actually serves: no xgboost needed at runtime
+    export_booster(booster, os.path.join(tmp_dir, "trees"))
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "model_file": MODEL_FILE,
+        "features": list(features),
+        "rolling_window": rolling_window,
+        "metrics": metrics,
+        **(extra or {}),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_dir, version_dir)
+
+    if activate:
+        set_pointer("active", version, registry_dir)
+    return version
+
+
+def set_pointer(name, version, registry_dir=REGISTRY_DIR):
+    """Point `active` or `shadow` at a version (None clears it)."""
+    if name not in POINTERS:
+        raise ValueError(f"Unknown pointer {name!r}")
+    path = os.path.join(registry_dir, name)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if not os.path.exists(os.path.join(registry_dir, version, MANIFEST_FILE)):
+        raise ValueError(f"No model version {version!r} in {registry_dir}")
+    _write_atomic(path, version + "\n")
+
+
+def read_pointer(name, registry_dir=REGISTRY_DIR):
+    try:
+        with open(os.path.join(registry_dir, name)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """Manifests of all versions, oldest first."""
+    if not os.path.isdir(registry_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(registry_dir)):
+        path = os.path.join(registry_dir, name, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the model registry.")
+    parser.add_argument("--registry-dir", default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    activate_cmd = commands.add_parser("activate")
+    activate_cmd.add_argument("version")
+    shadow_cmd = commands.add_parser("shadow")
+    shadow_cmd.add_argument("version", nargs="?")
+    shadow_cmd.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        active = read_pointer("active", args.registry_dir)
+        shadow = read_pointer("shadow", args.registry_dir)
+        for manifest in list_versions(args.registry_dir):
+            version = manifest["version"]
+            mark = "*" if version == active else ("s" if version == shadow else " ")
+            print(f"{mark} {version}  {manifest['created_at']}  {json.dumps(manifest.get('metrics', {}))}")
+    elif args.command == "activate":
+        set_pointer("active", args.version, args.registry_dir)
+        print(f"Activated {args.version}")
+    elif args.command == "shadow":
+        if not args.clear and not args.version:
+            parser.error("shadow needs a version or --clear")
+        set_pointer("shadow", None if args.clear else args.version, args.registry_dir)
+        print("Shadow cleared" if args.clear else f"Shadowing {args.version}")
@@ -0,0 +1,104 @@
+import pandas as pd
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import mean_absolute_error, r2_score
+import joblib
+import json
+from preprocessing import clean_data, cpcb_aqi, feature_engineering
+from export_trees import export_booster, trees_dir_for
+
+# Forecast horizons in hours. One multi-output model predicts all of them.
+HORIZONS = [1, 3, 6, 12, 24, 48, 72]
+
+# 1. Generate Synthetic Hourly Data
+def generate_synthetic_hourly_data(n_hours=24 * 365, seed=42):
+    """
+    Hourly pollutant series with a daily cycle and slowly drifting levels,
+    so future AQI actually depends on the recent past.
+    """
+    np.random.seed(seed)
+    dates = pd.date_range(start='2023-01-01', periods=n_hours, freq='h')
+    hour = dates.hour.to_numpy()
+    daily_cycle = 1 + 0.3 * np.sin(2 * np.pi * (hour - 8) / 24)
+
+    def drifting(low, high):
+        # AR(1) level mapped into [low, high]
+        level = np.empty(n_hours)
+        level[0] = 0.0
+        noise = np.random.normal(0, 0.1, n_hours)
+        for i in range(1, n_hours):
+            level[i] = 0.98 * level[i - 1] + noise[i]
+        scaled = (np.tanh(level) + 1) / 2
+        return low + (high - low) * scaled
+
+    data = {
+        'date': dates,
+        'pm25': drifting(10, 300) * daily_cycle,
+        'pm10': drifting(20, 400) * daily_cycle,
+        'no2': drifting(5, 100) * daily_cycle,
+        'so2': drifting(5, 50),
+        'co': drifting(0.1, 5),
+        'o3': drifting(10, 150) * (2 - daily_cycle),
+        'temperature': 25 + 10 * np.sin(2 * np.pi * (hour - 14) / 24) + np.random.normal(0, 1, n_hours),
+        'humidity': np.random.uniform(20, 90, n_hours),
+        'wind_speed': np.random.uniform(0, 20, n_hours)
+    }
+
+    df = pd.DataFrame(data)
+
+    # CPCB AQI, as in train_model.py
+    df['aqi'] = cpcb_aqi(df)
+
+    return df
+
+def add_horizon_targets(df: pd.DataFrame) -> pd.DataFrame:
+    """Add aqi_h{h} = AQI h hours ahead for every horizon; drop rows without all of them."""
+    for h in HORIZONS:
+        df[f'aqi_h{h}'] = df['aqi'].shift(-h)
+    return df.dropna()
+
+if __name__ == "__main__":
+    print("Generating synthetic hourly data...")
+    df = generate_synthetic_hourly_data()
+
+    print("Preprocessing...")
+    df = clean_data(df)
+    df = feature_engineering(df)
+    df = add_horizon_targets(df)
+
+    # Same inputs as the nowcast model so serving can share feature building
+    targets = [f'aqi_h{h}' for h in HORIZONS]
+    features = [c for c in df.columns if c != 'aqi' and c not in targets]
+
+    X = df[features]
+    y = df[targets]
+
+    # Time-ordered split: never train on the future
+    split = int(len(df) * 0.8)
+    X_train, X_test = X.iloc[:split], X.iloc[split:]
+    y_train, y_test = y.iloc[:split], y.iloc[split:]
+
+    print(f"Training with {X_train.shape[0]} samples, {X.shape[1]} features and {len(HORIZONS)} horizons.")
+    model = xgb.XGBRegressor(
+        n_estimators=200,
+        learning_rate=0.1,
+        max_depth=5,
+        tree_method='hist',
+        objective='reg:squarederror'
+    )
+    model.fit(X_train, y_train)
+
+    print("Evaluating model...")
+    predictions = model.predict(X_test)
+    for i, h in enumerate(HORIZONS):
+        mae = mean_absolute_error(y_test.iloc[:, i], predictions[:, i])
+        r2 = r2_score(y_test.iloc[:, i], predictions[:, i])
+        print(f"+{h}h  MAE: {mae:.2f}  R²: {r2:.2f}")
+
+    print("Saving model...")
+    joblib.dump(model, 'ml_engine/aqi_forecast_model.joblib')
+    # The API serves the forecast model from these arrays, without xgboost
+    export_booster(model, trees_dir_for('ml_engine/aqi_forecast_model.joblib'))
+    with open('ml_engine/aqi_forecast_model.features.json', 'w') as f:
+        json.dump({"features": features, "rolling_window": 3, "horizons": HORIZONS}, f, indent=2)
+    print("Model saved to ml_engine/aqi_forecast_model.joblib")
@@ -3,9 +3,15 @@ import numpy as np
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+import argparse
+import json
 import joblib
-import os
-from preprocessing import clean_data, feature_engineering
+from preprocessing import clean_data, cpcb_aqi, feature_engineering
+from registry import REGISTRY_DIR, publish
+from export_trees import export_booster, trees_dir_for
+
+# Bundled model the API serves when the registry has no active version
+LEGACY_MODEL_PATH = 'ml_engine/aqi_xgboost_model.joblib'
 
 # 1. Generate Synthetic Data
 def generate_synthetic_data(n_samples=1000):
@@ -27,18 +33,17 @@ def generate_synthetic_data(n_samples=1000):
     
     df = pd.DataFrame(data)
     
-    # Simulate AQI dependency (simplified formula approximation)
-    df['aqi'] = (
-        0.5 * df['pm25'] + 
-        0.3 * df['pm10'] + 
-        0.1 * df['no2'] + 
-        0.1 * df['so2'] +
-        np.random.normal(0, 10, n_samples) # Noise
-    )
+    # CPCB AQI: the highest pollutant sub-index
+    df['aqi'] = cpcb_aqi(df)
     
     return df
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the AQI nowcast model and publish it to the registry.")
+    parser.add_argument("--legacy", action="store_true",
+                        help=f"Also save it as {LEGACY_MODEL_PATH} (with its feature schema and trees)")
+    args = parser.parse_args()
+
     print("Generating synthetic data...")
     df = generate_synthetic_data()
     
@@ -77,5 +82,14 @@ if __name__ == "__main__":
     print(f"R²: {r2:.2f}")
     
     print("Saving model...")
-    joblib.dump(model, 'ml_engine/aqi_xgboost_model.joblib')
-    print("Model saved to ml_engine/aqi_xgboost_model.joblib")
+    # The serving side builds feature vectors positionally, so the manifest
+    # records the exact column order the model was trained on.
+    version = publish(model, features, {"rmse": float(rmse), "mae": float(mae), "r2": float(r2)})
+    print(f"Model version {version} saved to {REGISTRY_DIR} and activated")
+
+    if args.legacy:
+        joblib.dump(model, LEGACY_MODEL_PATH)
+        export_booster(model, trees_dir_for(LEGACY_MODEL_PATH))
+        with open(LEGACY_MODEL_PATH.replace('.joblib', '.features.json'), 'w') as f:
+            json.dump({"features": features, "rolling_window": 3}, f, indent=2)
+        print(f"Model also saved to {LEGACY_MODEL_PATH}")
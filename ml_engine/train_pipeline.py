@@ -0,0 +1,269 @@
+"""
+Out-of-core training pipeline for multi-station hourly data.
+
+    python ml_engine/train_pipeline.py --data-dir data/measurements --work-dir build/pipeline
+
+Input is a directory of Parquet files (any layout, e.g. station=<id>/<month>.parquet)
+with a `station` column, a `date` column, the raw pollutant/weather columns and
+the `aqi` target. Stages:
+
+1. featurize: stream partitions one at a time through clean_data and
+   feature_engineering, per station, carrying each station's last rows into
+   its next partition so lags never cross stations or chunk boundaries.
+   Feature chunks are written back to Parquet in the work dir.
+2. cross-validate: expanding-window time splits, fed to XGBoost through a
+   DataIter over the chunks (external-memory QuantileDMatrix, hist trees,
+   all cores).
+3. train: the final model on all data with the best boosting round count.
+
+Wall time, peak RSS and metrics are printed per stage and saved to report.json.
+The model is published to the model registry (see registry.py) with the
+cross-validation metrics in its manifest.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from preprocessing import clean_data, feature_engineering
+from registry import REGISTRY_DIR, publish
+
+TARGET = 'aqi'
+# Rows carried between partitions of the same station: enough for lag-1 and
+# the 3-row rolling mean in feature_engineering
+CARRY_ROWS = 2
+
+PARAMS = {
+    'objective': 'reg:squarederror',
+    'tree_method': 'hist',
+    'max_depth': 6,
+    'eta': 0.1,
+    'subsample': 0.8,
+    'max_bin': 256,
+    'nthread': os.cpu_count(),
+    'eval_metric': ['rmse', 'mae'],
+}
+
+
+class StageReport:
+    """Collects wall time, peak RSS and metrics for each pipeline stage."""
+
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, fn, *args, **kwargs):
+        print(f"[{name}] starting...")
+        start = time.perf_counter()
+        result, metrics = fn(*args, **kwargs)
+        # ru_maxrss is in KiB on Linux and is the process peak so far
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        stage = {
+            'stage': name,
+            'wall_seconds': round(time.perf_counter() - start, 3),
+            'peak_rss_mb': round(peak_rss_mb, 1),
+            'metrics': metrics,
+        }
+        self.stages.append(stage)
+        summary = {k: v for k, v in metrics.items() if not isinstance(v, list)}
+        print(f"[{name}] {stage['wall_seconds']}s, peak RSS {stage['peak_rss_mb']} MB, {summary}")
+        return result
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'stages': self.stages}, f, indent=2)
+
+
+def featurize(data_dir, work_dir):
+    """Stage 1: raw Parquet partitions -> feature chunks, one station at a time."""
+    files = sorted(glob.glob(os.path.join(data_dir, '**', '*.parquet'), recursive=True))
+    if not files:
+        raise SystemExit(f"No Parquet files found under {data_dir}")
+    chunk_dir = os.path.join(work_dir, 'features')
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    carry = {}  # station -> last CARRY_ROWS raw rows already featurized
+    chunks = []
+    rows = 0
+    features = None
+    for i, path in enumerate(files):
+        part = pd.read_parquet(path)
+        part['date'] = pd.to_datetime(part['date'])
+        out = []
+        for station, group in part.groupby('station', sort=False):
+            group = group.sort_values('date')
+            previous = carry.get(station)
+            if previous is not None:
+                group = pd.concat([previous, group], ignore_index=True)
+            carried = 0 if previous is None else len(previous)
+            carry[station] = group.tail(CARRY_ROWS)
+
+            featurized = feature_engineering(clean_data(group.drop(columns='station')))
+            # feature_engineering drops the first rows it cannot fill; also drop
+            # the carried rows, which were emitted with the previous chunk
+            featurized = featurized[featurized.index > group['date'].iloc[carried - 1]] if carried else featurized
+            if featurized.empty:
+                continue
+            featurized = featurized.reset_index()
+            featurized['station'] = station
+            out.append(featurized)
+        if not out:
+            continue
+
+        chunk = pd.concat(out, ignore_index=True)
+        if features is None:
+            features = [c for c in chunk.columns if c not in ('date', 'station', TARGET)]
+        chunk_path = os.path.join(chunk_dir, f'chunk-{i:05d}.parquet')
+        chunk[['date', 'station', TARGET] + features].to_parquet(chunk_path, index=False)
+        chunks.append(chunk_path)
+        rows += len(chunk)
+
+    dates = [pd.read_parquet(p, columns=['date'])['date'] for p in chunks]
+    start = min(d.min() for d in dates)
+    end = max(d.max() for d in dates)
+    return (chunks, features, start, end), {'partitions': len(files), 'rows': rows, 'features': len(features)}
+
+
+class ChunkIter(xgb.DataIter):
+    """Feeds feature chunks to XGBoost one at a time, optionally limited to a date range."""
+
+    def __init__(self, chunks, features, start=None, end=None, cache_prefix=None):
+        self.chunks = chunks
+        self.features = features
+        self.start = start
+        self.end = end
+        self._i = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        while self._i < len(self.chunks):
+            chunk = pd.read_parquet(self.chunks[self._i], columns=['date', TARGET] + self.features)
+            self._i += 1
+            mask = np.ones(len(chunk), dtype=bool)
+            if self.start is not None:
+                mask &= (chunk['date'] >= self.start).to_numpy()
+            if self.end is not None:
+                mask &= (chunk['date'] < self.end).to_numpy()
+            if not mask.any():
+                continue
+            input_data(
+                data=chunk.loc[mask, self.features].to_numpy(np.float32),
+                label=chunk.loc[mask, TARGET].to_numpy(np.float32),
+            )
+            return True
+        return False
+
+    def reset(self):
+        self._i = 0
+
+
+def build_dmatrix(chunks, features, work_dir, name, start=None, end=None, ref=None, external_memory=True):
+    if external_memory:
+        # Pages are quantized and kept on disk; only one page is in memory at a time
+        it = ChunkIter(chunks, features, start, end, cache_prefix=os.path.join(work_dir, 'cache', name))
+        return xgb.ExtMemQuantileDMatrix(it, max_bin=PARAMS['max_bin'], ref=ref,
+                                         nthread=PARAMS['nthread'])
+    # Still built chunk by chunk, but the quantized matrix is held in memory
+    it = ChunkIter(chunks, features, start, end)
+    return xgb.QuantileDMatrix(it, max_bin=PARAMS['max_bin'], ref=ref, nthread=PARAMS['nthread'])
+
+
+def time_splits(start, end, folds):
+    """Expanding-window cut points: fold k trains on [start, cuts[k]) and validates on [cuts[k], cuts[k+1])."""
+    cuts = list(pd.date_range(start, end, periods=folds + 2))[1:]
+    # The last validation window includes the final reading
+    cuts[-1] = end + pd.Timedelta(seconds=1)
+    return cuts
+
+
+def cross_validate(chunks, features, start, end, work_dir, folds, rounds, external_memory):
+    """Stage 2: expanding-window time-series cross-validation."""
+    os.makedirs(os.path.join(work_dir, 'cache'), exist_ok=True)
+    cuts = time_splits(start, end, folds)
+    results = []
+    for k in range(folds):
+        train_end, valid_end = cuts[k], cuts[k + 1]
+        dtrain = build_dmatrix(chunks, features, work_dir, f'train{k}', None, train_end,
+                               external_memory=external_memory)
+        dvalid = build_dmatrix(chunks, features, work_dir, f'valid{k}', train_end, valid_end,
+                               ref=dtrain, external_memory=external_memory)
+        history = {}
+        booster = xgb.train(PARAMS, dtrain, num_boost_round=rounds, evals=[(dvalid, 'valid')],
+                            early_stopping_rounds=20, evals_result=history, verbose_eval=False)
+        best = booster.best_iteration
+        results.append({
+            'fold': k,
+            'train_until': str(train_end),
+            'valid_until': str(valid_end),
+            'best_round': best + 1,
+            'rmse': round(history['valid']['rmse'][best], 4),
+            'mae': round(history['valid']['mae'][best], 4),
+        })
+        print(f"  fold {k}: {results[-1]}")
+
+    metrics = {
+        'folds': results,
+        'mean_rmse': round(float(np.mean([r['rmse'] for r in results])), 4),
+        'mean_mae': round(float(np.mean([r['mae'] for r in results])), 4),
+    }
+    best_rounds = int(np.mean([r['best_round'] for r in results]))
+    return best_rounds, metrics
+
+
+def train_final(chunks, features, work_dir, rounds, external_memory):
+    """Stage 3: train on everything with the cross-validated round count."""
+    dtrain = build_dmatrix(chunks, features, work_dir, 'final', external_memory=external_memory)
+    booster = xgb.train(PARAMS, dtrain, num_boost_round=rounds)
+    booster.feature_names = features
+    return booster, {'rounds': rounds, 'rows': dtrain.num_row()}
+
+
+def generate_partitions(out_dir, stations=4, months=3, seed=42):
+    """
+    Write synthetic multi-station hourly data as station=<id>/<month>.parquet
+    (for smoke tests). Each station gets its own seed, so their series differ.
+    """
+    from train_forecast import generate_synthetic_hourly_data
+    hours = months * 30 * 24
+    for s in range(stations):
+        df = generate_synthetic_hourly_data(hours, seed=seed + s)
+        df['station'] = f'S{s:03d}'
+        station_dir = os.path.join(out_dir, f'station=S{s:03d}')
+        os.makedirs(station_dir, exist_ok=True)
+        for month, part in df.groupby(df['date'].dt.to_period('M')):
+            part.to_parquet(os.path.join(station_dir, f'{month}.parquet'), index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', required=True, help='Directory of input Parquet partitions')
+    parser.add_argument('--work-dir', default='build/pipeline', help='Feature chunks, caches and report')
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=500, help='Maximum boosting rounds per fold')
+    parser.add_argument('--in-memory', action='store_true', help='Use an in-core QuantileDMatrix')
+    parser.add_argument('--synthetic', action='store_true', help='Generate synthetic partitions into --data-dir first')
+    parser.add_argument('--registry-dir', default=REGISTRY_DIR)
+    parser.add_argument('--no-activate', action='store_true',
+                        help='Publish without serving it (e.g. to shadow it first)')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        generate_partitions(args.data_dir)
+    os.makedirs(args.work_dir, exist_ok=True)
+    external_memory = not args.in_memory
+
+    report = StageReport()
+    chunks, features, start, end = report.run('featurize', featurize, args.data_dir, args.work_dir)
+    rounds = report.run('cross_validate', cross_validate, chunks, features, start, end,
+                        args.work_dir, args.folds, args.rounds, external_memory)
+    booster = report.run('train', train_final, chunks, features, args.work_dir, rounds, external_memory)
+    report.save(os.path.join(args.work_dir, 'report.json'))
+
+    cv = report.stages[1]['metrics']
+    version = publish(booster, features, {'rmse': cv['mean_rmse'], 'mae': cv['mean_mae']},
+                      registry_dir=args.registry_dir, activate=not args.no_activate,
+                      extra={'training': {'pipeline': 'train_pipeline', 'stages': report.stages}})
+    print(f"Model version {version} saved to {args.registry_dir}")
@@ -0,0 +1,81 @@
+"""
+CPCB National AQI sub-index tables and math, shared by the API
+(backend/app/services/aqi_service.py) and the training scripts
+(ml_engine/preprocessing.py) so model labels match the AQI that is served.
+
+Only NumPy is needed here; both sides put the repo root on sys.path.
+"""
+import math
+from bisect import bisect_left
+import numpy as np
+
+# CPCB National AQI breakpoints. Concentrations are in µg/m³ except CO in
+# mg/m³ (PM and SO2/NO2 are 24-hour values, CO and O3 8-hour values in the
+# CPCB tables). Each pollutant's list maps onto SUB_INDEX_BREAKPOINTS, and the
+# sub-index is linear between neighbouring breakpoints. The CPCB tables leave
+# the Severe band open-ended; the last concentration is the point where the
+# sub-index reaches 500, above which it is capped.
+SUB_INDEX_BREAKPOINTS = [0, 50, 100, 200, 300, 400, 500]
+POLLUTANT_BREAKPOINTS = {
+    "pm25": [0, 30, 60, 90, 120, 250, 380],
+    "pm10": [0, 50, 100, 250, 350, 430, 510],
+    "no2": [0, 40, 80, 180, 280, 400, 520],
+    "so2": [0, 40, 80, 380, 800, 1600, 2400],
+    "co": [0, 1.0, 2.0, 10, 17, 34, 51],
+    "o3": [0, 50, 100, 168, 208, 748, 1000],
+}
+POLLUTANTS = list(POLLUTANT_BREAKPOINTS)
+
+_CONC_ARRAYS = {p: np.array(bp, dtype=np.float64) for p, bp in POLLUTANT_BREAKPOINTS.items()}
+_SUB_ARRAY = np.array(SUB_INDEX_BREAKPOINTS, dtype=np.float64)
+
+
+def sub_index(pollutant: str, concentration: float) -> float:
+    """
+    CPCB sub-index for one pollutant concentration. Returns NaN for a missing
+    (None/NaN) or negative concentration.
+    """
+    if concentration is None or not concentration >= 0:
+        return math.nan
+    conc = POLLUTANT_BREAKPOINTS[pollutant]
+    i = bisect_left(conc, concentration)
+    if i == 0:
+        return 0.0
+    if i == len(conc):
+        return float(SUB_INDEX_BREAKPOINTS[-1])
+    c_lo, c_hi = conc[i - 1], conc[i]
+    i_lo, i_hi = SUB_INDEX_BREAKPOINTS[i - 1], SUB_INDEX_BREAKPOINTS[i]
+    return i_lo + (concentration - c_lo) * (i_hi - i_lo) / (c_hi - c_lo)
+
+
+def sub_index_array(pollutant: str, concentrations) -> np.ndarray:
+    """Vectorized sub_index over an array of concentrations."""
+    c = np.asarray(concentrations, dtype=np.float64)
+    conc = _CONC_ARRAYS[pollutant]
+    i = np.clip(np.searchsorted(conc, c, side="left"), 1, len(conc) - 1)
+    c_lo, c_hi = conc[i - 1], conc[i]
+    i_lo, i_hi = _SUB_ARRAY[i - 1], _SUB_ARRAY[i]
+    result = i_lo + (np.clip(c, c_lo, c_hi) - c_lo) * (i_hi - i_lo) / (c_hi - c_lo)
+    result[~(c >= 0)] = np.nan
+    return result
+
+
+def aqi_array(columns: dict) -> tuple:
+    """
+    CPCB AQI (the highest sub-index) of equal-length concentration arrays
+    keyed like POLLUTANTS; absent keys are skipped. Returns (aqi, dominant,
+    sub_indices): aqi is NaN and dominant (an index into POLLUTANTS) -1 where
+    no pollutant is usable.
+    """
+    present = [p for p in POLLUTANTS if columns.get(p) is not None]
+    if not present:
+        raise ValueError(f"At least one of {POLLUTANTS} is required.")
+    sub_indices = {p: sub_index_array(p, columns[p]) for p in present}
+
+    stacked = np.stack([sub_indices[p] for p in present])
+    usable = ~np.isnan(stacked)
+    best = np.argmax(np.where(usable, stacked, -np.inf), axis=0)
+    aqi = np.take_along_axis(stacked, best[np.newaxis], axis=0)[0]
+    dominant = np.array([POLLUTANTS.index(p) for p in present])[best]
+    dominant[~usable.any(axis=0)] = -1
+    return aqi, dominant, sub_indices
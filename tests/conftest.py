@@ -0,0 +1,86 @@
+"""
+Shared test setup. Tests run from the repo root with `python -m pytest`;
+the backend's `app` package, `shared`, the ml_engine scripts and the
+benchmark stubs (benchmarks/stubs.py) are made importable here.
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import httpx
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_ROOT, *(os.path.join(REPO_ROOT, d) for d in ("backend", "ml_engine", "benchmarks"))):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from stubs import serve_open_meteo  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_port(port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+class FakeClock:
+    """Monotonic clock for the `clock=` hooks; advanced by hand."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(scope="session")
+def _open_meteo_server():
+    """Base URL of the Open-Meteo stub, running in its own process for the session."""
+    port = free_port()
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve_open_meteo, args=(port, 0.0), daemon=True)
+    process.start()
+    try:
+        asyncio.run(wait_for_port(port))
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.join()
+
+
+@pytest.fixture
+def open_meteo_stub(_open_meteo_server):
+    """
+    (air-quality URL, set_faults) for the healthy stub; `set_faults(error_rate,
+    latency_ms)` injects failures or delay for the rest of the test.
+    """
+    def set_faults(error_rate: float = 0.0, latency_ms: float = 0.0) -> None:
+        httpx.get(f"{_open_meteo_server}/faults", params={"error_rate": error_rate, "latency_ms": latency_ms})
+
+    set_faults()
+    yield f"{_open_meteo_server}/v1/air-quality", set_faults
+    set_faults()
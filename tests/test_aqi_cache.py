@@ -0,0 +1,131 @@
+import asyncio
+
+from app.services.aqi_cache import GeoCache, cell_center, snap_to_cell
+from app.services.shared_cache import LocalSharedCache
+
+
+class CountingLoader:
+    def __init__(self, delay: float = 0.0, value=None):
+        self.calls = []
+        self.delay = delay
+        self.value = value
+
+    async def __call__(self, lat, lon):
+        self.calls.append((lat, lon))
+        await asyncio.sleep(self.delay)
+        return self.value if self.value is not None else {"aqi": len(self.calls), "lat": lat, "lon": lon}
+
+
+def test_snap_to_cell_and_center():
+    cell = snap_to_cell(28.6139, 77.2090, 0.05)
+    assert cell == (572, 1544)
+    lat, lon = cell_center(cell, 0.05)
+    assert snap_to_cell(lat, lon, 0.05) == cell
+
+
+def test_nearby_points_share_one_load(clock):
+    async def run():
+        cache = GeoCache(ttl=60, clock=clock)
+        loader = CountingLoader(delay=0.01)
+        results = await asyncio.gather(*(
+            cache.get_or_load(28.61 + i * 0.001, 77.21, loader) for i in range(10)
+        ))
+        return cache, loader, results
+
+    cache, loader, results = asyncio.run(run())
+    assert len(loader.calls) == 1
+    # The loader gets the cell centre, not the caller's coordinate
+    assert loader.calls[0] == cell_center(cache.cell_for(28.61, 77.21), cache.cell_size)
+    assert all(result is results[0] for result in results)
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 9
+    assert stats["inflight"] == 0
+
+
+def test_cancelled_caller_does_not_abort_shared_load(clock):
+    async def run():
+        cache = GeoCache(ttl=60, clock=clock)
+        loader = CountingLoader(delay=0.05)
+        first = asyncio.ensure_future(cache.get_or_load(28.61, 77.21, loader))
+        second = asyncio.ensure_future(cache.get_or_load(28.61, 77.21, loader))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return loader, await second
+
+    loader, value = asyncio.run(run())
+    assert value["aqi"] == 1
+    assert len(loader.calls) == 1
+
+
+def test_ttl_expiry_reloads(clock):
+    async def run():
+        cache = GeoCache(ttl=60, clock=clock)
+        loader = CountingLoader()
+        first = await cache.get_or_load(28.61, 77.21, loader)
+        clock.advance(59)
+        cached = await cache.get_or_load(28.61, 77.21, loader)
+        clock.advance(1)
+        reloaded = await cache.get_or_load(28.61, 77.21, loader)
+        return first, cached, reloaded
+
+    first, cached, reloaded = asyncio.run(run())
+    assert cached is first
+    assert reloaded["aqi"] == 2
+
+
+def test_uncacheable_values_are_not_stored(clock):
+    async def run():
+        cache = GeoCache(ttl=60, clock=clock)
+        loader = CountingLoader(value={"aqi": -1})
+        await cache.get_or_load(28.61, 77.21, loader, cacheable=lambda v: v["aqi"] != -1)
+        await cache.get_or_load(28.61, 77.21, loader, cacheable=lambda v: v["aqi"] != -1)
+        return cache, loader
+
+    cache, loader = asyncio.run(run())
+    assert len(loader.calls) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_stale_value_kept_for_stale_window(clock):
+    cache = GeoCache(ttl=60, stale_seconds=300, clock=clock)
+    cell = (1, 2)
+    cache.put(cell, {"aqi": 42})
+    clock.advance(61)
+    assert cache.get(cell) is None
+    value, fetched_at = cache.get_stale(cell)
+    assert value == {"aqi": 42}
+    assert fetched_at > 0
+    clock.advance(300)
+    assert cache.get_stale(cell) is None
+    assert cache.get(cell) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction(clock):
+    cache = GeoCache(ttl=60, max_entries=2, clock=clock)
+    cache.put((0, 0), "a")
+    cache.put((0, 1), "b")
+    assert cache.get((0, 0)) == "a"
+    cache.put((0, 2), "c")
+    assert cache.get((0, 1)) is None
+    assert cache.get((0, 0)) == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_shared_tier_serves_other_workers(clock):
+    async def run():
+        shared = LocalSharedCache()
+        worker_a = GeoCache(ttl=60, clock=clock, shared=shared)
+        worker_b = GeoCache(ttl=60, clock=clock, shared=shared)
+        loader = CountingLoader()
+        a = await worker_a.get_or_load(28.61, 77.21, loader)
+        b = await worker_b.get_or_load(28.61, 77.21, loader)
+        return worker_b, loader, a, b
+
+    worker_b, loader, a, b = asyncio.run(run())
+    assert len(loader.calls) == 1
+    assert a == b
+    assert worker_b.stats()["shared_hits"] == 1
+    # Cached locally for what is left of the original TTL
+    assert 0 < worker_b.ttl_remaining(worker_b.cell_for(28.61, 77.21)) <= 60
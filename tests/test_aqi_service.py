@@ -0,0 +1,94 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.services.aqi_service import (
+    AQI_CATEGORIES, POLLUTANT_BREAKPOINTS, POLLUTANTS, SUB_INDEX_BREAKPOINTS, UNKNOWN_BAND,
+    classify_aqi, classify_aqi_array, compute_aqi, compute_aqi_array, sub_index, sub_index_array,
+)
+
+
+@pytest.mark.parametrize("aqi, category", [
+    (0, "Good"), (50, "Good"), (50.5, "Satisfactory"), (100, "Satisfactory"), (100.01, "Moderate"),
+    (200, "Moderate"), (201, "Poor"), (300, "Poor"), (301, "Very Poor"), (400, "Very Poor"),
+    (400.5, "Severe"), (500, "Severe"), (650, "Severe"),
+    (-1, "Unknown"), (math.nan, "Unknown"), (None, "Unknown"), ("high", "Unknown"),
+])
+def test_band_edges(aqi, category):
+    assert classify_aqi(aqi)["category"] == category
+
+
+def test_band_array_matches_scalar():
+    values = [0, 50, 50.5, 100, 100.01, 200, 201, 300, 301, 400, 400.5, 500, 650, -1, math.nan]
+    bands = classify_aqi_array(values)
+    assert list(AQI_CATEGORIES[bands]) == [classify_aqi(v)["category"] for v in values]
+
+
+@pytest.mark.parametrize("pollutant", POLLUTANTS)
+def test_sub_index_at_breakpoints(pollutant):
+    concentrations = POLLUTANT_BREAKPOINTS[pollutant]
+    assert [sub_index(pollutant, c) for c in concentrations] == SUB_INDEX_BREAKPOINTS
+    np.testing.assert_array_equal(sub_index_array(pollutant, concentrations), SUB_INDEX_BREAKPOINTS)
+    # Capped above the table
+    assert sub_index(pollutant, concentrations[-1] * 2) == 500
+
+
+def test_sub_index_is_linear_between_breakpoints():
+    # PM2.5 60 -> 100 and 90 -> 200
+    assert sub_index("pm25", 75) == pytest.approx(150)
+    assert sub_index("co", 1.5) == pytest.approx(75)
+
+
+def test_missing_and_negative_concentrations():
+    assert math.isnan(sub_index("pm10", None))
+    assert math.isnan(sub_index("pm10", -5))
+    assert np.isnan(sub_index_array("pm10", [np.nan, -5])).all()
+
+
+def test_aqi_is_the_highest_sub_index():
+    result = compute_aqi({"pm25": 75, "pm10": 80, "no2": None, "co": 1.5})
+    assert result["aqi"] == pytest.approx(150)
+    assert result["dominant_pollutant"] == "pm25"
+    assert result["category"] == "Moderate"
+    assert result["sub_indices"]["no2"] is None
+    assert result["sub_indices"]["pm10"] == pytest.approx(80)
+
+
+def test_no_usable_pollutant_is_unknown():
+    result = compute_aqi({p: None for p in POLLUTANTS})
+    assert math.isnan(result["aqi"])
+    assert result["dominant_pollutant"] is None
+    assert result["category"] == "Unknown"
+
+    columns = compute_aqi_array({"pm25": [np.nan], "pm10": [-1.0]})
+    assert np.isnan(columns["aqi"][0])
+    assert columns["dominant_pollutant"][0] == -1
+    assert columns["band"][0] == UNKNOWN_BAND
+
+
+def test_array_matches_scalar():
+    rng = np.random.default_rng(0)
+    n = 500
+    columns = {p: rng.uniform(0, 1.3, n) * POLLUTANT_BREAKPOINTS[p][-1] for p in POLLUTANTS}
+    for values in columns.values():
+        values[rng.random(n) < 0.3] = np.nan
+    columns["pm25"][:5] = np.nan
+    for p in POLLUTANTS:
+        columns[p][0] = np.nan  # one row with nothing usable
+
+    result = compute_aqi_array(columns)
+    for i in range(n):
+        scalar = compute_aqi({p: None if np.isnan(columns[p][i]) else columns[p][i] for p in POLLUTANTS})
+        if scalar["dominant_pollutant"] is None:
+            assert np.isnan(result["aqi"][i])
+            assert result["dominant_pollutant"][i] == -1
+        else:
+            assert result["aqi"][i] == pytest.approx(scalar["aqi"])
+            assert POLLUTANTS[result["dominant_pollutant"][i]] == scalar["dominant_pollutant"]
+        assert AQI_CATEGORIES[result["band"][i]] == scalar["category"]
+
+
+def test_array_needs_a_pollutant_column():
+    with pytest.raises(ValueError):
+        compute_aqi_array({"temperature": [25.0]})
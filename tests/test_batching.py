@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.batching import MicroBatcher
+
+
+def row_sums(X):
+    return X.sum(axis=1)
+
+
+def test_concurrent_rows_share_a_batch():
+    async def run():
+        batcher = MicroBatcher(row_sums, window_ms=20, max_batch_size=64)
+        try:
+            rows = [np.full(3, i, dtype=np.float32) for i in range(10)]
+            return batcher, await asyncio.gather(*(batcher.submit(row) for row in rows))
+        finally:
+            await batcher.close()
+
+    batcher, results = asyncio.run(run())
+    assert results == [3.0 * i for i in range(10)]
+    assert batcher.stats()["batches"] == 1
+    assert batcher.stats()["rows"] == 10
+
+
+def test_max_batch_size_splits_batches():
+    async def run():
+        batcher = MicroBatcher(row_sums, window_ms=50, max_batch_size=4)
+        try:
+            await asyncio.gather(*(batcher.submit(np.ones(2)) for _ in range(10)))
+            return batcher.stats()
+        finally:
+            await batcher.close()
+
+    stats = asyncio.run(run())
+    assert stats["batches"] == 3
+    assert stats["batch_size_histogram"]["4"] == 2
+
+
+def test_prediction_errors_reach_every_caller():
+    def broken(X):
+        raise ValueError("bad model")
+
+    async def run():
+        batcher = MicroBatcher(broken, window_ms=10)
+        try:
+            return await asyncio.gather(*(batcher.submit(np.ones(2)) for _ in range(3)),
+                                        return_exceptions=True)
+        finally:
+            await batcher.close()
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_close_fails_in_flight_and_queued_rows():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(X):
+        started.set()
+        release.wait(5)
+        return X.sum(axis=1)
+
+    async def run():
+        batcher = MicroBatcher(slow, window_ms=0, max_batch_size=1)
+        in_flight = asyncio.ensure_future(batcher.submit(np.ones(2)))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        queued = asyncio.ensure_future(batcher.submit(np.ones(2)))
+        await asyncio.sleep(0)
+        await batcher.close()
+        release.set()
+        results = await asyncio.wait_for(asyncio.gather(in_flight, queued, return_exceptions=True), 5)
+        with pytest.raises(RuntimeError):
+            await batcher.submit(np.ones(2))
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,96 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from app.services import bulk_predict
+from app.services.aqi_service import classify_aqi_array
+from app.services.bulk_predict import (
+    ARROW_CONTENT_TYPE, JSON_CONTENT_TYPE, NPZ_CONTENT_TYPE, format_ndjson, parse_columns, predict_chunks,
+)
+from app.services.inference import LAG_SUFFIX, RAW_FEATURES, ROLLING_SUFFIX, InferenceEngine
+
+
+class SumPredictor:
+    """Stands in for the trees: the AQI is the sum of the model row."""
+
+    def predict(self, X):
+        return X.sum(axis=1, dtype=np.float64)
+
+
+def make_engine():
+    features = RAW_FEATURES + [f + LAG_SUFFIX for f in RAW_FEATURES] + [f + ROLLING_SUFFIX for f in RAW_FEATURES]
+    return InferenceEngine(SumPredictor(), features, name="test_bulk")
+
+
+def readings(n, seed=0):
+    return np.random.default_rng(seed).uniform(0, 100, (n, len(RAW_FEATURES))).astype(np.float32)
+
+
+def test_json_records():
+    raw = readings(3)
+    body = json.dumps([dict(zip(RAW_FEATURES, row.tolist())) for row in raw]).encode()
+    np.testing.assert_array_equal(parse_columns(body, JSON_CONTENT_TYPE), raw)
+
+
+def test_npz_columns():
+    raw = readings(4)
+    buffer = io.BytesIO()
+    np.savez(buffer, **{name: raw[:, i].astype(np.float64) for i, name in enumerate(RAW_FEATURES)})
+    parsed = parse_columns(buffer.getvalue(), NPZ_CONTENT_TYPE)
+    assert parsed.dtype == np.float32
+    np.testing.assert_array_equal(parsed, raw)
+
+
+def test_arrow_stream():
+    pa = pytest.importorskip("pyarrow")
+    raw = readings(5)
+    table = pa.table({name: raw[:, i] for i, name in enumerate(RAW_FEATURES)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    np.testing.assert_array_equal(parse_columns(sink.getvalue().to_pybytes(), ARROW_CONTENT_TYPE), raw)
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b'{"pm25": 1}',
+    json.dumps([{"pm25": 1}]).encode(),
+    json.dumps([{name: "x" for name in RAW_FEATURES}]).encode(),
+    json.dumps([{name: float("nan") for name in RAW_FEATURES}]).encode(),
+])
+def test_bad_json_is_rejected(body):
+    with pytest.raises(ValueError):
+        parse_columns(body, JSON_CONTENT_TYPE)
+
+
+def test_bad_npz_is_rejected():
+    buffer = io.BytesIO()
+    np.savez(buffer, pm25=np.ones(3))
+    with pytest.raises(ValueError, match="Missing columns"):
+        parse_columns(buffer.getvalue(), NPZ_CONTENT_TYPE)
+    with pytest.raises(ValueError):
+        parse_columns(b"garbage", NPZ_CONTENT_TYPE)
+    with pytest.raises(ValueError):
+        parse_columns(b"[]", "text/csv")
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_chunks_match_a_single_pass(monkeypatch, ordered):
+    engine = make_engine()
+    raw = readings(23)
+    expected = engine.predict(engine.build_features_batch(raw, ordered=ordered))
+
+    # Chunk boundaries must not change lag/rolling features
+    monkeypatch.setattr(bulk_predict, "CHUNK_ROWS", 5)
+    chunks = list(predict_chunks(engine, raw, ordered))
+    assert len(chunks) == 5
+    np.testing.assert_allclose(np.concatenate([aqi for aqi, _ in chunks]), expected, rtol=1e-6)
+
+
+def test_ndjson_lines():
+    aqi = np.array([42.0, 150.5, -1.0])
+    lines = format_ndjson(aqi, classify_aqi_array(aqi)).splitlines()
+    assert [json.loads(line)["category"] for line in lines] == ["Good", "Moderate", "Unknown"]
+    assert json.loads(lines[1])["aqi"] == 150.5
@@ -0,0 +1,81 @@
+import asyncio
+
+from app.services.chat_cache import ChatResponseCache, content_signature, normalize_query
+from app.services.shared_cache import LocalSharedCache
+
+QUESTION = "Is it safe for my children to play outside this evening?"
+
+
+def test_normalized_wording_is_an_exact_hit(clock):
+    cache = ChatResponseCache(clock=clock)
+    cache.put(QUESTION, "Poor", "Keep them indoors.")
+    assert cache.get("  is it SAFE for my children to play outside, this evening ", "Poor") == "Keep them indoors."
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_similar_wording_is_a_semantic_hit(clock):
+    cache = ChatResponseCache(clock=clock)
+    cache.put(QUESTION, "Poor", "Keep them indoors.")
+    assert cache.get("Is it safe for the children to play outside this evening?", "Poor") == "Keep them indoors."
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_negation_or_new_subject_is_a_miss(clock):
+    # A low threshold, so only the content words keep these apart
+    cache = ChatResponseCache(threshold=0.5, clock=clock)
+    cache.put(QUESTION, "Poor", "Keep them indoors.")
+    assert cache.get("Is it not safe for my children to play outside this evening?", "Poor") is None
+    assert cache.get("Is it safe for my dogs to play outside this evening?", "Poor") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_content_signature_folds_negations_and_plurals():
+    def signature(text):
+        return content_signature(normalize_query(text))
+
+    assert signature("Isn't it safe?") == signature("Is it not safe?")
+    assert signature("Should I wear masks?") == signature("Should I wear a mask?")
+    assert signature("Is the glass clean?") == {"glass", "clean"}
+
+
+def test_answers_are_per_category(clock):
+    cache = ChatResponseCache(clock=clock)
+    cache.put(QUESTION, "Good", "Yes.")
+    assert cache.get(QUESTION, "Severe") is None
+
+
+def test_entries_expire(clock):
+    cache = ChatResponseCache(ttl=60, clock=clock)
+    cache.put(QUESTION, "Poor", "Keep them indoors.")
+    clock.advance(61)
+    assert cache.get(QUESTION, "Poor") is None
+    assert cache.get("Is it safe for the children to play outside this evening?", "Poor") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = ChatResponseCache(max_entries=2, clock=clock)
+    cache.put("first question", "Good", "1")
+    cache.put("second question", "Good", "2")
+    assert cache.get("first question", "Good") == "1"
+    cache.put("third question", "Good", "3")
+    assert cache.get("second question", "Good") is None
+    assert cache.get("first question", "Good") == "1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_shared_tier_serves_other_workers(clock):
+    shared = LocalSharedCache()
+    worker_a = ChatResponseCache(clock=clock, shared=shared)
+    worker_b = ChatResponseCache(clock=clock, shared=shared)
+
+    async def run():
+        await worker_a.aput(QUESTION, "Poor", "Keep them indoors.")
+        exact = await worker_b.aget(QUESTION, "Poor")
+        # Now in worker_b's own semantic index
+        similar = await worker_b.aget("Is it safe for the children to play outside this evening?", "Poor")
+        return exact, similar
+
+    assert asyncio.run(run()) == ("Keep them indoors.", "Keep them indoors.")
+    assert worker_b.stats()["shared_hits"] == 1
+    assert worker_b.stats()["semantic_hits"] == 1
@@ -0,0 +1,104 @@
+import asyncio
+
+from stubs import FakeGeminiModel
+
+from app.services.chat_cache import ChatResponseCache
+from app.services.chat_service import ChatService
+from app.services.circuit_breaker import OPEN, CircuitBreaker
+
+
+def make_service(model, timeout=1.0, max_concurrency=8):
+    breaker = CircuitBreaker("test_gemini", slow_seconds=0.5, window=10, min_calls=2, open_seconds=30.0)
+    return ChatService(model=model, cache=ChatResponseCache(), timeout=timeout,
+                       max_concurrency=max_concurrency, breaker=breaker)
+
+
+async def collect(service, message, category="Moderate"):
+    return [chunk async for chunk in service.stream_response(message, category)]
+
+
+def test_stream_yields_chunks_and_caches_reply():
+    model = FakeGeminiModel(latency_ms=20, chunks=4)
+    service = make_service(model)
+
+    async def run():
+        streamed = await collect(service, "Is it safe to jog today?")
+        whole = (await model.generate_content_async(service._build_prompt("Is it safe to jog today?", "Moderate"))).text
+        again = await collect(service, "Is it safe to jog today?")
+        return streamed, whole, again
+
+    streamed, whole, again = asyncio.run(run())
+    assert len(streamed) == 4
+    assert "".join(streamed) == whole
+    # Second ask is one cached chunk, without another model call
+    assert again == ["".join(streamed)]
+    assert model.calls == 2
+    assert service.cache.stats()["exact_hits"] == 1
+
+
+def test_cached_reply_is_per_category():
+    model = FakeGeminiModel(latency_ms=0, chunks=2)
+    service = make_service(model)
+
+    async def run():
+        await collect(service, "Should I wear a mask?", "Good")
+        await collect(service, "Should I wear a mask?", "Severe")
+
+    asyncio.run(run())
+    assert model.calls == 2
+
+
+def test_abandoned_stream_is_not_cached():
+    model = FakeGeminiModel(latency_ms=40, chunks=4)
+    # One slot: the second ask only gets through if the first released it
+    service = make_service(model, max_concurrency=1)
+
+    async def run():
+        stream = service.stream_response("How bad is the air?", "Poor")
+        first = await stream.__anext__()
+        await stream.aclose()
+        rest = await collect(service, "How bad is the air?", "Poor")
+        return first, rest
+
+    first, rest = asyncio.run(run())
+    assert first
+    assert len(rest) == 4
+    assert model.calls == 2
+
+
+def test_upstream_error_streams_fallback():
+    service = make_service(FakeGeminiModel(latency_ms=0, error_rate=1.0))
+    chunks = asyncio.run(collect(service, "Is it safe outside?"))
+    assert len(chunks) == 1
+    assert chunks[0].startswith("[AI Unavailable]")
+    assert service.cache.stats()["entries"] == 0
+
+
+def test_stalled_chunk_times_out_to_fallback():
+    # Chunks arrive every 0.5 s; the per-chunk timeout is 0.1 s
+    service = make_service(FakeGeminiModel(latency_ms=1000, chunks=2), timeout=0.1)
+    chunks = asyncio.run(collect(service, "Is it safe outside?"))
+    assert chunks == [service._fallback_response("Is it safe outside?", error=True)]
+
+
+def test_open_circuit_answers_with_fallback_without_calling_model():
+    model = FakeGeminiModel(latency_ms=0, error_rate=1.0)
+    service = make_service(model)
+
+    async def run():
+        for i in range(2):
+            await collect(service, f"question {i}")
+        model.error_rate = 0.0
+        return await collect(service, "question 3")
+
+    chunks = asyncio.run(run())
+    assert service.breaker.state == OPEN
+    assert model.calls == 2
+    assert chunks[0].startswith("[AI Unavailable]")
+
+
+def test_no_model_uses_offline_fallback():
+    service = make_service(None)
+    service.model = None
+    chunks = asyncio.run(collect(service, "precautions please"))
+    assert chunks == [service._fallback_response("precautions please")]
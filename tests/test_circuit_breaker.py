@@ -0,0 +1,126 @@
+import pytest
+
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def make_breaker(clock, **kwargs):
+    settings = dict(slow_seconds=1.0, window=10, min_calls=4, failure_ratio=0.5,
+                    open_seconds=30.0, half_open_probes=1, clock=clock)
+    settings.update(kwargs)
+    return CircuitBreaker("test", **settings)
+
+
+def call(breaker, elapsed=0.1, ok=True):
+    breaker.before_call()
+    breaker.record(elapsed, ok=ok)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        call(breaker, ok=False)
+    assert breaker.state == OPEN
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        call(breaker, ok=False)
+    assert breaker.state == CLOSED
+
+
+def test_stays_closed_below_failure_ratio(clock):
+    breaker = make_breaker(clock)
+    for ok in (True, False, True, True, False, True):
+        call(breaker, ok=ok)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_bad"] == 2
+
+
+def test_opens_on_failures_and_rejects(clock):
+    breaker = make_breaker(clock)
+    trip(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.advance(29.0)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 2
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        call(breaker, elapsed=1.5)
+    assert breaker.state == OPEN
+
+
+def test_window_forgets_old_failures(clock):
+    breaker = make_breaker(clock, window=4)
+    call(breaker, ok=False)
+    for _ in range(4):
+        call(breaker)
+    call(breaker, ok=False)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_bad"] == 1
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = make_breaker(clock)
+    trip(breaker)
+    clock.advance(30.0)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_calls"] == 0
+    call(breaker)
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = make_breaker(clock)
+    trip(breaker)
+    clock.advance(30.0)
+    breaker.before_call()
+    breaker.record(2.0)  # slow
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.advance(30.0)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_half_open_needs_every_probe(clock):
+    breaker = make_breaker(clock, half_open_probes=2)
+    trip(breaker)
+    clock.advance(30.0)
+    breaker.before_call()
+    breaker.before_call()
+    breaker.record(0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record(0.1)
+    assert breaker.state == CLOSED
+
+
+def test_lost_probe_is_retried_after_open_period(clock):
+    breaker = make_breaker(clock)
+    trip(breaker)
+    clock.advance(30.0)
+    breaker.before_call()  # this probe never reports back
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.advance(30.0)
+    breaker.before_call()
+    breaker.record(0.1)
+    assert breaker.state == CLOSED
+
+
+def test_late_result_while_open_is_ignored(clock):
+    breaker = make_breaker(clock)
+    trip(breaker)
+    breaker.record(0.1)
+    assert breaker.state == OPEN
+    assert breaker.transitions == 1
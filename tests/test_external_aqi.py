@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.services import external_aqi
+from app.services.aqi_cache import GeoCache
+from app.services.circuit_breaker import CLOSED, CircuitBreaker
+from app.services.external_aqi import OpenMeteoClient
+from app.services.measurement_store import MeasurementStore
+
+
+@pytest.fixture
+def isolated(monkeypatch, open_meteo_stub, clock):
+    """external_aqi with its own client, cache and store, pointed at the stub."""
+    url, set_faults = open_meteo_stub
+    breaker = CircuitBreaker("test_open_meteo", slow_seconds=5.0, window=100, min_calls=100, open_seconds=30.0)
+    client = OpenMeteoClient(url, timeout=2.0, max_retries=0, backoff=0.01, breaker=breaker)
+    cache = GeoCache(ttl=60, clock=clock)
+    monkeypatch.setattr(external_aqi, "open_meteo_client", client)
+    monkeypatch.setattr(external_aqi, "location_cache", cache)
+    monkeypatch.setattr(external_aqi, "measurement_store", MeasurementStore("sqlite://"))
+    monkeypatch.setattr(external_aqi, "BATCH_CHUNK_SIZE", 2)
+    return client, cache, set_faults
+
+
+def fetch_batch(client, points):
+    async def run():
+        try:
+            return await external_aqi.fetch_aqi_batch(points)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def test_batch_packs_cells_into_chunks(isolated):
+    client, cache, _ = isolated
+    # Five distinct cells, one repeated point
+    points = [(28.0 + 0.1 * i, 77.0) for i in range(5)] + [(28.0, 77.0)]
+    results = fetch_batch(client, points)
+
+    assert len(results) == 6
+    assert [(r["latitude"], r["longitude"]) for r in results] == points
+    assert all(r["aqi"] > 0 for r in results)
+    assert results[5]["aqi"] == results[0]["aqi"]
+    # Chunks of at most 2 locations: 3 upstream requests for 5 cells
+    assert client.breaker.stats()["window_calls"] == 3
+    assert cache.stats()["entries"] == 5
+    assert external_aqi.measurement_store.cells() != []
+
+
+def test_batch_answers_cached_cells_without_upstream(isolated):
+    client, cache, _ = isolated
+    points = [(28.0 + 0.1 * i, 77.0) for i in range(3)]
+    fetch_batch(client, points)
+    calls = client.breaker.stats()["window_calls"]
+    fetch_batch(client, points)
+    assert client.breaker.stats()["window_calls"] == calls
+
+
+def test_failed_chunk_falls_back_to_stale_values(isolated, clock):
+    client, cache, set_faults = isolated
+    points = [(28.0, 77.0), (28.1, 77.0)]
+    first = fetch_batch(client, points)
+    clock.advance(61)
+    set_faults(error_rate=1.0)
+    second = fetch_batch(client, points + [(29.0, 77.0)])
+
+    assert [r["aqi"] for r in second[:2]] == [r["aqi"] for r in first]
+    assert all(r["stale"] for r in second[:2])
+    # Never seen before, so nothing stale to fall back on
+    assert second[2]["aqi"] == -1
+    assert client.breaker.state == CLOSED
+
+
+def test_reading_without_pollutants_is_an_error(isolated):
+    current = {key: None for key in ("pm2_5", "pm10", "nitrogen_dioxide", "sulphur_dioxide",
+                                     "ozone", "carbon_monoxide")}
+    result = external_aqi._build_result(current)
+    # -1 rather than NaN: not cached, stale fallback applies, and it serializes
+    assert result["aqi"] == -1
+    assert result["category"] == "Error"
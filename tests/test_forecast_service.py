@@ -0,0 +1,128 @@
+import asyncio
+import os
+
+import numpy as np
+
+from app.services.forecast_service import ForecastService, ForecastTable
+from app.services.inference import LAG_SUFFIX, RAW_FEATURES, ROLLING_SUFFIX, InferenceEngine
+from app.services.measurement_store import MeasurementStore
+from app.services.shared_cache import LocalSharedCache
+
+HORIZONS = [1, 24]
+
+
+class HorizonPredictor:
+    """AQI at +h hours is PM2.5 plus h."""
+
+    def predict(self, X):
+        return np.stack([X[:, 0] + h for h in HORIZONS], axis=1)
+
+
+def make_engine():
+    features = RAW_FEATURES + [f + LAG_SUFFIX for f in RAW_FEATURES] + [f + ROLLING_SUFFIX for f in RAW_FEATURES]
+    return InferenceEngine(HorizonPredictor(), features, metadata={"horizons": HORIZONS}, name="test_forecast")
+
+
+def make_service(tmp_path, store, shared=None, **kwargs):
+    service = ForecastService(model_path=str(tmp_path / "missing.joblib"),
+                              forecast_path=str(tmp_path / "forecasts.npz"),
+                              store=store, shared=shared or LocalSharedCache(), **kwargs)
+    service.engine = make_engine()
+    return service
+
+
+def reading(pm25: float) -> np.ndarray:
+    raw = np.full(len(RAW_FEATURES), 10.0, dtype=np.float32)
+    raw[0] = pm25
+    return raw
+
+
+def test_refresh_scores_every_cell(tmp_path):
+    store = MeasurementStore("sqlite://")
+    store.record(28.6, 77.2, reading(40))
+    store.record(28.6, 77.2, reading(60))
+    store.record(19.1, 72.9, reading(100))
+    service = make_service(tmp_path, store)
+
+    asyncio.run(service.refresh())
+    horizons, aqi, _ = service.lookup(28.6, 77.2)
+    assert horizons.tolist() == HORIZONS
+    assert aqi.tolist() == [61.0, 84.0]
+    assert service.lookup(19.1, 72.9)[1].tolist() == [101.0, 124.0]
+    assert service.lookup(0.0, 0.0) is None
+
+    # Other workers pick the file up
+    other = make_service(tmp_path, MeasurementStore("sqlite://"))
+    other.reload()
+    assert other.lookup(28.6, 77.2)[1].tolist() == [61.0, 84.0]
+
+
+def test_table_round_trip(tmp_path):
+    path = str(tmp_path / "table.npz")
+    table = ForecastTable(np.array([[1, 2], [3, 4]], dtype=np.int32),
+                          np.array([[10, 20], [30, 40]], dtype=np.float32), np.array(HORIZONS, dtype=np.int16), 5.0)
+    table.save(path)
+    loaded = ForecastTable.load(path)
+    assert loaded.get((3, 4)).tolist() == [30.0, 40.0]
+    assert loaded.generated_at == 5.0
+    assert not os.path.exists(path + ".tmp.npz")
+
+
+def test_fresh_start_waits_for_readings_without_holding_the_lock(tmp_path):
+    store = MeasurementStore("sqlite://")
+    shared = LocalSharedCache()
+    service = make_service(tmp_path, store, shared, check_seconds=0.02)
+
+    async def run():
+        service.start()
+        try:
+            await asyncio.sleep(0.1)
+            built_early = service.table is not None
+            lock_taken_early = await shared.get("lock:forecast") is not None
+            store.record(28.6, 77.2, reading(40))
+            for _ in range(100):
+                if service.table is not None:
+                    break
+                await asyncio.sleep(0.02)
+            return built_early, lock_taken_early
+        finally:
+            await service.stop()
+
+    built_early, lock_taken_early = asyncio.run(run())
+    assert not built_early
+    assert not lock_taken_early
+    assert service.lookup(28.6, 77.2)[1].tolist() == [41.0, 64.0]
+
+
+def test_readings_from_every_worker_count(tmp_path):
+    url = f"sqlite:///{tmp_path / 'measurements.db'}"
+
+    async def run():
+        mine, theirs = MeasurementStore(url), MeasurementStore(url)
+        await mine.start()
+        await theirs.start()
+        try:
+            mine.record(28.6, 77.2, reading(40))
+            # Only in the other worker's buffers and, once flushed, the database
+            theirs.record(19.1, 72.9, reading(100))
+            await theirs.flush()
+            service = make_service(tmp_path, mine)
+            await service.refresh()
+            return service
+        finally:
+            await mine.close()
+            await theirs.close()
+
+    service = asyncio.run(run())
+    assert service.lookup(28.6, 77.2)[1].tolist() == [41.0, 64.0]
+    assert service.lookup(19.1, 72.9)[1].tolist() == [101.0, 124.0]
+
+
+def test_old_readings_get_no_forecast(tmp_path):
+    store = MeasurementStore("sqlite://")
+    store.record(28.6, 77.2, reading(40), observed_at=1000.0)
+    store.record(19.1, 72.9, reading(100))
+    service = make_service(tmp_path, store, max_reading_age=3600)
+    asyncio.run(service.refresh())
+    assert service.lookup(28.6, 77.2) is None
+    assert service.lookup(19.1, 72.9) is not None
@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services import live_feed as live_feed_module
+from app.services.aqi_cache import GeoCache
+from app.services.live_feed import CellFeed, LiveFeed, diff
+
+CELL = (1144, 3088)
+
+
+def reading(aqi: int, pm25: float = 40.0) -> dict:
+    return {"aqi": aqi, "category": "Moderate", "components": {"pm2_5": pm25}}
+
+
+class FakeWebSocket:
+    """Records what is sent; while `gate` is set, sends wait for it to open."""
+
+    def __init__(self):
+        self.sent = []
+        self.gate = None
+
+    async def send_text(self, text: str) -> None:
+        if self.gate is not None:
+            await self.gate.wait()
+        self.sent.append(json.loads(text))
+
+
+def test_diff_sends_changed_and_removed_fields():
+    old = {"aqi": 120, "category": "Moderate", "components": {"pm2_5": 40.0}, "stale": True}
+    new = {"aqi": 130, "category": "Moderate", "components": {"pm2_5": 45.0}}
+    assert diff(old, new) == {"aqi": 130, "components": {"pm2_5": 45.0}, "stale": None}
+    assert diff(new, dict(new)) == {}
+
+
+def test_cell_feed_versions_and_messages():
+    feed = CellFeed(CELL)
+    assert feed.update(reading(120))
+    assert not feed.update(reading(120))
+    assert feed.update(reading(130, pm25=45.0))
+    assert feed.version == 2
+
+    delta = json.loads(feed.message_for(1))
+    assert delta == {"type": "delta", "cell": "1144:3088", "v": 2,
+                     "data": {"aqi": 130, "components": {"pm2_5": 45.0}}}
+    # A client further behind gets the full state
+    snapshot = json.loads(feed.message_for(0))
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["data"] == reading(130, pm25=45.0)
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    readings = {"aqi": 120}
+
+    async def fetch_one(lat, lon):
+        return reading(readings["aqi"])
+
+    async def fetch_batch(points):
+        return [{"latitude": lat, "longitude": lon, **reading(readings["aqi"])} for lat, lon in points]
+
+    monkeypatch.setattr(live_feed_module, "fetch_aqi_by_location", fetch_one)
+    monkeypatch.setattr(live_feed_module, "fetch_aqi_batch", fetch_batch)
+    feed = LiveFeed(refresh_seconds=3600, max_connections=2, max_subscriptions=2, cache=GeoCache())
+    feed.readings = readings
+    return feed
+
+
+async def settle():
+    """Let the subscriber tasks run until they block again."""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_subscribers_get_a_snapshot_then_deltas(feed):
+    async def run():
+        websocket = FakeWebSocket()
+        subscriber = feed.connect(websocket)
+        task = asyncio.create_task(subscriber.run())
+        await feed.subscribe(subscriber, 28.6, 77.2)
+        await settle()
+        feed.readings["aqi"] = 150
+        await feed.refresh()
+        await settle()
+        await feed.refresh()  # unchanged: nothing sent
+        await settle()
+        task.cancel()
+        feed.disconnect(subscriber)
+        return websocket.sent
+
+    sent = asyncio.run(run())
+    assert [(m["type"], m["v"]) for m in sent] == [("snapshot", 1), ("delta", 2)]
+    assert sent[1]["data"] == {"aqi": 150}
+    assert feed.cells == {}
+
+
+def test_slow_client_is_conflated_to_a_snapshot(feed):
+    async def run():
+        websocket = FakeWebSocket()
+        subscriber = feed.connect(websocket)
+        task = asyncio.create_task(subscriber.run())
+        await feed.subscribe(subscriber, 28.6, 77.2)
+        await settle()
+        websocket.gate = asyncio.Event()
+        # Nothing is queued while the client is stuck: versions 2 and 3 collapse
+        for aqi in (150, 180, 210):
+            feed.readings["aqi"] = aqi
+            await feed.refresh()
+            await settle()
+        websocket.gate.set()
+        await settle()
+        task.cancel()
+        return websocket.sent
+
+    sent = asyncio.run(run())
+    assert [(m["type"], m["v"]) for m in sent] == [("snapshot", 1), ("delta", 2), ("snapshot", 4)]
+    assert sent[-1]["data"]["aqi"] == 210
+
+
+def test_stalled_client_is_dropped(feed, monkeypatch):
+    monkeypatch.setattr(live_feed_module, "SEND_TIMEOUT_SECONDS", 0.05)
+
+    async def run():
+        websocket = FakeWebSocket()
+        websocket.gate = asyncio.Event()
+        subscriber = feed.connect(websocket)
+        task = asyncio.create_task(subscriber.run())
+        await feed.subscribe(subscriber, 28.6, 77.2)
+        with pytest.raises(asyncio.TimeoutError):
+            await task
+
+    asyncio.run(run())
+    assert feed.dropped == 1
+
+
+def test_connection_and_subscription_caps(feed):
+    async def run():
+        first, second = feed.connect(FakeWebSocket()), feed.connect(FakeWebSocket())
+        assert feed.connect(FakeWebSocket()) is None
+        await feed.subscribe(first, 28.6, 77.2)
+        await feed.subscribe(second, 28.6, 77.2)
+        await feed.subscribe(first, 19.1, 72.9)
+        with pytest.raises(ValueError):
+            await feed.subscribe(first, 13.0, 80.2)
+        return feed.stats()
+
+    stats = asyncio.run(run())
+    assert stats["rejected_connections"] == 1
+    assert stats["cells"] == 2
+    assert stats["subscriptions"] == 3
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.services import external_aqi, measurement_store as store_module
+from app.services.aqi_cache import snap_to_cell
+from app.services.inference import RAW_FEATURES
+from app.services.measurement_store import LocationSeries, MeasurementStore
+
+N = len(RAW_FEATURES)
+
+
+def reading(value: float) -> np.ndarray:
+    return np.full(N, value, dtype=np.float32)
+
+
+def test_running_window_matches_recomputing():
+    rng = np.random.default_rng(0)
+    series = LocationSeries(capacity=5, window=3)
+    rows = []
+    for t in range(20):  # wraps the ring buffer several times
+        raw = rng.uniform(0, 100, N).astype(np.float32)
+        raw[rng.random(N) < 0.3] = np.nan
+        series.append(float(t), raw, "sensor")
+        rows.append(raw)
+
+        previous, recent_sum, recent_count = series.context()
+        recent = np.array(rows[-2:])
+        np.testing.assert_array_equal(previous, raw)
+        np.testing.assert_allclose(recent_sum, np.nansum(recent, axis=0), rtol=1e-5)
+        np.testing.assert_array_equal(recent_count, (~np.isnan(recent)).sum(axis=0))
+
+    times, values = series.history()
+    assert times.tolist() == [15.0, 16.0, 17.0, 18.0, 19.0]
+    np.testing.assert_array_equal(values, np.array(rows[-5:]))
+
+
+def test_out_of_order_readings_are_rejected():
+    store = MeasurementStore("sqlite://")
+    assert store.record(28.6, 77.2, reading(1), observed_at=100.0)
+    assert not store.record(28.6, 77.2, reading(2), observed_at=99.0)
+    assert store.record(28.6, 77.2, reading(3), observed_at=100.0)
+    assert store.out_of_order == 1
+    assert store.get(28.6, 77.2).latest()[0] == 3
+
+
+def test_latest_reading_per_source():
+    series = LocationSeries(capacity=3, window=2)
+    series.append(1.0, reading(1), "open-meteo")
+    series.append(2.0, reading(2), "sensor")
+    for t in range(3, 7):  # the trusted readings leave the ring buffer
+        series.append(float(t), reading(t), "sensor_unverified")
+    observed_at, values = series.latest_from(("open-meteo", "sensor"))
+    assert observed_at == 2.0
+    assert values[0] == 2
+    assert series.latest_from(("open-meteo",))[0] == 1.0
+    assert series.latest_from(("user",)) is None
+
+    store = MeasurementStore("sqlite://")
+    store.record(28.6, 77.2, reading(1), observed_at=100.0, source="sensor")
+    store.record(19.1, 72.9, reading(2), observed_at=50.0, source="sensor")
+    store.record(13.0, 80.2, reading(3), observed_at=100.0, source="sensor_unverified")
+    assert [cell for cell, _, _ in store.latest_readings(("sensor",), since=60.0)] == [snap_to_cell(28.6, 77.2)]
+
+
+def test_locations_share_a_cache_cell():
+    store = MeasurementStore("sqlite://")
+    store.record(28.6101, 77.2101, reading(1), observed_at=1.0)
+    store.record(28.6102, 77.2102, reading(2), observed_at=2.0)
+    assert store.cells() == [snap_to_cell(28.6101, 77.2101)]
+    assert store.get(28.6101, 77.2101).count == 2
+
+
+def test_flush_and_reload(tmp_path):
+    url = f"sqlite:///{tmp_path / 'measurements.db'}"
+
+    async def write():
+        store = MeasurementStore(url, buffer_size=4)
+        await store.start()
+        for t in range(6):
+            store.record(28.6, 77.2, reading(t), observed_at=float(t), source="sensor")
+        store.record(19.1, 72.9, reading(50), observed_at=3.0, source="open-meteo")
+        await store.close()
+
+    async def reload():
+        store = MeasurementStore(url, buffer_size=4)
+        await store.start()
+        await store.close()
+        return store
+
+    asyncio.run(write())
+    store = asyncio.run(reload())
+    times, values = store.get(28.6, 77.2).history()
+    # The newest buffer_size readings per location, oldest first
+    assert times.tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert values[:, 0].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert store.get(19.1, 72.9).latest()[0] == 50
+
+
+def test_old_tables_get_cell_columns(tmp_path):
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url)
+    columns = ", ".join(f"{name} FLOAT" for name in RAW_FEATURES)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE measurements (id INTEGER PRIMARY KEY, latitude FLOAT NOT NULL, "
+            f"longitude FLOAT NOT NULL, observed_at FLOAT NOT NULL, source VARCHAR(32) NOT NULL, {columns})"
+        ))
+        conn.execute(text(
+            "INSERT INTO measurements (latitude, longitude, observed_at, source, pm25) "
+            "VALUES (28.6, 77.2, 1.0, 'sensor', 42.0)"
+        ))
+    engine.dispose()
+
+    async def run():
+        store = MeasurementStore(url)
+        await store.start()
+        await store.close()
+        return store
+
+    store = asyncio.run(run())
+    assert store.get(28.6, 77.2).latest()[0] == 42.0
+
+
+def test_failed_flush_keeps_and_counts_what_fits(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "MAX_PENDING", 3)
+    url = f"sqlite:///{tmp_path / 'm.db'}"
+    writing = threading.Event()
+    fail = threading.Event()
+
+    def unreachable(batch):
+        writing.set()
+        fail.wait(5)
+        raise OSError("database is down")
+
+    async def run():
+        store = MeasurementStore(url)
+        await store.start()
+        monkeypatch.setattr(store, "_write", unreachable)
+        for t in range(2):
+            store.record(28.6, 77.2, reading(t), observed_at=float(t))
+        flush = asyncio.ensure_future(store.flush())
+        await asyncio.get_running_loop().run_in_executor(None, writing.wait, 5)
+        # Recorded while the write is failing: with the two put back, only
+        # the newest three fit
+        for t in range(2, 5):
+            store.record(28.6, 77.2, reading(t), observed_at=float(t))
+        fail.set()
+        await flush
+        monkeypatch.delattr(store, "_write")
+        await store.close()
+
+        reloaded = MeasurementStore(url)
+        await reloaded.start()
+        await reloaded.close()
+        return store, reloaded
+
+    store, reloaded = asyncio.run(run())
+    assert store.dropped == 2
+    assert reloaded.get(28.6, 77.2).history()[0].tolist() == [2.0, 3.0, 4.0]
+
+
+def test_null_carbon_monoxide_is_recorded_as_missing(monkeypatch):
+    monkeypatch.setattr(external_aqi, "measurement_store", MeasurementStore("sqlite://"))
+    result = external_aqi._build_result({"pm2_5": 40.0, "pm10": 60.0, "carbon_monoxide": None})
+    external_aqi._record_reading(28.0, 77.0, result["components"])
+    store = external_aqi.measurement_store
+    latest = store.series(store.cells()[0]).latest()
+    assert result["aqi"] > 0
+    assert np.isnan(latest[RAW_FEATURES.index("co")])
+
+
+def test_buffer_must_hold_the_window():
+    with pytest.raises(ValueError):
+        LocationSeries(capacity=2, window=3)
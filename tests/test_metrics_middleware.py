@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+from app.services import metrics
+from main import MetricsMiddleware
+
+
+def samples(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def streamed(scope, receive, send):
+    """Two body chunks 50 ms apart."""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"first", "more_body": True})
+    await asyncio.sleep(0.05)
+    await send({"type": "http.response.body", "body": b"second"})
+
+
+async def upstream_then_reply(scope, receive, send):
+    with metrics.span("upstream"):
+        await asyncio.sleep(0.01)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def broken(scope, receive, send):
+    raise RuntimeError("handler failed")
+
+
+def request(app, path: str) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    return asyncio.run(run())
+
+
+def test_latency_covers_the_streamed_body():
+    labels = {"method": "GET", "route": "/api/health-advice", "status": "200"}
+    count = samples("airguard_http_request_duration_seconds_count", **labels)
+    total = samples("airguard_http_request_duration_seconds_sum", **labels)
+
+    response = request(MetricsMiddleware(streamed, sample_rate=0), "/api/health-advice")
+    assert response.content == b"firstsecond"
+    assert "server-timing" not in response.headers
+    assert samples("airguard_http_request_duration_seconds_count", **labels) == count + 1
+    assert samples("airguard_http_request_duration_seconds_sum", **labels) - total >= 0.05
+    assert samples("airguard_http_requests_in_flight", route="/api/health-advice") == 0
+
+
+def test_unknown_paths_share_one_label():
+    labels = {"method": "GET", "route": "unmatched", "status": "200"}
+    before = samples("airguard_http_request_duration_seconds_count", **labels)
+    app = MetricsMiddleware(streamed, sample_rate=0)
+    request(app, "/wp-login.php")
+    request(app, "/.env")
+    assert samples("airguard_http_request_duration_seconds_count", **labels) == before + 2
+
+
+def test_sampled_requests_get_server_timing():
+    response = request(MetricsMiddleware(upstream_then_reply, sample_rate=1), "/api/health-advice")
+    timings = {name: float(ms) for name, ms in
+               (part.split(";dur=") for part in response.headers["server-timing"].split(", "))}
+    assert set(timings) == {"upstream", "app"}
+    assert timings["app"] >= timings["upstream"] >= 10
+
+
+def test_failures_count_as_500():
+    labels = {"method": "GET", "route": "/api/health-advice", "status": "500"}
+    before = samples("airguard_http_request_duration_seconds_count", **labels)
+    with pytest.raises(RuntimeError):
+        asyncio.run(MetricsMiddleware(broken, sample_rate=0)(
+            {"type": "http", "method": "GET", "path": "/api/health-advice"}, None, None))
+    assert samples("airguard_http_request_duration_seconds_count", **labels) == before + 1
+    assert samples("airguard_http_requests_in_flight", route="/api/health-advice") == 0
@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+from export_trees import export_booster  # noqa: E402
+from registry import publish, set_pointer  # noqa: E402
+
+from app.services.inference import LAG_SUFFIX, RAW_FEATURES, ROLLING_SUFFIX  # noqa: E402
+from app.services.model_registry import ModelRegistry  # noqa: E402
+
+FEATURES = RAW_FEATURES + [f + LAG_SUFFIX for f in RAW_FEATURES] + [f + ROLLING_SUFFIX for f in RAW_FEATURES]
+RAW = np.full(len(RAW_FEATURES), 50.0, dtype=np.float32)
+
+
+def train(offset: float):
+    """A small model predicting a constant-ish AQI around `offset`."""
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 100, (200, len(FEATURES))).astype(np.float32)
+    model = xgb.XGBRegressor(n_estimators=5, max_depth=2)
+    model.fit(X, np.full(200, offset) + X[:, 0] * 0.01)
+    return model
+
+
+@pytest.fixture
+def registry_dir(tmp_path):
+    path = tmp_path / "registry"
+    publish(train(100), FEATURES, {}, registry_dir=str(path), version="v1")
+    publish(train(300), FEATURES, {}, registry_dir=str(path), version="v2", activate=False)
+    return path
+
+
+def make_registry(registry_dir, tmp_path, **kwargs):
+    return ModelRegistry(registry_dir=str(registry_dir), legacy_path=str(tmp_path / "missing.joblib"),
+                         watch_seconds=kwargs.pop("watch_seconds", 60), **kwargs)
+
+
+def test_serves_the_active_version_and_swaps(registry_dir, tmp_path):
+    async def run():
+        registry = make_registry(registry_dir, tmp_path)
+        await registry.start()
+        try:
+            first = registry.active
+            before = await first.predict(RAW)
+            await registry.activate("v2")
+            # A request that started on v1 can still finish on it
+            during_grace = await first.predict(RAW)
+            after = await registry.active.predict(RAW)
+            return first, before, during_grace, after, registry.stats()
+        finally:
+            await registry.stop()
+
+    first, before, during_grace, after, stats = asyncio.run(run())
+    assert before == pytest.approx(100, abs=5)
+    assert during_grace == before
+    assert after == pytest.approx(300, abs=5)
+    assert stats["active"]["version"] == "v2"
+    assert stats["swaps"] == 2
+
+
+def test_stop_closes_retired_models(registry_dir, tmp_path):
+    async def run():
+        registry = make_registry(registry_dir, tmp_path)
+        await registry.start()
+        retired = registry.active
+        await registry.activate("v2")
+        await registry.stop()
+        with pytest.raises(RuntimeError):
+            await retired.predict(RAW)
+
+    asyncio.run(run())
+
+
+def test_watcher_follows_the_pointer_file(registry_dir, tmp_path):
+    async def run():
+        registry = make_registry(registry_dir, tmp_path, watch_seconds=0.02)
+        await registry.start()
+        try:
+            set_pointer("active", "v2", str(registry_dir))
+            set_pointer("shadow", "v1", str(registry_dir))
+            for _ in range(100):
+                if registry.active.version == "v2" and registry.shadow is not None:
+                    break
+                await asyncio.sleep(0.02)
+            return registry.active.version, registry.shadow.version
+        finally:
+            await registry.stop()
+
+    assert asyncio.run(run()) == ("v2", "v1")
+
+
+def test_shadow_divergence_is_tracked(registry_dir, tmp_path):
+    async def run():
+        registry = make_registry(registry_dir, tmp_path, shadow_sample_rate=1.0)
+        await registry.start()
+        try:
+            await registry.set_shadow("v2")
+            served = await registry.active.predict(RAW)
+            registry.observe(RAW, None, served)
+            for _ in range(100):
+                if registry.shadow_stats.scored:
+                    break
+                await asyncio.sleep(0.01)
+            return registry.stats()["shadow_divergence"]
+        finally:
+            await registry.stop()
+
+    divergence = asyncio.run(run())
+    assert divergence["scored"] == 1
+    assert divergence["mean_abs_diff"] == pytest.approx(200, abs=10)
+    assert divergence["category_mismatch_ratio"] == 1.0
+
+
+@pytest.mark.parametrize("version", ["../v1", "v1/../v2", "", ".hidden", "missing"])
+def test_bad_versions_are_refused(registry_dir, tmp_path, version):
+    async def run():
+        registry = make_registry(registry_dir, tmp_path)
+        try:
+            with pytest.raises(ValueError):
+                await registry.activate(version, persist=True)
+        finally:
+            await registry.stop()
+
+    asyncio.run(run())
+    assert (registry_dir / "active").read_text().strip() == "v1"
+
+
+def test_legacy_model_from_exported_trees(tmp_path):
+    model_path = tmp_path / "legacy_model.joblib"  # never written: trees and schema only
+    export_booster(train(100), str(tmp_path / "legacy_model.trees"))
+    (tmp_path / "legacy_model.features.json").write_text(json.dumps({"features": FEATURES, "rolling_window": 3}))
+
+    async def run():
+        registry = ModelRegistry(registry_dir=str(tmp_path / "empty"), legacy_path=str(model_path))
+        await registry.start()
+        try:
+            return registry.active.version, await registry.active.predict(RAW)
+        finally:
+            await registry.stop()
+
+    version, aqi = asyncio.run(run())
+    assert version == "legacy_model.joblib"
+    assert aqi == pytest.approx(100, abs=5)
@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import external_aqi
+from app.services.circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from app.services.external_aqi import OpenMeteoClient
+
+PARAMS = {"latitude": 28.61, "longitude": 77.21, "current": external_aqi.CURRENT_VARIABLES}
+
+
+def make_client(url, **kwargs):
+    breaker = CircuitBreaker("test_open_meteo", slow_seconds=kwargs.pop("slow_seconds", 5.0),
+                             window=100, min_calls=kwargs.pop("min_calls", 100), open_seconds=30.0)
+    settings = dict(timeout=2.0, max_retries=2, backoff=0.01, breaker=breaker)
+    settings.update(kwargs)
+    return OpenMeteoClient(url, **settings)
+
+
+async def get_json(client, params=PARAMS):
+    try:
+        return await client.get_json(params)
+    finally:
+        await client.close()
+
+
+def test_single_location(open_meteo_stub):
+    url, _ = open_meteo_stub
+    client = make_client(url)
+    data = asyncio.run(get_json(client))
+    assert data["current"]["pm2_5"] > 0
+    assert client.breaker.stats()["window_calls"] == 1
+
+
+def test_retries_then_raises_on_server_errors(open_meteo_stub):
+    url, set_faults = open_meteo_stub
+    set_faults(error_rate=1.0)
+    client = make_client(url, max_retries=2)
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        asyncio.run(get_json(client))
+    assert error.value.response.status_code == 503
+    stats = client.breaker.stats()
+    # One attempt plus two retries, all counted as bad
+    assert stats["window_calls"] == 3
+    assert stats["window_bad"] == 3
+
+
+def test_timeout_per_attempt(open_meteo_stub):
+    url, set_faults = open_meteo_stub
+    set_faults(latency_ms=1000)
+    client = make_client(url, timeout=0.1, max_retries=1)
+    with pytest.raises((asyncio.TimeoutError, httpx.TimeoutException)):
+        asyncio.run(get_json(client))
+    assert client.breaker.stats()["window_bad"] == 2
+
+
+def test_slow_answers_trip_the_breaker(open_meteo_stub):
+    url, set_faults = open_meteo_stub
+    set_faults(latency_ms=100)
+    client = make_client(url, slow_seconds=0.05, min_calls=2, max_retries=0)
+
+    async def run():
+        try:
+            for _ in range(2):
+                await client.get_json(PARAMS)
+            assert client.breaker.state == OPEN
+            # Refused without a request while open
+            with pytest.raises(CircuitOpenError):
+                await client.get_json(PARAMS)
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+    assert client.breaker.stats()["window_calls"] == 2
+
+
+def test_multi_coordinate_request(open_meteo_stub):
+    url, _ = open_meteo_stub
+    client = make_client(url)
+    params = {**PARAMS, "latitude": "28.6,19.1,13.1", "longitude": "77.2,72.9,80.3"}
+    data = asyncio.run(get_json(client, params))
+    assert [item["latitude"] for item in data] == [28.6, 19.1, 13.1]
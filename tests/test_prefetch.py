@@ -0,0 +1,56 @@
+import random
+from collections import Counter
+
+from app.services.prefetch import HeavyHitters
+
+
+def feed(hitters, cells):
+    for cell in cells:
+        hitters.add(cell)
+
+
+def test_exact_while_under_capacity():
+    hitters = HeavyHitters(capacity=10)
+    feed(hitters, [(0, 0)] * 5 + [(0, 1)] * 3 + [(0, 2)])
+    assert hitters.counts == {(0, 0): 5, (0, 1): 3, (0, 2): 1}
+    assert hitters.top(2) == [(0, 0), (0, 1)]
+    assert hitters.top(5, min_count=3) == [(0, 0), (0, 1)]
+
+
+def test_new_cell_replaces_the_oldest_least_counted():
+    hitters = HeavyHitters(capacity=3)
+    feed(hitters, [(0, 0), (0, 0), (0, 1), (0, 2)])
+    hitters.add((0, 3))
+    # (0, 1) sat longest at the smallest count; its count is inherited
+    assert (0, 1) not in hitters.counts
+    assert hitters.counts[(0, 3)] == 2
+    assert hitters.errors[(0, 3)] == 1
+    # Not a guaranteed repeat visitor yet
+    assert (0, 3) not in hitters.top(3, min_count=2)
+
+
+def test_heavy_cells_survive_a_long_tail():
+    rng = random.Random(0)
+    stream = [(0, i % 5) for i in range(2000)] + [(1, rng.randrange(10**6)) for _ in range(2000)]
+    rng.shuffle(stream)
+    hitters = HeavyHitters(capacity=50)
+    feed(hitters, stream)
+
+    truth = Counter(stream)
+    assert set(hitters.top(5)) == {(0, i) for i in range(5)}
+    for cell, count in hitters.counts.items():
+        # Space-Saving bounds: never under, over by at most the inherited error
+        assert truth[cell] <= count <= truth[cell] + hitters.errors[cell]
+    assert len(hitters.counts) == 50
+
+
+def test_decay_halves_and_forgets():
+    hitters = HeavyHitters(capacity=3)
+    feed(hitters, [(0, 0)] * 4 + [(0, 1)] * 2 + [(0, 2)])
+    hitters.decay()
+    assert hitters.counts == {(0, 0): 2, (0, 1): 1}
+    # Buckets are rebuilt: the freed slot and the new minimum are used again
+    hitters.add((0, 3))
+    hitters.add((0, 4))
+    assert (0, 1) not in hitters.counts
+    assert hitters.counts[(0, 4)] == 2
@@ -0,0 +1,130 @@
+import asyncio
+import socket
+
+import pytest
+
+from app.services.shared_cache import LocalSharedCache, RedisSharedCache, dumps, loads
+
+pytest.importorskip("redis")
+
+
+class FakeRedis:
+    """The part of the redis.asyncio client RedisSharedCache uses, kept in a dict (TTLs ignored)."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        self.ttls[key] = px
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def aclose(self):
+        pass
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def set(self, key, value, px=None):
+        self.commands.append((key, value, px))
+
+    async def execute(self):
+        return [await self.redis.set(key, value, px=px) for key, value, px in self.commands]
+
+
+def make_redis_cache(clock, **kwargs):
+    cache = RedisSharedCache("redis://unused", prefix="test:", clock=clock, **kwargs)
+    cache._redis = FakeRedis()
+    return cache
+
+
+def test_local_entries_expire_and_evict(clock):
+    cache = LocalSharedCache(clock=clock, max_entries=2)
+
+    async def run():
+        await cache.set("a", b"1", ttl=10)
+        await cache.set("b", b"2", ttl=100)
+        clock.advance(11)
+        expired = await cache.get("a")
+        await cache.set("c", b"3", ttl=100)
+        await cache.set("d", b"4", ttl=100)
+        return expired, await cache.get_many(["b", "c", "d"])
+
+    assert asyncio.run(run()) == (None, [None, b"3", b"4"])
+
+
+def test_redis_keys_are_prefixed_and_counted(clock):
+    cache = make_redis_cache(clock)
+
+    async def run():
+        await cache.set("cell:1:2", dumps({"aqi": 120}), ttl=1.5)
+        await cache.set_many({"cell:3:4": b"x", "cell:5:6": b"y"}, ttl=60)
+        found = loads(await cache.get("cell:1:2"))
+        many = await cache.get_many(["cell:3:4", "missing", "cell:5:6"])
+        return found, many
+
+    found, many = asyncio.run(run())
+    assert found == {"aqi": 120}
+    assert many == [b"x", None, b"y"]
+    assert cache._redis.ttls == {"test:cell:1:2": 1500, "test:cell:3:4": 60000, "test:cell:5:6": 60000}
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["backend"] == "redis"
+
+
+def test_redis_add_is_a_lock(clock):
+    first, second = make_redis_cache(clock), make_redis_cache(clock)
+    second._redis = first._redis  # two workers, one server
+
+    async def run():
+        return await first.add("lock:forecast", b"1", ttl=60), await second.add("lock:forecast", b"1", ttl=60)
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_unreachable_redis_is_a_miss_then_skipped(clock):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]  # nothing listens once it is closed
+    cache = RedisSharedCache(f"redis://127.0.0.1:{port}/0", timeout=0.5, retry_after=5, clock=clock)
+
+    async def run():
+        try:
+            missed = await cache.get("cell:1:2")
+            await cache.set("cell:1:2", b"x", ttl=60)
+            # Every worker acts alone rather than waiting on a lock nobody can take
+            locked = await cache.add("lock:forecast", b"1", ttl=60)
+            errors_while_down = cache.errors
+            clock.advance(6)
+            await cache.get("cell:1:2")
+            return missed, locked, errors_while_down
+        finally:
+            await cache.close()
+
+    missed, locked, errors_while_down = asyncio.run(run())
+    assert missed is None
+    assert locked is True
+    # Only the first call paid for the failure; the rest skipped Redis until retry_after passed
+    assert errors_while_down == 1
+    assert cache.errors == 2
@@ -0,0 +1,113 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+from app.services.aqi_cache import GeoCache, cell_center
+from app.services.aqi_service import POLLUTANTS
+from app.services.inference import RAW_FEATURES
+from app.services.measurement_store import MeasurementStore
+from app.services.spatial_index import IDW, KM_PER_DEG, NEAREST, NO_ESTIMATE, SpatialIndex, SpatialService
+
+KM = 1 / KM_PER_DEG  # degrees of latitude per km
+
+
+def make_index(points: list, values: list) -> SpatialIndex:
+    lats, lons = np.array(points, dtype=np.float64).T
+    return SpatialIndex(lats, lons, np.array(values, dtype=np.float64), np.arange(len(points), dtype=np.float64))
+
+
+def row(pm25: float, **others) -> list:
+    return [pm25 if p == "pm25" else others.get(p, np.nan) for p in POLLUTANTS]
+
+
+def test_nearest_sample_answers_as_is():
+    index = make_index([(28.6, 77.2), (28.6 + 5 * KM, 77.2)], [row(40), row(200)])
+    found = index.interpolate([28.6 + 0.5 * KM], [77.2], nearest_km=1.0)
+    assert found["method"][0] == NEAREST
+    assert found["values"][0][0] == 40
+    assert found["distance_km"][0] == pytest.approx(0.5, rel=0.01)
+
+
+def test_inverse_distance_blend_per_pollutant():
+    # Two samples 1 km north and south, one 3 km east without PM10
+    index = make_index([(28.6 + KM, 77.2), (28.6 - KM, 77.2), (28.6, 77.2 + 3 * KM / math.cos(math.radians(28.6)))],
+                       [row(100, pm10=50), row(200, pm10=150), row(300)])
+    found = index.interpolate([28.6], [77.2], radius_km=5, nearest_km=0.5, min_neighbours=3)
+    weights = np.array([1, 1, 1 / 9])
+    assert found["method"][0] == IDW
+    assert found["neighbours"][0] == 3
+    assert found["values"][0][0] == pytest.approx(np.average([100, 200, 300], weights=weights), rel=1e-3)
+    assert found["values"][0][1] == pytest.approx(100, rel=1e-3)
+    assert np.isnan(found["values"][0][2])
+
+
+def test_too_few_neighbours_is_no_estimate():
+    index = make_index([(28.6 + KM, 77.2), (28.6 - KM, 77.2), (28.6 + 30 * KM, 77.2)], [row(1), row(2), row(3)])
+    found = index.interpolate([28.6, 10.0], [77.2, 10.0], radius_km=5, nearest_km=0.5, min_neighbours=3)
+    assert found["method"].tolist() == [NO_ESTIMATE, NO_ESTIMATE]
+    assert np.isnan(found["values"]).all()
+
+
+def test_candidates_cover_the_box_across_buckets():
+    points = [(lat, lon) for lat in np.arange(27.0, 30.0, 0.1) for lon in np.arange(76.0, 79.0, 0.1)]
+    index = make_index(points, [row(1)] * len(points))
+    idx = index.candidates(28.04, 77.04, 28.46, 77.46)
+    inside = (index.lats >= 28.04) & (index.lats <= 28.46) & (index.lons >= 77.04) & (index.lons <= 77.46)
+    assert set(np.flatnonzero(inside)) <= set(idx.tolist())
+    assert len(idx) < len(points)
+
+
+def raw_reading(pm25: float) -> np.ndarray:
+    raw = np.full(len(RAW_FEATURES), np.nan, dtype=np.float32)
+    raw[RAW_FEATURES.index("pm25")] = pm25
+    return raw
+
+
+@pytest.fixture
+def service():
+    cache = GeoCache()
+    store = MeasurementStore("sqlite://")
+    return SpatialService(cache=cache, store=store, max_age=3600, query_radius_km=10)
+
+
+def test_snapshot_takes_trusted_and_newest_samples(service):
+    cache, store = service.cache, service.store
+    now = time.time()
+    store.record(28.6, 77.2, raw_reading(100), observed_at=now - 60, source="sensor")
+    store.record(19.1, 72.9, raw_reading(500), observed_at=now - 60, source="sensor_unverified")
+    store.record(13.0, 80.2, raw_reading(20), observed_at=now - 7200, source="open-meteo")
+    # The cache entry for the sensor's cell is newer, so it wins
+    cache.put(cache.cell_for(28.6, 77.2), {"aqi": 90, "components": {"pm25": 80.0, "co": 1500.0}})
+
+    lats, lons, values, observed_at = service.snapshot()
+    assert len(lats) == 1
+    assert (lats[0], lons[0]) == pytest.approx(cell_center(cache.cell_for(28.6, 77.2), cache.cell_size))
+    assert values[0][POLLUTANTS.index("pm25")] == 80.0
+    assert values[0][POLLUTANTS.index("co")] == 1.5  # mg/m3
+
+
+def test_estimate_uses_the_sample_for_its_own_cell(service):
+    service.store.record(28.6, 77.2, raw_reading(100), observed_at=time.time(), source="sensor")
+    lats, lons, values, observed_at = service.snapshot()
+    service.index = SpatialIndex(lats, lons, values, observed_at)
+
+    # A corner of the cell is half a diagonal away from the sample at its centre
+    row, col = service.cache.cell_for(28.6, 77.2)
+    size = service.cache.cell_size
+    pollutants, details = service.estimate(row * size + 1e-6, col * size + 1e-6)
+    assert details["method"] == "nearest"
+    assert pollutants["pm25"] == 100
+    assert service.estimate(28.6, 78.5) is None
+
+
+def test_heatmap_grid(service):
+    service.index = make_index([(28.6, 77.2)], [row(100)])
+    # Cell centres at 28.6/28.7 and 77.2/77.3: only the first is near the sample
+    heatmap = service.heatmap(28.55, 77.15, 28.75, 77.35, 0.1)
+    assert (heatmap["rows"], heatmap["cols"]) == (2, 2)
+    assert heatmap["aqi"][0, 0] > 100
+    assert np.isnan(heatmap["aqi"]).sum() == 3
+    with pytest.raises(ValueError):
+        service.heatmap(0, 0, 80, 80, 0.01)
@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+joblib = pytest.importorskip("joblib")
+
+from app.services.tree_predictor import TreeEnsemble  # noqa: E402
+from export_trees import export_booster, trees_dir_for  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_MODELS = ["ml_engine/aqi_xgboost_model.joblib", "ml_engine/aqi_forecast_model.joblib"]
+
+
+def booster_predict(booster, X):
+    return booster.predict(xgb.DMatrix(X, missing=np.nan, feature_names=booster.feature_names))
+
+
+def random_rows(rng, n, features, missing=0.1):
+    X = rng.uniform(-50, 350, (n, features)).astype(np.float32)
+    X[rng.random(X.shape) < missing] = np.nan
+    return X
+
+
+def train(rng, targets=1, n_estimators=30):
+    X = random_rows(rng, 2000, 6)
+    y = np.nan_to_num(X[:, :targets] * 0.5 + X[:, 1:2], nan=3.0)
+    model = xgb.XGBRegressor(n_estimators=n_estimators, max_depth=4, learning_rate=0.3, tree_method="hist")
+    model.fit(X, y if targets > 1 else y[:, 0])
+    return model
+
+
+@pytest.mark.parametrize("targets", [1, 3])
+def test_matches_xgboost(tmp_path, targets):
+    rng = np.random.default_rng(0)
+    model = train(rng, targets)
+    export_booster(model, tmp_path)
+    ensemble = TreeEnsemble.load(str(tmp_path))
+
+    X = random_rows(rng, 3000, 6)  # more rows than one CHUNK_ROWS chunk
+    expected = booster_predict(model.get_booster(), X)
+    actual = ensemble.predict(X)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-3)
+
+
+def test_infinite_inputs_stay_on_their_leaf(tmp_path):
+    rng = np.random.default_rng(1)
+    model = train(rng)
+    export_booster(model, tmp_path)
+    ensemble = TreeEnsemble.load(str(tmp_path))
+
+    X = random_rows(rng, 500, 6, missing=0.0)
+    X[::2, 0] = np.inf
+    X[1::2, 1] = -np.inf
+    # XGBoost rejects inf; the largest finite float32 takes the same branches
+    finite = np.clip(X, np.finfo(np.float32).min, np.finfo(np.float32).max)
+    np.testing.assert_allclose(ensemble.predict(X), booster_predict(model.get_booster(), finite),
+                               rtol=1e-5, atol=1e-3)
+
+
+def test_arrays_are_used_as_loaded(tmp_path):
+    export_booster(train(np.random.default_rng(2)), tmp_path)
+    ensemble = TreeEnsemble.load(str(tmp_path))
+    for name in ("feature", "left", "roots", "go_right_if_missing", "threshold", "value"):
+        array = getattr(ensemble, name)
+        # A view of the memory-mapped file, not a per-process copy
+        assert isinstance(array.base, np.memmap) or isinstance(array, np.memmap), name
+
+
+def test_rejects_wrong_width_and_unknown_format(tmp_path):
+    export_booster(train(np.random.default_rng(3)), tmp_path)
+    ensemble = TreeEnsemble.load(str(tmp_path))
+    with pytest.raises(ValueError):
+        ensemble.predict(np.zeros((2, 5), dtype=np.float32))
+
+    meta_path = os.path.join(tmp_path, "trees.json")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta["format_version"] = 99
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError):
+        TreeEnsemble.load(str(tmp_path))
+
+
+@pytest.mark.parametrize("model_path", BUNDLED_MODELS)
+def test_bundled_trees_match_bundled_model(model_path):
+    model_path = os.path.join(REPO_ROOT, model_path)
+    if not os.path.exists(model_path):
+        pytest.skip(f"{model_path} is built by training; only its trees are checked in")
+    booster = joblib.load(model_path).get_booster()
+    ensemble = TreeEnsemble.load(trees_dir_for(model_path))
+
+    X = random_rows(np.random.default_rng(4), 1000, ensemble.num_features)
+    np.testing.assert_allclose(ensemble.predict(X), booster_predict(booster, X), rtol=1e-5, atol=1e-3)